@@ -0,0 +1 @@
+from .archive import *
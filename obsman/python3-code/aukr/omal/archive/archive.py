@@ -0,0 +1,160 @@
+# Embeddable API: an Archive (archdir, its database and logfile) configured
+# explicitly, without command line. Modules read their configuration from
+# aukr.omal.args.args and use aukr.omal.sqlitedb.archiveDB, both of which
+# stand in for the Archive in use; so several archives coexist in a process,
+# each call into one is made with its configuration and database:
+#   from aukr.omal.archive import Archive
+#   with Archive(archdir='/data/a', dbfile='/data/a.db', importdir='/up/a') as a:
+#       a.cleanup(); a.tmpToArch(a.getTmpObsvList('update')); a.cleanup()
+#   b = Archive({'archdir': '/data/b', 'dbfile': '/data/b.db', 'compress': 'rice'})
+#   b.importObsv('/up/b/2019-09-02')
+#   b.call(fsck.checkArchive)  # any function of aukr.omal, as b's
+# Archive in use is kept per thread (aukr.omal.args.active), so calls into
+# different archives may run at once on threads of their own; calls into the
+# same archive take turns.
+import os, logging, threading
+from contextlib import contextmanager
+from .. import log, functions as fcns
+from ..args import makeConfig, active
+from ..sqlitedb import ObservatoryDB, archiveDB
+from ..const import TABLE_OBSV, TABLE_FITS
+
+# Create module's logger
+logger = log.getLogger(__name__)
+
+
+class Archive:
+    '''Archive directory, database and logfile of a configuration; methods
+    are those of aukr.omal.functions, run with it.
+    '''
+
+    def __init__(self, config=None, **options):
+        ''':param config: dict (or argparse.Namespace) of options, named as dests
+            of command line arguments ('archdir', 'dbfile', 'importdir',
+            'logfile', 'compress', 'layout', 'workers', ...), defaults for
+            those not given
+        :param options: same, as keywords (override config)
+        :raises ValueError: if an option is unknown
+        '''
+        self.config   = makeConfig(config, **options)
+        self.name     = os.path.basename(os.path.normpath(self.config.archdir))
+        self.handlers = []
+        self._db      = None
+        self.lock     = threading.RLock() # held by calls into archive
+        if self.config.logfile:
+            self.handlers.append(log.fileHandler(self.config.logfile, self.config.logjson))
+            log.lowerLevel(logging.DEBUG)
+        self.logger   = log.getLogger(f'{__name__}.{self.name}')
+
+    @property
+    def db(self):
+        '''ObservatoryDB of archive, opened (tables created) on first use
+        '''
+        if self._db is None:
+            self._db = ObservatoryDB(self.config.dbfile, TABLE_OBSV, TABLE_FITS, anyThread=True)
+            with self.use():
+                archiveDB.current()
+        return self._db
+
+    @property
+    def archDir(self):
+        return self.config.archdir
+
+    @property
+    def tmpDir(self):
+        return f'{self.config.archdir}/tmp'
+
+    @contextmanager
+    def use(self):
+        '''Makes archive the one in use (args, archiveDB, logfile) of current
+        thread within "with" block; waits for other calls into it to return
+        first.
+        '''
+        with self.lock:
+            token = active.set(self)
+            try:
+                yield self
+            finally:
+                active.reset(token)
+
+    def call(self, function, *posArgs, **kwArgs):
+        '''Calls a function of aukr.omal with archive in use
+        :returns: whatever function returns
+        '''
+        with self.use():
+            return function(*posArgs, **kwArgs)
+
+    def close(self):
+        '''Closes database connection and logfile (reopened if used again)
+        '''
+        if self._db is not None:
+            self._db.conn.close()
+            self._db = None
+        for handler in self.handlers:
+            handler.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        self.close()
+
+    def __repr__(self):
+        return f'Archive({self.config.archdir!r}, dbfile={self.config.dbfile!r})'
+
+    # aukr.omal.functions, defaults of parameters from configuration
+    def cleanup(self):
+        '''see functions.cleanup()'''
+        return self.call(fcns.cleanup)
+
+    def getTmpObsvList(self, mode='readonly', importDir=''):
+        '''see functions.getTmpObsvList()'''
+        return self.call(fcns.getTmpObsvList, mode, importDir)
+
+    def tmpToArch(self, tmpObsvList):
+        '''see functions.tmpToArch()'''
+        return self.call(fcns.tmpToArch, tmpObsvList)
+
+    def importConcurrently(self, importDir='', jobs=None, maxPending=None):
+        '''see functions.importConcurrently()'''
+        return self.call(fcns.importConcurrently, importDir, jobs, maxPending)
+
+    def importPipelined(self, importDir='', depth=None, compress=None):
+        '''see functions.importPipelined()'''
+        return self.call(fcns.importPipelined, importDir, depth, compress)
+
+    def importObsv(self, path):
+        '''see functions.importObsv()'''
+        return self.call(fcns.importObsv, path)
+
+    def recoverImports(self, discard=False):
+        '''see functions.recoverImports()'''
+        return self.call(fcns.recoverImports, discard)
+
+    def getArchObsvList(self, mode='readonly', fromCatalog=True):
+        '''see functions.getArchObsvList()'''
+        return self.call(fcns.getArchObsvList, mode, fromCatalog)
+
+    def migrateLayout(self, layout=None):
+        '''see functions.migrateLayout()'''
+        return self.call(fcns.migrateLayout, layout)
+
+    def removeFromArch(self, obsvList):
+        '''see functions.removeFromArch()'''
+        return self.call(fcns.removeFromArch, obsvList)
+
+    def getHashListByDate(self, startDate, endDate=''):
+        '''see functions.getHashListByDate()'''
+        return self.call(fcns.getHashListByDate, startDate, endDate)
+
+    def removeObsvByRef(self, ref):
+        '''see functions.removeObsvByRef()'''
+        return self.call(fcns.removeObsvByRef, ref)
+
+    def removeObsvByHashes(self, hashList, wait=True):
+        '''see functions.removeObsvByHashes()'''
+        return self.call(fcns.removeObsvByHashes, hashList, wait)
+
+    def backfillExtra(self, workers=None):
+        '''see functions.backfillExtra()'''
+        return self.call(fcns.backfillExtra, workers)
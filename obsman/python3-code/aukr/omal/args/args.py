@@ -1,10 +1,22 @@
-import logging
-from ..const import default_archdir, default_dbfile, default_importdir, default_logfile
-from argparse import ArgumentParser
+import os, sys, logging
+from contextvars import ContextVar
+from ..const import default_archdir, default_dbfile, default_importdir, default_logfile,\
+    default_compress, default_layout, COMPRESS_TYPES, PROFILES
+from argparse import ArgumentParser, Namespace
+
+# Directory of scripts (import.py, delete.py, ...), whose command line is parsed
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
+
+# Archive in use (see aukr.omal.archive), None for command line. Context
+# variable, so each thread (or task) has its own; threads started within a
+# call run in a copy of caller's context (contextvars.copy_context()), worker
+# processes are configured by their pool initializer (see configureWorker()).
+active = ContextVar('active', default=None)
 
 # cli arguments
-def getArgs():
-    parser = ArgumentParser(description='Observation Management Tool (v1.0.0) - Ankara University Kreiken Observatory')
+def makeParser(allowAbbrev=True):
+    parser = ArgumentParser(description='Observation Management Tool (v1.0.0) - Ankara University Kreiken Observatory',
+        allow_abbrev=allowAbbrev)
 
     # Folder which holds new observations to be imported into archive
     parser.add_argument(
@@ -41,6 +53,11 @@ def getArgs():
         help='print user-readable information'
     )
 
+    parser.add_argument(
+        '--log-json', action='store_const', dest='logjson', const=True, default=False,
+        help='write logs as JSON lines (structured), both onto console and into logfile'
+    )
+
     parser.add_argument(
         '--no-copy', action='store_const', dest='nocopy', const=True, default=False,
         help='disables copying files into archdir/tmp first'
@@ -51,29 +68,334 @@ def getArgs():
         help='Reference of Observation to be removed (from filesystem and databse)'
     )
 
-    return parser.parse_args()
+    parser.add_argument(
+        '--remove-dates', action='store', dest='rmDates', nargs='+', default=[],
+        help='Remove observations of a date, or within a date range (YYYY-MM-DD [YYYY-MM-DD])'
+    )
 
-args = getArgs()
+    # For recover.py only
+    parser.add_argument(
+        '--discard', action='store_const', dest='discard', const=True, default=False,
+        help='Undo interrupted imports instead of resuming them'
+    )
 
-"""
-# Alternative way of setting args without command-line arguments.
-# good for automated usage, todo: provide a method for programs to enter a
-# a config prior to execution.
-# Lacks the observation removal functionality.
-class arguments:
-    def __init__(self, importdir=default_importdir, archdir=default_archdir, dbfile=default_dbfile, logfile=default_logfile, verboselevel=logging.DEBUG, rmRefs=''):
-        '''
-        :param importdir: Directory from which new observations shall be imported (default "./import_data")
-        :param archdir: Directory in which archived observations and new observations (until imported) are stored (default "/obsman/obsv_arch")
-        :param dbfile: Path of database file to be used for inserting/querying observations (default ".aukr_obsv.db")
-        :param verboselevel: logging.WARNING, logging.INFO, logging.DEBUG
-        :param logfile: Logfile to print out debug information
+    # For fsck.py only
+    parser.add_argument(
+        '--checksum', action='store_const', dest='checksum', const=True, default=False,
+        help='Also compare content checksums (SHA-256) with those recorded by earlier checks'
+    )
+
+    # For fsck.py and columnar.py
+    parser.add_argument(
+        '--full', action='store_const', dest='full', const=True, default=False,
+        help='Verify all files, not only those changed (size, mtime) since last check; export all nights, not only those changed since last export'
+    )
+
+    parser.add_argument(
+        '--repair', action='store_const', dest='repair', const=True, default=False,
+        help='Fix catalog where it is safe (stale paths, rows without files), report the rest'
+    )
+
+    # Storage mode of .fit files moved into archdir
+    parser.add_argument(
+        '--compress', type=str, default=default_compress, dest='compress',
+        choices=['none', *COMPRESS_TYPES],
+        help=f'Tile-compress (fpack-compatible) files moved into archive (default "{default_compress}")'
+    )
+
+    # Header profile (see aukr.omal.profile), picked by TELESCOP/INSTRUME unless given
+    parser.add_argument(
+        '--profile', type=str, default='', dest='profile', choices=['', *PROFILES],
+        help='Header profile applied to new files, regardless of their TELESCOP/INSTRUME (default: picked per file)'
+    )
+
+    # Layout of archdir (see aukr.omal.filesys), migrate.py converts
+    parser.add_argument(
+        '--layout', type=str, default=default_layout, dest='layout', choices=['flat', 'sharded'],
+        help=f'Place observations as archdir/YYYY-MM-DD_REF ("flat") or archdir/YYYY/MM/YYYY-MM-DD_REF ("sharded"); both are read either way (default "{default_layout}")'
+    )
+
+    # Size of process/thread pools, None lets concurrent.futures decide
+    parser.add_argument(
+        '-w', '--workers', type=int, default=None, dest='workers',
+        help='Number of worker processes used for parallel tasks (default: number of cpus)'
+    )
+
+    # Concurrent import (see aukr.omal.scheduler)
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=1, dest='jobs',
+        help='Number of observations imported concurrently, on worker processes (default 1, one after another)'
+    )
+
+    parser.add_argument(
+        '--max-pending', type=int, default=0, dest='maxpending',
+        help='Most observations in progress at once, rest wait to be started (default: twice --jobs)'
+    )
+
+    # Pipelined import (see aukr.omal.pipeline)
+    parser.add_argument(
+        '--pipeline', action='store_const', dest='pipeline', const=True, default=False,
+        help='Stream files of each observation through read/upgrade/write/catalog stages (originals are not modified)'
+    )
+
+    parser.add_argument(
+        '--queue-depth', type=int, default=8, dest='queuedepth',
+        help='Files held between two pipeline stages at most (default 8)'
+    )
+
+    # For watch.py only
+    parser.add_argument(
+        '--quiet-seconds', type=float, default=60.0, dest='quietseconds',
+        help='Watched observation is imported once unchanged for this long (default 60)'
+    )
+
+    parser.add_argument(
+        '--marker', type=str, default='', dest='marker',
+        help='Name of file marking a watched observation complete (e.g. "READY"), imported right away'
+    )
+
+    parser.add_argument(
+        '--poll', type=float, default=0, dest='pollinterval',
+        help='Poll import directory every POLL seconds instead of using inotify'
+    )
+
+    # Stage metrics of import (see aukr.omal.metrics)
+    parser.add_argument(
+        '--metrics-file', type=str, default='', dest='metricsfile',
+        help='File to write import metrics into (JSON if ends with ".json", Prometheus text format otherwise)'
+    )
+
+    parser.add_argument(
+        '--metrics-port', type=int, default=0, dest='metricsport',
+        help='Serve metrics on http://127.0.0.1:PORT/metrics (and /metrics.json) while running'
+    )
+
+    # For export.py only
+    parser.add_argument(
+        '--export', action='store', dest='exportRefs', nargs='+', default=[],
+        help='Reference(s) of Observation(s) to be exported'
+    )
+
+    parser.add_argument(
+        '--export-dates', action='store', dest='exportDates', nargs='+', default=[],
+        help='Export observations of a date, or within a date range (YYYY-MM-DD [YYYY-MM-DD])'
+    )
+
+    parser.add_argument(
+        '--export-format', type=str, default='zip', dest='exportformat', choices=['zip', 'tar'],
+        help='Archive format of exported observations (default "zip")'
+    )
+
+    parser.add_argument(
+        '--manifest', type=str, default='', dest='manifest', choices=['csv', 'json'],
+        help='Include a manifest of fits table rows into exported archive'
+    )
+
+    parser.add_argument(
+        '-o', '--output', type=str, default='-', dest='output',
+        help='File to write output into (default "-", stdout)'
+    )
+
+    # For columnar.py only
+    parser.add_argument(
+        '--columnar-format', type=str, default='', dest='columnarformat', choices=['', 'arrow', 'parquet', 'npy'],
+        help='Format of catalog export: "arrow" (IPC), "parquet" (both need pyarrow) or "npy" (default: "arrow" if pyarrow is installed, "npy" otherwise)'
+    )
+
+    # For cutout.py only
+    parser.add_argument(
+        '--cutout', type=str, default='', dest='cutoutRef',
+        help='Reference of file to cut out of'
+    )
+
+    parser.add_argument(
+        '--center', type=float, nargs=2, default=None, dest='center',
+        help='Center of cutout in pixels, 0-based column and row (X Y)'
+    )
+
+    parser.add_argument(
+        '--sky-center', type=float, nargs=2, default=None, dest='skycenter',
+        help='Center of cutout on sky in degrees (RA DEC), needs WCS in header'
+    )
+
+    parser.add_argument(
+        '--cutout-size', type=int, nargs='+', default=[64], dest='cutoutsize',
+        help='Width (and height) of cutout in pixels (default 64)'
+    )
+
+    parser.add_argument(
+        '--cutout-format', type=str, default='fits', dest='cutoutformat', choices=['fits', 'png'],
+        help='Format of cutout (default "fits")'
+    )
+
+    parser.add_argument(
+        '--cutout-port', type=int, default=0, dest='cutoutport',
+        help='Serve cutouts on http://127.0.0.1:PORT/cutout instead of writing one'
+    )
+
+    # For cards.py only
+    parser.add_argument(
+        '--promote', type=str, nargs='+', default=[], dest='promote',
+        help='Header keyword(s) kept in EXTRA (JSON of cards not in HDR_KEYS) to be indexed'
+    )
+
+    parser.add_argument(
+        '--as-column', action='store_const', dest='ascolumn', const=True, default=False,
+        help='Promote as generated columns (named after keywords), not by expression index only'
+    )
+
+    parser.add_argument(
+        '--demote', type=str, nargs='+', default=[], dest='demote',
+        help='Header keyword(s) whose index (and generated column) is to be dropped'
+    )
+
+    parser.add_argument(
+        '--backfill', action='store_const', dest='backfill', const=True, default=False,
+        help='Read headers of files catalogued before EXTRA existed, to fill it'
+    )
+
+    # For query.py only
+    parser.add_argument(
+        '--query', type=str, default='obsv', dest='query', choices=['obsv', 'fits'],
+        help='Table whose rows are written: observations, or their files (default "obsv")'
+    )
+
+    parser.add_argument(
+        '--query-refs', action='store', dest='queryRefs', nargs='+', default=[],
+        help='Reference(s) of Observation(s) whose rows are written (default: all)'
+    )
+
+    parser.add_argument(
+        '--query-dates', action='store', dest='queryDates', nargs='+', default=[],
+        help='Rows of observations of a date, or within a date range (YYYY-MM-DD [YYYY-MM-DD])'
+    )
+
+    parser.add_argument(
+        '--where', type=str, nargs='+', default=[], dest='where',
+        help='Conditions on cards (fits, EXTRA included) or columns (obsv) as KEY=VALUE, all must hold'
+    )
+
+    parser.add_argument(
+        '--query-port', type=int, default=0, dest='queryport',
+        help='Serve searches (cached) on http://127.0.0.1:PORT/obsv and /fits as JSON, e.g. for Node-RED flows'
+    )
+
+    parser.add_argument(
+        '--query-format', type=str, default='ndjson', dest='queryformat', choices=['ndjson', 'csv'],
+        help='Format of rows written: NDJSON (one object per line) or CSV (default "ndjson")'
+    )
+
+    # For summary.py only
+    parser.add_argument(
+        '--summary', type=str, default='night', dest='summary', choices=['night', 'target', 'month'],
+        help='Summary to print: frames per night and telescope, exposure per object and filter, or observations per month (default "night")'
+    )
+
+    parser.add_argument(
+        '--rebuild', action='store_const', dest='rebuild', const=True, default=False,
+        help='Recompute summaries from catalog first'
+    )
+
+    # For benchmark.py only
+    parser.add_argument(
+        '--bench', type=str, dest='bench', nargs='+', default=[],
+        help='Benchmark(s) to be run by benchmark.py: "compress", "ingest", "logging", "codec"'
+    )
+
+    # For benchmark.py and synth.py, synthetic observations
+    parser.add_argument(
+        '--synth-nights', type=int, default=1, dest='synthnights',
+        help='Number of synthetic observations (one per night) to be created (default 1)'
+    )
+
+    parser.add_argument(
+        '--synth-files', type=int, default=16, dest='synthfiles',
+        help='Number of .fit files per synthetic observation (default 16)'
+    )
+
+    parser.add_argument(
+        '--synth-size', type=int, default=1024, dest='synthsize',
+        help='Width and height of synthetic images in pixels (default 1024)'
+    )
+
+    parser.add_argument(
+        '--bench-output', type=str, default='', dest='benchoutput',
+        help='File to write benchmark results (JSON) into, printed onto stdout otherwise'
+    )
+
+    return parser
+
+parser = makeParser()
+
+def getArgs(argv=None):
+    ''':param argv: list of arguments (None for sys.argv)
+    :returns: argparse.Namespace
+    '''
+    return parser.parse_args(argv)
+
+def makeConfig(config=None, **options):
+    '''Arguments as command line would give them, without parsing it (for
+    aukr.omal.archive.Archive)
+    :param config: dict (or argparse.Namespace) of dest -> value, e.g.
+        {'archdir': '/data/arch', 'dbfile': '/data/arch.db'}
+    :param options: same, as keywords (override config)
+    :returns: argparse.Namespace, defaults for those not given
+    :raises ValueError: if a name is not dest of any argument
+    '''
+    namespace = parser.parse_args([])
+    values = dict(vars(config) if isinstance(config, Namespace) else (config or {}), **options)
+    unknown = sorted(set(values) - set(vars(namespace)))
+    if unknown:
+        raise ValueError(f'Unknown option(s): {unknown}')
+    vars(namespace).update(values)
+    return namespace
+
+def commandLine():
+    '''Arguments of command line: parsed strictly for scripts of SCRIPT_DIR
+    (symlinks to them included); for other script files (e.g. a copy of
+    import.py, or a program of user) options of aukr.omal are taken, the rest
+    is left to program and warned about; interactive or embedded interpreters
+    (no script file) get defaults.
+    :returns: argparse.Namespace
+    '''
+    main = getattr(sys.modules.get('__main__'), '__file__', None)
+    if not main:
+        return makeConfig()
+    if os.path.dirname(os.path.realpath(main)) == SCRIPT_DIR:
+        return getArgs()
+    (namespace, unknown) = makeParser(allowAbbrev=False).parse_known_args()
+    if unknown:
+        logging.getLogger(__name__).warning(f'Arguments ignored (not options of aukr.omal): {unknown}')
+    return namespace
+
+
+class ActiveArgs:
+    '''Stands in for parsed arguments: attributes are those of configuration
+    of Archive in use (see active), of command line otherwise.
+    '''
+    def __init__(self, commandLine):
+        object.__setattr__(self, 'commandLine', commandLine)
+
+    def current(self):
+        ''':returns: argparse.Namespace in effect
         '''
-        self.importdir   = importdir
-        self.archdir      = archdir
-        self.dbfile       = dbfile
-        self.verboselevel = verboselevel
-        self.logfile      = logfile
-        self.rmRefs        = rmRefs
-args = arguments()
-"""
+        archive = active.get()
+        return archive.config if archive is not None else self.commandLine
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.current(), name, value)
+
+args = ActiveArgs(commandLine())
+
+def configureWorker(config):
+    '''For worker processes (pool initializer, see
+    aukr.omal.log.configureWorker()): config of parent is the one of process,
+    whether forked or spawned; no Archive is in use there.
+    :param config: argparse.Namespace, args.current() of parent
+    '''
+    active.set(None)
+    object.__setattr__(args, 'commandLine', config)
+
@@ -0,0 +1 @@
+from .bench import *
\ No newline at end of file
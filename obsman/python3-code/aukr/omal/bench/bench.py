@@ -0,0 +1,241 @@
+# Benchmarks for measuring archive operations (see benchmark.py).
+# Every benchmark returns a JSON-serializable list of dictionaries, so results
+# of different runs can be compared.
+import os, time, tempfile, queue, logging
+import numpy as np
+from .. import log, calc
+from ..log import getLogger
+from ..const import COMPRESS_TYPES, COMPRESSED_EXT
+from ..fitsfile import FitsFile, compressFits, imageHDU
+
+# Create module's logger
+logger = getLogger(__name__)
+
+
+def benchCompress(pathList, compressList=['none', *COMPRESS_TYPES]):
+    '''Compresses given .fit files with each codec, then reads them back.
+    :param pathList: paths of (uncompressed) .fit files
+    :param compressList: 'none' and/or keys of aukr.omal.const.COMPRESS_TYPES
+    :returns: list of dicts, one per codec (compression ratio, latencies in seconds)
+    '''
+    results = []
+    rawBytes = sum(os.path.getsize(path) for path in pathList)
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for compress in compressList:
+            # Compress (single process, so latencies are per file)
+            start = time.perf_counter()
+            if compress == 'none':
+                outList = pathList
+            else:
+                outList = [compressFits(path, f'{tmpDir}/{j}_{os.path.basename(path)}.{compress}{COMPRESSED_EXT}', compress)
+                    for (j, path) in enumerate(pathList)]
+            compressTime = time.perf_counter() - start
+            storedBytes = sum(os.path.getsize(path) for path in outList)
+
+            # Header read, as done while parsing Obsv
+            start = time.perf_counter()
+            for path in outList:
+                FitsFile(path)
+            headerTime = time.perf_counter() - start
+
+            # Full pixel read
+            start = time.perf_counter()
+            for path in outList:
+                fitsFile = FitsFile(path)
+                imageHDU(fitsFile.open()).data.sum()
+                fitsFile.close()
+            dataTime = time.perf_counter() - start
+
+            logger.info(f'{compress:>10}: ratio {rawBytes / storedBytes:.3f}')
+            results.append({
+                'bench':           'compress',
+                'compress':        compress,
+                'files':           len(pathList),
+                'rawBytes':        rawBytes,
+                'storedBytes':     storedBytes,
+                'ratio':           rawBytes / storedBytes,
+                'compressPerFile': compressTime / len(pathList),
+                'headerPerFile':   headerTime / len(pathList),
+                'dataPerFile':     dataTime / len(pathList)
+            })
+    return results
+
+
+class timeCalls:
+    '''Context manager wrapping an attribute (function or method) so that
+    durations of its calls are collected, original is restored on exit.
+    e.g.  with timeCalls(FitsFile, 'update') as durations: ...
+    '''
+
+    def __init__(self, owner, name):
+        ''':param owner: class or module the attribute belongs to
+        :param name: name of the attribute to be timed
+        '''
+        self.owner     = owner
+        self.name      = name
+        self.original  = getattr(owner, name)
+        self.durations = []
+
+    def __enter__(self):
+        original  = self.original
+        durations = self.durations
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                durations.append(time.perf_counter() - start)
+        setattr(self.owner, self.name, timed)
+        return self.durations
+
+    def __exit__(self, *exc):
+        setattr(self.owner, self.name, self.original)
+        return False
+
+
+def summarize(durations):
+    '''Summary of durations (in seconds) for results
+    :param durations: list of durations
+    :returns: dict (calls, total, mean, p50, p95, max)
+    '''
+    if not durations:
+        return {'calls': 0, 'total': 0.0}
+    ordered = sorted(durations)
+    return {
+        'calls': len(ordered),
+        'total': sum(ordered),
+        'mean':  sum(ordered) / len(ordered),
+        'p50':   ordered[int(0.50 * (len(ordered) - 1))],
+        'p95':   ordered[int(0.95 * (len(ordered) - 1))],
+        'max':   ordered[-1]
+    }
+
+
+def benchIngest(importDir):
+    '''Imports observations in importDir (as import.py does) timing each stage
+    separately: getTmpObsvList, Obsv.insert, FitsFile.update, upgradeScript,
+    DB inserts and moveToArchive. Nested stages are included in their
+    parents' durations (e.g. upgradeScript in FitsFile.update).
+    Use an empty archive (-a) and database (-d), observations are archived.
+    :param importDir: directory of new observations (e.g. made by aukr.omal.synth)
+    :returns: list with a single dict of results
+    '''
+    # Imported here, benchCompress() is usable without touching the archive
+    from .. import functions, filesys
+    from ..obsv import Obsv
+    from ..sqlitedb import ObservatoryDB, archiveDB
+
+    if archiveDB.queryHashRange('HASH', 0, 2**62):
+        logger.warning('Database is not empty, use a fresh one (-d) for benchmarking')
+        return []
+
+    functions.cleanup()
+    stages = {}
+    start = time.perf_counter()
+    with timeCalls(functions, 'getTmpObsvList') as stages['getTmpObsvList']:
+        tmpObsvList = functions.getTmpObsvList('update', importDir)
+    fitsCount = sum(len(obsv.getFitsList()) for obsv in tmpObsvList)
+    fitsBytes = sum(os.path.getsize(fitsFile.path) for obsv in tmpObsvList for fitsFile in obsv.getFitsList())
+    with timeCalls(Obsv, 'insert') as stages['Obsv.insert'],\
+        timeCalls(FitsFile, 'update') as stages['FitsFile.update'],\
+        timeCalls(FitsFile, 'upgradeScript') as stages['upgradeScript'],\
+        timeCalls(ObservatoryDB, 'insertObsv') as stages['insertObsv'],\
+        timeCalls(ObservatoryDB, 'insertFits') as stages['insertFits'],\
+        timeCalls(filesys, 'moveToArchive') as stages['moveToArchive']:
+        functions.tmpToArch(tmpObsvList)
+    total = time.perf_counter() - start
+    functions.cleanup()
+
+    return [{
+        'bench':     'ingest',
+        'obsv':      len(tmpObsvList),
+        'files':     fitsCount,
+        'bytes':     fitsBytes,
+        'total':     total,
+        'perFile':   total / fitsCount if fitsCount else None,
+        'stages':    {name: summarize(durations) for (name, durations) in stages.items()}
+    }]
+
+
+def benchLogging(calls=200000):
+    '''Per-call cost of logging in hot loops, when DEBUG is off (default
+    console level) and when on (record is only queued, written by listener).
+    :param calls: number of calls per case
+    :returns: list of dicts, one per case (seconds per call above empty loop)
+    '''
+    # Logger of its own, writing into a queue nobody reads (no console noise)
+    benchLogger = logging.getLogger(f'{__name__}.logging')
+    benchLogger.propagate = False
+    benchLogger.addHandler(log.LazyQueueHandler(queue.SimpleQueue()))
+    (date, name) = ('2019-09-01', 'image_00001.fit')
+
+    cases = [
+        ('empty',       lambda: None),
+        ('lazy',        lambda: benchLogger.debug('Created FitsFile: %s | %s', date, name)),
+        ('fstring',     lambda: benchLogger.debug(f'Created FitsFile: {date} | {name}')),
+        ('heading3',    lambda: log.heading3(name, benchLogger))
+    ]
+    results = []
+    for level in [logging.WARNING, logging.DEBUG]:
+        benchLogger.setLevel(level)
+        baseline = None
+        for (case, call) in cases:
+            start = time.perf_counter()
+            for j in range(calls):
+                call()
+            perCall = (time.perf_counter() - start) / calls
+            if baseline is None:
+                baseline = perCall
+                continue
+            results.append({
+                'bench':   'logging',
+                'level':   logging.getLevelName(level),
+                'case':    case,
+                'calls':   calls,
+                'perCall': perCall - baseline
+            })
+    return results
+
+
+def benchCodec(count=1000000, seed=0):
+    '''Scalar (per value) against batch (numpy) ref/hash/date conversions of
+    aukr.omal.calc, on random refs of real dates.
+    :param count: number of refs
+    :param seed: seed of random refs, same refs for every run
+    :returns: list of dicts, one per conversion (seconds, speedup)
+    '''
+    rng = np.random.default_rng(seed)
+    days = np.flatnonzero(calc.validityTable())
+    hashArray = rng.choice(days, count) * calc.MAX_ITEM_PER_DAY + rng.integers(0, calc.MAX_ITEM_PER_DAY, count)
+    hashList = hashArray.tolist()
+    refList = [calc.ref(hash) for hash in hashList]
+    dateList = [calc.dateAndItem(hash)[0] for hash in hashList]
+    refArray = np.array(refList)
+    dateArray = np.array(dateList)
+
+    cases = [
+        ('ref',              lambda: [calc.ref(hash) for hash in hashList],                lambda: calc.refs(hashArray)),
+        ('hash',             lambda: [calc.hash(ref) for ref in refList],                  lambda: calc.hashes(refArray)),
+        ('dateAndItem',      lambda: [calc.dateAndItem(hash) for hash in hashList],        lambda: calc.datesAndItems(hashArray)),
+        ('validDateAndItem', lambda: [calc.validDateAndItem(ref) for ref in refList],      lambda: calc.validDatesAndItems(refArray)),
+        ('isDate',           lambda: [calc.isDate(date) for date in dateList],             lambda: calc.areDates(dateArray)),
+        ('itemZeroHash',     lambda: [calc.itemZeroHash(date) for date in dateList],       lambda: calc.itemZeroHashes(dateArray))
+    ]
+    results = []
+    for (case, scalar, batch) in cases:
+        start = time.perf_counter()
+        scalar()
+        scalarTime = time.perf_counter() - start
+        start = time.perf_counter()
+        batch()
+        batchTime = time.perf_counter() - start
+        logger.info(f'{case:>16}: {scalarTime / batchTime:.1f}x')
+        results.append({
+            'bench':   'codec',
+            'case':    case,
+            'count':   count,
+            'scalar':  scalarTime,
+            'batch':   batchTime,
+            'speedup': scalarTime / batchTime
+        })
+    return results
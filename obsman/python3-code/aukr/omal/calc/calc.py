@@ -1,4 +1,5 @@
-import datetime, os
+import datetime, os, functools
+import numpy as np
 from ..const import REF_LENGTH, YEAR_2K, MAX_ITEM_PER_DAY, MAX_ITEM_PER_OBSV
 from ..log import getLogger
 
@@ -51,11 +52,11 @@ def ref(hash):
 def hash(ref):
     '''Handle spaces and length beforehand.
     :param ref: ref of Fits/Obsv object
-    :returns: integer, corresponding hash number (always calculated)
+    :returns: integer, corresponding hash number (None if ref is not hex)
     '''
     try:
         return int(ref, 16) # throws ValueError if not hex (e.g. 'ASDFGH')
-    except [ValueError, TypeError]:
+    except (ValueError, TypeError):
         logger.warning(f'ref({ref}) is not a valid hex (without 0x)')
 
 def itemZeroHash(date):
@@ -109,10 +110,10 @@ def validDateAndItem(ref):
         raise ValueError(f'Illegal REF (ref length not {REF_LENGTH})')
 
     try:
-        hashFromRef = hash(ref)
-    except ValueError as e:
+        hashFromRef = int(ref, 16) # not hash(), which logs a warning instead
+    except ValueError:
         logger.debug('Illegal REF (ref not hexadecimal)')
-        raise ValueError('Illegal REF (ref not hexadecimal)').with_traceback(e.__traceback__)
+        raise ValueError('Illegal REF (ref not hexadecimal)')
 
     (dateOfRef, itemNum) = dateAndItem(hashFromRef)
 
@@ -122,3 +123,156 @@ def validDateAndItem(ref):
     else:
         logger.debug(f'Illegal REF (does not point a real date): {dateOfRef}')
         raise ValueError('Illegal REF (does not point a real date)')
+
+
+# Batch versions of above, for whole arrays (numpy) of hashes/refs/dates in
+# one call; results equal those of scalar functions, element by element.
+# Days are counted as above (372-day years), a table tells which are real.
+
+HEX_DIGITS = np.frombuffer('0123456789ABCDEF'.encode('utf-32-le'), dtype=np.uint32)
+# Value of each character code as hex digit, -1 if not a digit (either case)
+HEX_VALUES = np.full(128, -1, dtype=np.int64)
+for (value, digit) in enumerate('0123456789ABCDEF'):
+    HEX_VALUES[ord(digit)] = value
+    HEX_VALUES[ord(digit.lower())] = value
+# Number of days a ref can refer to (REF_LENGTH hex digits)
+MAX_DAYS = (16**REF_LENGTH - 1) // MAX_ITEM_PER_DAY + 1
+
+@functools.lru_cache(maxsize=None)
+def validityTable():
+    '''Computed once, then memoized.
+    :returns: numpy bool array, True for each day (days since YEAR_2K, 372-day
+        years as in itemZeroHash) which is a real date (unlike 2005-02-29)
+    '''
+    table = np.zeros(MAX_DAYS, dtype=bool)
+    for day in range(MAX_DAYS):
+        try:
+            datetime.date(YEAR_2K + day // 372, (day % 372) // 31 + 1, (day % 31) + 1)
+            table[day] = True
+        except ValueError:
+            pass
+    return table
+
+def charCodes(strings, width):
+    ''':param strings: sequence (or numpy array) of str, or bytes
+    :param width: number of characters expected in each
+    :returns: tuple (int64 array shaped (len, width) of character codes, bool
+        array True where length is width); None if none can be that long
+    '''
+    strings = np.asarray(strings)
+    if not len(strings):
+        return (np.zeros((0, width), dtype=np.int64), np.zeros(0, dtype=bool))
+    if strings.dtype.kind == 'U':
+        codes = strings.view(np.uint32)     # UCS4, zero padded
+    elif strings.dtype.kind == 'S':
+        codes = strings.view(np.uint8)      # zero padded
+    else:
+        return None
+    if strings.dtype.itemsize // codes.itemsize < width:
+        return None
+    codes = codes.reshape(len(strings), -1)
+    isWide = (codes[:, width - 1] != 0) & ((codes[:, width:] == 0).all(axis=1))
+    return (codes[:, :width].astype(np.int64), isWide)
+
+def refs(hashes):
+    '''Batch version of ref()
+    :param hashes: sequence (or numpy array) of integer hashes, within REF_LENGTH hex digits
+    :returns: numpy array of refs (str)
+    '''
+    hashes = np.asarray(hashes, dtype=np.int64)
+    shifts = np.arange(4*(REF_LENGTH - 1), -1, -4, dtype=np.int64)
+    digits = HEX_DIGITS[(hashes[:, None] >> shifts) & 0xF]
+    return digits.view(f'U{REF_LENGTH}').ravel()
+
+def hashes(refs):
+    '''Batch version of hash(), validates length and digits as validDateAndItem()
+    :param refs: sequence (or numpy array) of refs (str)
+    :returns: numpy int64 array of hashes
+    :raises ValueError: if any ref is not REF_LENGTH hex digits
+    '''
+    refs = np.asarray(refs)
+    codes = charCodes(refs, REF_LENGTH)
+    if codes is None:
+        raise ValueError(f'Illegal REF (ref length not {REF_LENGTH})')
+    (codes, isWide) = codes
+    if not isWide.all():
+        raise ValueError(f'Illegal REF (ref length not {REF_LENGTH}): {refs[~isWide][0]}')
+    values = HEX_VALUES[np.minimum(codes, len(HEX_VALUES) - 1)]
+    values[codes >= len(HEX_VALUES)] = -1
+    isHex = (values >= 0).all(axis=1)
+    if not isHex.all():
+        raise ValueError(f'Illegal REF (ref not hexadecimal): {refs[~isHex][0]}')
+    return values @ (16 ** np.arange(REF_LENGTH - 1, -1, -1, dtype=np.int64))
+
+def datesAndItems(hashes):
+    '''Batch version of dateAndItem()
+    :param hashes: sequence (or numpy array) of integer hashes
+    :returns: tuple (numpy array of 'YYYY-MM-DD', numpy int64 array of items)
+    '''
+    hashes = np.asarray(hashes, dtype=np.int64)
+    items = hashes % MAX_ITEM_PER_OBSV # 0 means Obsv, else FitsFile
+    days = hashes // MAX_ITEM_PER_DAY
+    (yy, mm, dd) = (days // 372, (days % 372) // 31 + 1, (days % 31) + 1)
+    # Character codes of '20YY-MM-DD'
+    chars = np.empty((len(hashes), 10), dtype=np.uint32)
+    chars[:, 0] = ord('2')
+    chars[:, 1] = ord('0')
+    chars[:, 4] = chars[:, 7] = ord('-')
+    for (column, number) in [(2, yy), (5, mm), (8, dd)]:
+        chars[:, column]     = ord('0') + number // 10
+        chars[:, column + 1] = ord('0') + number % 10
+    return (chars.view('U10').ravel(), items)
+
+def validDatesAndItems(refs):
+    '''Batch version of validDateAndItem()
+    :param refs: sequence (or numpy array) of refs (str)
+    :returns: tuple (numpy array of 'YYYY-MM-DD', numpy int64 array of items)
+    :raises ValueError: if any ref is invalid
+    '''
+    hashArray = hashes(refs)
+    isReal = validityTable()[hashArray // MAX_ITEM_PER_DAY]
+    if not isReal.all():
+        raise ValueError(f'Illegal REF (does not point a real date): {ref(int(hashArray[~isReal][0]))}')
+    return datesAndItems(hashArray)
+
+def daysOf(dates):
+    ''':param dates: sequence (or numpy array) of 'YYYY-MM-DD'
+    :returns: tuple (int64 array of days since YEAR_2K as in itemZeroHash(),
+        bool array True where date is real and within MAX_DAYS)
+    '''
+    dates = np.asarray(dates)
+    codes = charCodes(dates, 10)
+    if codes is None:
+        return (np.zeros(len(dates), dtype=np.int64), np.zeros(len(dates), dtype=bool))
+    (codes, isWide) = codes
+    digits = codes[:, [0, 1, 2, 3, 5, 6, 8, 9]] - ord('0')
+    isFormatted = (isWide & ((digits >= 0) & (digits <= 9)).all(axis=1)
+        & (codes[:, 4] == ord('-')) & (codes[:, 7] == ord('-')))
+    year  = digits[:, 0]*1000 + digits[:, 1]*100 + digits[:, 2]*10 + digits[:, 3]
+    month = digits[:, 4]*10 + digits[:, 5]
+    day   = digits[:, 6]*10 + digits[:, 7]
+    days = (year - YEAR_2K)*372 + (month - 1)*31 + (day - 1)
+    isInTable = (isFormatted & (1 <= month) & (month <= 12) & (1 <= day) & (day <= 31)
+        & (0 <= days) & (days < MAX_DAYS))
+    isReal = np.zeros(len(dates), dtype=bool)
+    isReal[isInTable] = validityTable()[days[isInTable]]
+    return (days, isReal)
+
+def areDates(dates):
+    '''Batch version of isDate() for 'YYYY-MM-DD' within range of refs
+    (YEAR_2K on, see MAX_DAYS)
+    :param dates: sequence (or numpy array) of str
+    :returns: numpy bool array
+    '''
+    return daysOf(dates)[1]
+
+def itemZeroHashes(dates):
+    '''Batch version of itemZeroHash()
+    :param dates: sequence (or numpy array) of 'YYYY-MM-DD'
+    :returns: numpy int64 array of hashes
+    :raises ValueError: if any date is not real (see areDates())
+    '''
+    (days, isReal) = daysOf(dates)
+    if not isReal.all():
+        raise ValueError(f'date({np.asarray(dates)[~isReal][0]}) has to be valid (YYYY-MM-DD)')
+    return days * MAX_ITEM_PER_DAY
@@ -0,0 +1 @@
+from .columnar import *
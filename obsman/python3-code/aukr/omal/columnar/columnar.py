@@ -0,0 +1,233 @@
+# Columnar export of catalog (obsv and fits tables) for analytics. Columns
+# are typed after table declarations (INTEGER, REAL, TEXT; "NULL" text of
+# catalog becomes null), and tables are partitioned by night:
+#   outDir/obsv/date=YYYY-MM-DD/part.EXT
+#   outDir/fits/date=YYYY-MM-DD/part.EXT
+# EXT is 'arrow' (Arrow IPC file) or 'parquet' with pyarrow installed, 'npy'
+# (NumPy structured array) otherwise. Arrow and npy partitions can be read
+# memory-mapped (see readPartition). Export is incremental, outDir/manifest.json
+# keeps a signature of each night exported (digest of its rows); only nights
+# changed since (new imports, removals, rows updated in place) are written
+# again, all of them if columns changed.
+import os, json, shutil, hashlib
+import numpy as np
+from .. import calc
+from ..log import getLogger
+from ..sqlitedb import archiveDB
+from ..const import TABLE_OBSV, TABLE_FITS, SQL_CHUNK
+
+# pyarrow is optional, NumPy is the fallback
+try:
+    import pyarrow, pyarrow.ipc, pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Create module's logger
+logger = getLogger(__name__)
+
+COLUMNAR_FORMATS = ['arrow', 'parquet', 'npy']
+MANIFEST = 'manifest.json'
+
+
+def defaultFormat():
+    ''':returns: 'arrow' if pyarrow is installed, 'npy' otherwise
+    '''
+    return 'arrow' if pyarrow else 'npy'
+
+
+def schemaOf(table):
+    ''':param table: name of table
+    :returns: list of (column, declared type, is not null), as "SELECT *" returns
+        them (generated columns of promoted cards included)
+    '''
+    # INTEGER PRIMARY KEY is never null, though not declared so
+    return [(name, declType.upper(), bool(notNull or pk)) for (cid, name, declType, notNull, default, pk, hidden)
+        in archiveDB.conn.execute(f'PRAGMA table_xinfo({table});') if hidden != 1]
+
+
+def typed(value, declType):
+    '''Casts a catalog value to its declared type ("NULL" text, or values not
+    fitting the type, become None)
+    '''
+    if (value is None) or (value == 'NULL'):
+        return None
+    try:
+        if declType == 'INTEGER':
+            return int(value)
+        if declType == 'REAL':
+            return float(value)
+    except (TypeError, ValueError):
+        return None
+    return str(value)
+
+
+def nightSignatures():
+    '''Reads both tables once, in order of primary key (no sort); rows are
+    digested as exported, so rows changed in place (PATH after relocation,
+    EXTRA after backfill) change the signature too
+    :returns: dict of night 'YYYY-MM-DD' -> signature (list of [Obsv hash,
+        number of fits rows, digest of its obsv and fits rows]); changes
+        whenever rows of that night do
+    '''
+    digests = {}    # Obsv hash -> [hashlib object, number of fits rows]
+    for row in archiveDB.conn.execute(f'SELECT * FROM {TABLE_OBSV} ORDER BY "HASH";'):
+        digests[row[0]] = [hashlib.sha1(repr(row).encode('utf-8')), 0]
+    keyIndex = [name for (name, declType, notNull) in schemaOf(TABLE_FITS)].index('OBSV-HASH')
+    # hashes of files follow hash of their Obsv, so rows of an Obsv come in a run
+    for row in archiveDB.conn.execute(f'SELECT * FROM {TABLE_FITS} ORDER BY "HASH";'):
+        entry = digests.setdefault(row[keyIndex], [hashlib.sha1(), 0])
+        entry[0].update(repr(row).encode('utf-8'))
+        entry[1] += 1
+    signatures = {}
+    for obsvHash in sorted(digests):
+        (digest, frames) = digests[obsvHash]
+        signatures.setdefault(calc.dateAndItem(obsvHash)[0], []).append([obsvHash, frames, digest.hexdigest()])
+    return signatures
+
+
+def schemaSignature():
+    ''':returns: list of column names of obsv and fits tables (promoted cards
+        add columns to every night)
+    '''
+    return [[name for (name, declType, notNull) in schemaOf(table)] for table in [TABLE_OBSV, TABLE_FITS]]
+
+
+def readColumns(table, keyColumn, hashList):
+    '''Rows of given Obsv hashes, typed, as columns
+    :param table: TABLE_OBSV or TABLE_FITS
+    :param keyColumn: column holding Obsv hash ('HASH' or 'OBSV-HASH')
+    :param hashList: hashes of Obsvs
+    :returns: tuple (schema, dict of column -> list of values)
+    '''
+    schema = schemaOf(table)
+    columns = {name: [] for (name, declType, notNull) in schema}
+    for i in range(0, len(hashList), SQL_CHUNK):
+        chunk = hashList[i:i+SQL_CHUNK]
+        for row in archiveDB.conn.execute(
+            f'SELECT * FROM {table} WHERE "{keyColumn}" IN ({",".join("?"*len(chunk))}) ORDER BY "HASH";', chunk
+        ):
+            for ((name, declType, notNull), value) in zip(schema, row):
+                columns[name].append(typed(value, declType))
+    return (schema, columns)
+
+
+def writeArrow(path, schema, columns, columnarFormat):
+    '''Writes columns as an Arrow IPC file or Parquet file (needs pyarrow)
+    '''
+    arrowTypes = {'INTEGER': pyarrow.int64(), 'REAL': pyarrow.float64(), 'TEXT': pyarrow.string()}
+    arrowSchema = pyarrow.schema([pyarrow.field(name, arrowTypes.get(declType, pyarrow.string()), not notNull)
+        for (name, declType, notNull) in schema])
+    table = pyarrow.table({name: columns[name] for (name, declType, notNull) in schema}, schema=arrowSchema)
+    if columnarFormat == 'parquet':
+        pyarrow.parquet.write_table(table, path)
+    else:
+        with pyarrow.OSFile(path, 'wb') as sink, pyarrow.ipc.new_file(sink, arrowSchema) as writer:
+            writer.write_table(table)
+
+
+def writeNpy(path, schema, columns):
+    '''Writes columns as a NumPy structured array. NumPy has no integer null,
+    nullable INTEGER columns are float64 (NaN for null); TEXT columns are
+    fixed width ('' for null).
+    '''
+    dtype = []
+    values = {}
+    for (name, declType, notNull) in schema:
+        column = columns[name]
+        if (declType == 'INTEGER') and notNull:
+            dtype.append((name, '<i8'))
+            values[name] = column
+        elif declType in ['INTEGER', 'REAL']:
+            dtype.append((name, '<f8'))
+            values[name] = [np.nan if value is None else value for value in column]
+        else:
+            column = ['' if value is None else value for value in column]
+            dtype.append((name, f'<U{max([1] + [len(value) for value in column])}'))
+            values[name] = column
+    array = np.empty(len(columns[schema[0][0]]), dtype=dtype)
+    for (name, declType, notNull) in schema:
+        array[name] = values[name]
+    with open(path, 'wb') as npyFile:
+        np.save(npyFile, array)
+
+
+def partitionPath(outDir, table, night, columnarFormat):
+    return f'{outDir}/{table}/date={night}/part.{columnarFormat}'
+
+
+def writePartition(outDir, night, hashList, columnarFormat):
+    '''Writes obsv and fits partitions of a night (each replaced atomically)
+    :param hashList: hashes of Obsvs of that night
+    '''
+    for (table, keyColumn) in [(TABLE_OBSV, 'HASH'), (TABLE_FITS, 'OBSV-HASH')]:
+        (schema, columns) = readColumns(table, keyColumn, hashList)
+        path = partitionPath(outDir, table, night, columnarFormat)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if columnarFormat == 'npy':
+            writeNpy(f'{path}.tmp', schema, columns)
+        else:
+            writeArrow(f'{path}.tmp', schema, columns, columnarFormat)
+        os.replace(f'{path}.tmp', path)
+
+
+def exportColumnar(outDir, columnarFormat='', full=False):
+    '''Exports catalog into outDir, partitioned by night; only nights changed
+    since last export are written (all if full, or format or columns changed).
+    :param outDir: directory of export (created if missing)
+    :param columnarFormat: one of COLUMNAR_FORMATS, '' for defaultFormat()
+    :param full: True to write all nights again
+    :returns: dict {'format', 'written': nights, 'removed': nights, 'unchanged': count}
+    '''
+    columnarFormat = columnarFormat or defaultFormat()
+    if columnarFormat not in COLUMNAR_FORMATS:
+        logger.debug(f'Use one of {COLUMNAR_FORMATS}, columnarFormat: {columnarFormat}')
+        raise ValueError(f'Use one of {COLUMNAR_FORMATS}')
+    if (columnarFormat != 'npy') and (pyarrow is None):
+        logger.debug(f'pyarrow is not installed, columnarFormat: {columnarFormat}')
+        raise ValueError(f'pyarrow is required for "{columnarFormat}", use "npy"')
+
+    os.makedirs(outDir, exist_ok=True)
+    manifestPath = f'{outDir}/{MANIFEST}'
+    manifest = {'format': columnarFormat, 'columns': schemaSignature(), 'nights': {}}
+    if os.path.isfile(manifestPath) and not full:
+        with open(manifestPath) as manifestFile:
+            previous = json.load(manifestFile)
+        if (previous.get('format') == columnarFormat) and (previous.get('columns') == manifest['columns']):
+            manifest['nights'] = previous['nights']
+
+    signatures = nightSignatures()
+    report = {'format': columnarFormat, 'written': [], 'removed': [], 'unchanged': 0}
+    for (night, signature) in sorted(signatures.items()):
+        if manifest['nights'].get(night) == signature:
+            report['unchanged'] += 1
+            continue
+        writePartition(outDir, night, [obsvHash for (obsvHash, frames, digest) in signature], columnarFormat)
+        manifest['nights'][night] = signature
+        report['written'].append(night)
+        logger.info(f'Exported: {night}')
+    for night in sorted(set(manifest['nights']) - set(signatures)):
+        for table in [TABLE_OBSV, TABLE_FITS]:
+            shutil.rmtree(os.path.dirname(partitionPath(outDir, table, night, columnarFormat)), ignore_errors=True)
+        del manifest['nights'][night]
+        report['removed'].append(night)
+        logger.info(f'Removed from export: {night}')
+
+    # Manifest last, an interrupted export is redone for nights not recorded
+    with open(f'{manifestPath}.tmp', 'w') as manifestFile:
+        json.dump(manifest, manifestFile)
+    os.replace(f'{manifestPath}.tmp', manifestPath)
+    return report
+
+
+def readPartition(path):
+    '''Reads a partition memory-mapped (Parquet is read into memory)
+    :param path: path of a partition ('part.arrow', 'part.parquet' or 'part.npy')
+    :returns: pyarrow.Table, or numpy structured array (memory-mapped)
+    '''
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    if pyarrow is None:
+        raise ValueError('pyarrow is required for Arrow/Parquet partitions')
+    if path.endswith('.parquet'):
+        return pyarrow.parquet.read_table(path, memory_map=True)
+    return pyarrow.ipc.open_file(pyarrow.memory_map(path, 'r')).read_all()
@@ -43,17 +43,90 @@ MAX_OBJCT_ITEM      = 10240 # items reserved for OBJCT_DIR
 MAX_OTHER_ITEM      = 3071 # items reserved for OTHER_DIR
 
 
+### aukr.omal.profile
+# Header profiles per observatory/instrument, compiled into normalizers (see
+# aukr.omal.profile). A profile applies to files whose cards in 'match' have
+# one of values listed (first match wins); DEFAULT_PROFILE to all others.
+#   'match':       card -> list of values, e.g. {'TELESCOP': ['T100']}
+#   'required':    cards a file must have (after aliases and converters)
+#   'aliases':     card written by instrument -> card expected, e.g. {'EXPOSURE': 'EXPTIME'}
+#   'converters':  card -> converter rewriting its value (e.g. 'isot', 'ms-to-s')
+#   'coordinates': role -> (card, format), inputs of upgrade ('hms', 'dms', 'deg')
+#   'site':        role -> constant ('alt' in meters; 'lat', 'long' in degrees
+#                    stand in for cards missing)
+#   'cards':       constant cards added by upgrade, (keyword, value, comment)
+PROFILES = {
+    'AUKR': {
+        'match':       {},
+        'required':    ['OBJECT', 'TELESCOP', 'DATE-OBS'],
+        'aliases':     {},
+        'converters':  {},
+        'coordinates': {'ra': ('OBJCTRA', 'hms'), 'dec': ('OBJCTDEC', 'dms'),
+                        'lat': ('SITELAT', 'dms'), 'long': ('SITELONG', 'dms')},
+        'site':        {'alt': OBS_ALT},
+        'cards': [
+            ('PI',      None,   'Principle Investigator'),
+            ('PRJTNUM', None,   'Project Number'),
+            ('GAIN',    1.5,    'e-/count'),
+            ('PSCALE',  0.754,  '\'\'/pixel'),
+            ('EPOCH',   2000.0, None),
+            ('RDNOISE', 11.5,   'e-')
+        ]
+    }
+}
+DEFAULT_PROFILE = 'AUKR'
+
+
+### aukr.omal.[filesys, fitsfile]
+# Tile-compression of archived .fit files (fpack-compatible). Compressed files
+# keep their name with COMPRESSED_EXT appended (e.g. 'image.fit.fz').
+# Floating point images are always stored with GZIP_2 (lossless).
+COMPRESS_TYPES = {
+    'rice':      'RICE_1',
+    'hcompress': 'HCOMPRESS_1'
+}
+COMPRESSED_EXT = '.fz'
+
+
+### aukr.omal.fitsfile
+# Most files held open at once by FitsFile objects (see fitsfile.HandleCache)
+MAX_OPEN_FILES = 32
+# Most bytes of pixels read at once by PixelStack.iterBands() (per band of rows)
+STACK_BYTES = 64*1024*1024
+
+
+### aukr.omal.cutout
+CUTOUT_CACHE_BYTES = 64*1024*1024 # cutouts kept (LRU) by size of their bytes
+MAX_CUTOUT_SIZE = 2048 # width/height of a cutout in pixels, at most
+
+
 ### aukr.omal.args
 default_importdir  = '/obsman/tmp-files/upload'
 default_archdir     = '/obsman/obsv_arch'
 default_dbfile      = '/obsman/aukr_obsv.db'
 default_logfile     = ''
+default_compress    = 'none'
+default_layout      = 'flat'
 
 
 ### aukr.omal.sqlitedb
 # Tablenames used within database (aukr.omat.sqlite.archiveDB)
 TABLE_OBSV = 'obsv'
 TABLE_FITS = 'fits'
+TABLE_JOURNAL = 'journal' # aukr.omal.journal, steps of ongoing imports
+TABLE_FSCK = 'fsck' # aukr.omal.fsck, size/mtime of files verified last
+# aukr.omal.summary, aggregates kept up to date by triggers
+TABLE_SUMMARY_NIGHT  = 'summary_night'  # frames/exposure per night, telescope
+TABLE_SUMMARY_TARGET = 'summary_target' # frames/exposure per object, filter
+TABLE_SUMMARY_MONTH  = 'summary_month'  # observations per month
+
+# Most hashes bound in a single query ("... IN (?, ?, ...)"), SQLite limits
+# host parameters per statement (999 in older versions)
+SQL_CHUNK = 500
+
+# Results of catalog queries kept (LRU) by their estimated size in memory,
+# see ObservatoryDB.cachedQuery()
+QUERY_CACHE_BYTES = 16*1024*1024
 
 # Keyword list below is closely bound to aukr.omat.sqlite functions.
 # do not edit unless updating/debugging
@@ -0,0 +1 @@
+from .cutout import *
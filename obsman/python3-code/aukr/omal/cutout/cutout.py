@@ -0,0 +1,246 @@
+# Cutouts (sections) of archived files, by ref of file and a region given in
+# pixels or on sky (WCS of header). Only rows/tiles covering the region are
+# read (see aukr.omal.fitsfile.Pixels), results are kept in a byte-bounded LRU
+# cache. Returned as FITS (header kept, WCS shifted) or as 8 bit grayscale PNG;
+# served over HTTP on localhost, or written by cutout.py:
+#   http://127.0.0.1:PORT/cutout?ref=D27A0005&x=512&y=512&size=64&format=png
+#   http://127.0.0.1:PORT/cutout?ref=D27A0005&ra=10.68&dec=41.27&size=64
+import io, os, zlib, struct, threading
+import numpy as np
+import astropy.io.fits as fits
+from astropy.wcs import WCS
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+from .. import calc
+from ..log import getLogger
+from ..obsv import Obsv
+from ..fitsfile import Pixels, readHeader
+from ..sqlitedb import archiveDB
+from ..const import CUTOUT_CACHE_BYTES, MAX_CUTOUT_SIZE, COMPRESSED_EXT
+
+# Create module's logger
+logger = getLogger(__name__)
+
+CUTOUT_FORMATS = {'fits': 'application/fits', 'png': 'image/png'}
+# Cards describing data layout, rewritten for (unscaled) cutout data
+STRUCTURE_CARDS = ['BSCALE', 'BZERO', 'BLANK', 'CHECKSUM', 'DATASUM']
+
+
+class CutoutCache:
+    '''LRU of cutouts (bytes), bounded by total size of bytes held; least
+    recently used ones are evicted as others are added.
+    '''
+
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.nbytes   = 0
+        self.lock     = threading.Lock()
+        self.items    = OrderedDict()  # key -> bytes
+        self.hits     = 0
+        self.misses   = 0
+
+    def get(self, key):
+        ''':returns: bytes cached for key, None if not cached
+        '''
+        with self.lock:
+            if key not in self.items:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def put(self, key, value):
+        '''Caches value (not if larger than whole cache)
+        '''
+        with self.lock:
+            if len(value) > self.maxBytes:
+                return
+            if key in self.items:
+                self.nbytes -= len(self.items.pop(key))
+            self.items[key] = value
+            self.nbytes += len(value)
+            while self.nbytes > self.maxBytes:
+                self.nbytes -= len(self.items.popitem(last=False)[1])
+
+# Cutouts made through makeCutout()
+cache = CutoutCache(CUTOUT_CACHE_BYTES)
+
+
+def fitsPath(ref):
+    '''Path of an archived file, resolved as Obsv.fromCatalog() does
+    :param ref: ref of FitsFile
+    :returns: path on disk
+    :raises ValueError: if ref is invalid or not in catalog
+    '''
+    calc.validDateAndItem(ref) # may throw ValueError
+    fitsHash = calc.hash(ref)
+    rows = archiveDB.queryFits(fitsHash, '"OBSV-HASH"')
+    obsv = Obsv.fromCatalog(rows[0][0]) if rows else None
+    if obsv is None:
+        logger.debug(f'File not in catalog: {ref}')
+        raise ValueError(f'File not in catalog: {ref}')
+    fitsFile = [fitsFile for fitsFile in obsv.getFitsList() if fitsFile.hash == fitsHash][0]
+    # Catalog rows written before relocation may lack compressed name
+    return fitsFile.path if os.path.exists(fitsFile.path) else fitsFile.path + COMPRESSED_EXT
+
+
+def box(shape, x, y, width, height):
+    '''Region of an image around a center, clipped to image
+    :param shape: (rows, columns) of image
+    :param x, y: center, 0-based column and row (FITS pixel 1 is 0)
+    :param width, height: size in pixels (at most MAX_CUTOUT_SIZE)
+    :returns: (slice of rows, slice of columns)
+    :raises ValueError: if size is illegal or region misses image
+    '''
+    if not ((0 < width <= MAX_CUTOUT_SIZE) and (0 < height <= MAX_CUTOUT_SIZE)):
+        raise ValueError(f'Size of cutout must be within 1..{MAX_CUTOUT_SIZE}')
+    (x0, y0) = (int(round(x - width/2)), int(round(y - height/2)))
+    (rows, columns) = (slice(max(y0, 0), min(y0 + height, shape[0])), slice(max(x0, 0), min(x0 + width, shape[1])))
+    if (rows.start >= rows.stop) or (columns.start >= columns.stop):
+        raise ValueError('Region is outside of image')
+    return (rows, columns)
+
+
+def skyToPixel(hdr, ra, dec):
+    ''':param hdr: astropy.io.fits.Header with celestial WCS
+    :param ra, dec: sky position in degrees
+    :returns: (x, y), 0-based column and row
+    :raises ValueError: if header has no celestial WCS
+    '''
+    wcs = WCS(hdr).celestial
+    if not wcs.has_celestial:
+        raise ValueError('File has no celestial WCS, give region in pixels')
+    (x, y) = wcs.world_to_pixel_values(ra, dec)
+    return (float(x), float(y))
+
+
+def toFits(data, hdr, rows, columns):
+    ''':returns: bytes of a FITS file holding data, cards of hdr kept; WCS
+        reference pixel and LTV1/LTV2 (IRAF) shifted to cutout
+    '''
+    hdr = hdr.copy()
+    for key in STRUCTURE_CARDS:
+        hdr.remove(key, ignore_missing=True, remove_all=True)
+    for (axis, start) in [(1, columns.start), (2, rows.start)]:
+        if f'CRPIX{axis}' in hdr:
+            hdr[f'CRPIX{axis}'] -= start
+        hdr[f'LTV{axis}'] = (hdr.get(f'LTV{axis}', 0) - start, 'offset of cutout in original image')
+    buffer = io.BytesIO()
+    fits.PrimaryHDU(data=data, header=hdr).writeto(buffer)
+    return buffer.getvalue()
+
+
+def toPng(data):
+    '''8 bit grayscale PNG (written with zlib alone), stretched linearly
+    between 0.5 and 99.5 percentiles; first row of image is at bottom, as
+    FITS viewers show it
+    :returns: bytes of PNG file
+    '''
+    finite = data[np.isfinite(data)]
+    (low, high) = np.percentile(finite, [0.5, 99.5]) if finite.size else (0, 1)
+    scaled = (np.nan_to_num(data.astype('float64'), nan=low) - low) / ((high - low) or 1)
+    pixels = (np.clip(scaled, 0, 1) * 255).astype(np.uint8)[::-1]
+    (height, width) = pixels.shape
+    # each scanline starts with filter type 0 (none)
+    raw = np.hstack([np.zeros((height, 1), np.uint8), pixels]).tobytes()
+    def chunk(kind, body):
+        return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body))
+    return (b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+        + chunk(b'IDAT', zlib.compress(raw, 6))
+        + chunk(b'IEND', b''))
+
+
+def makeCutout(ref, x=None, y=None, ra=None, dec=None, width=64, height=None, cutoutFormat='fits'):
+    '''Cutout of an archived file, from cache if made before (and file is
+    unchanged since).
+    :param ref: ref of FitsFile
+    :param x, y: center in pixels (0-based column and row), or
+    :param ra, dec: center on sky in degrees (needs WCS in header)
+    :param width: width in pixels
+    :param height: height in pixels (None for width)
+    :param cutoutFormat: 'fits' or 'png'
+    :returns: bytes of cutout file
+    :raises ValueError: if ref, region or format is illegal
+    '''
+    if cutoutFormat not in CUTOUT_FORMATS:
+        raise ValueError(f'Use one of {list(CUTOUT_FORMATS)}')
+    if (x is None or y is None) and (ra is None or dec is None):
+        raise ValueError('Give center as x, y (pixels) or ra, dec (degrees)')
+    height = height or width
+    path = fitsPath(ref)
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime, x, y, ra, dec, width, height, cutoutFormat)
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    hdr = readHeader(path)
+    if x is None or y is None:
+        (x, y) = skyToPixel(hdr, ra, dec)
+    pixels = Pixels(path)
+    try:
+        if len(pixels.shape) != 2:
+            raise ValueError('Cutouts are of 2-D images only')
+        (rows, columns) = box(pixels.shape, x, y, width, height)
+        data = pixels[rows, columns]
+    finally:
+        pixels.close()
+    result = toFits(data, hdr, rows, columns) if cutoutFormat == 'fits' else toPng(data)
+    cache.put(key, result)
+    logger.info(f'Cutout {ref} [{rows.start}:{rows.stop}, {columns.start}:{columns.stop}]: {len(result)} bytes')
+    return result
+
+
+def cutoutOfQuery(query):
+    '''makeCutout() with parameters of a query string (as given in URL)
+    '''
+    params = {key: values[-1] for (key, values) in parse_qs(query).items()}
+    number = lambda key: float(params[key]) if key in params else None
+    size = int(params.get('size', 64))
+    return makeCutout(params.get('ref', ''), number('x'), number('y'), number('ra'), number('dec'),
+        int(params.get('width', size)), int(params.get('height', params.get('width', size))),
+        params.get('format', 'fits'))
+
+
+def serve(port, host='127.0.0.1'):
+    '''Serves cutouts over HTTP (GET /cutout?ref=...), until interrupted.
+    Requests are handled one at a time: catalog connection belongs to this
+    thread, and a cutout takes a few page reads.
+    :param port: TCP port to listen
+    :param host: address to bind (default localhost only)
+    '''
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != '/cutout':
+                self.send_error(404)
+                return
+            try:
+                body = cutoutOfQuery(url.query)
+            except (ValueError, KeyError) as e:
+                self.send_error(400, explain=str(e))
+                return
+            except OSError as e:
+                logger.warning(f'{e}')
+                self.send_error(404, explain=str(e))
+                return
+            params = parse_qs(url.query)
+            self.send_response(200)
+            self.send_header('Content-Type', CUTOUT_FORMATS[params.get('format', ['fits'])[-1]])
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = HTTPServer((host, port), Handler)
+    logger.info(f'Serving cutouts: http://{host}:{port}/cutout')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
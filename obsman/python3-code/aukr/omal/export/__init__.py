@@ -0,0 +1 @@
+from .export import *
\ No newline at end of file
@@ -0,0 +1,118 @@
+# Streams archived observations as a single ZIP/TAR archive into a file-like
+# object (e.g. sys.stdout.buffer), files are read chunk by chunk and written
+# out as they are read; nothing is staged on disk and memory use is constant.
+import os, io, csv, json, time, shutil, tarfile, zipfile
+from .. import calc, filesys
+from ..log import getLogger
+from ..sqlitedb import archiveDB
+
+# Create module's logger
+logger = getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024 # bytes read/written at once
+
+EXPORT_FORMATS   = ['zip', 'tar']
+MANIFEST_FORMATS = ['csv', 'json']
+
+
+def walkObsv(obsvRoot):
+    '''Yields files of an archived observation directory.
+    :param obsvRoot: path of archived observation directory
+    :returns: generator of (absolute path, name within exported archive)
+    '''
+    for (dirPath, dirNames, fileNames) in os.walk(obsvRoot):
+        dirNames.sort() # os.walk honours in-place sorting, keeps output stable
+        for fileName in sorted(fileNames):
+            path = os.path.join(dirPath, fileName)
+            yield (path, os.path.relpath(path, os.path.dirname(obsvRoot)))
+
+
+def writeManifest(textFile, hashList, manifest):
+    '''Writes rows of fits table for given observations, row by row.
+    :param textFile: text mode file-like object
+    :param hashList: hashes of observations
+    :param manifest: one of MANIFEST_FORMATS
+    '''
+    isFirst = True
+    writer = None
+    if manifest == 'json':
+        textFile.write('[')
+    for obsvHash in hashList:
+        cursor = archiveDB.iterFitsByObsv(obsvHash)
+        columns = [description[0] for description in cursor.description]
+        for row in cursor:
+            if manifest == 'csv':
+                if writer is None:
+                    writer = csv.writer(textFile)
+                    writer.writerow(columns)
+                writer.writerow(row)
+            else:
+                textFile.write(('\n' if isFirst else ',\n') + json.dumps(dict(zip(columns, row))))
+            isFirst = False
+    if manifest == 'json':
+        textFile.write('\n]\n')
+
+
+def streamExport(hashList, outFile, exportFormat='zip', manifest=''):
+    '''Streams archived observations (and optionally a manifest of their fits
+    rows, named "manifest.csv" or "manifest.json") into outFile. Output starts
+    before all files are read; outFile need not be seekable.
+    :param hashList: hashes of observations to be exported
+    :param outFile: binary file-like object to write into (e.g. sys.stdout.buffer)
+    :param exportFormat: one of EXPORT_FORMATS
+    :param manifest: '' (no manifest), or one of MANIFEST_FORMATS
+    :returns: number of files exported
+    '''
+    if exportFormat not in EXPORT_FORMATS:
+        logger.debug(f'Use one of {EXPORT_FORMATS}, exportFormat: {exportFormat}')
+        raise ValueError(f'Use one of {EXPORT_FORMATS}')
+    if manifest and (manifest not in MANIFEST_FORMATS):
+        logger.debug(f'Use one of {MANIFEST_FORMATS}, manifest: {manifest}')
+        raise ValueError(f'Use one of {MANIFEST_FORMATS}')
+
+    # Resolve observation directories first (cheap), so missing ones are reported early
+    obsvRootList = []
+    for obsvHash in hashList:
+        paths = filesys.getArchPathsByRef(calc.ref(obsvHash))
+        if paths:
+            obsvRootList += paths
+        else:
+            logger.warning(f'Not in archive directory: {calc.ref(obsvHash)}')
+
+    count = 0
+    if exportFormat == 'zip':
+        # ZIP_STORED, pixel data barely compresses and deflating costs cpu;
+        # zipfile uses data descriptors when outFile is not seekable
+        with zipfile.ZipFile(outFile, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True) as zipArch:
+            if manifest:
+                with zipArch.open(f'manifest.{manifest}', mode='w', force_zip64=True) as member:
+                    with io.TextIOWrapper(member, encoding='utf-8', newline='') as textFile:
+                        writeManifest(textFile, hashList, manifest)
+            for obsvRoot in obsvRootList:
+                for (path, arcName) in walkObsv(obsvRoot):
+                    zipInfo = zipfile.ZipInfo.from_file(path, arcName)
+                    with open(path, 'rb') as srcFile, zipArch.open(zipInfo, mode='w', force_zip64=True) as member:
+                        shutil.copyfileobj(srcFile, member, CHUNK_SIZE)
+                    outFile.flush()
+                    count += 1
+    else:
+        # 'w|' is tarfile's stream mode (no seeking back)
+        with tarfile.open(fileobj=outFile, mode='w|', bufsize=CHUNK_SIZE) as tarArch:
+            if manifest:
+                # tar headers hold member sizes, thus manifest (small) is built in memory
+                textFile = io.StringIO(newline='')
+                writeManifest(textFile, hashList, manifest)
+                manifestBytes = textFile.getvalue().encode('utf-8')
+                tarInfo = tarfile.TarInfo(f'manifest.{manifest}')
+                tarInfo.size = len(manifestBytes)
+                tarInfo.mtime = int(time.time())
+                tarArch.addfile(tarInfo, io.BytesIO(manifestBytes))
+            for obsvRoot in obsvRootList:
+                for (path, arcName) in walkObsv(obsvRoot):
+                    with open(path, 'rb') as srcFile:
+                        tarArch.addfile(tarArch.gettarinfo(path, arcName), srcFile)
+                    outFile.flush()
+                    count += 1
+
+    logger.info(f'Exported {count} files ({exportFormat})')
+    return count
@@ -1,16 +1,48 @@
-import shutil, errno, os, glob
-from ..log import getLogger
+import shutil, errno, os, glob, contextvars
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+from ..log import getLogger, configureWorker
 from ..args import args
-from ..calc import ref
-from ..const import BIAS_DIR, DARK_DIR, FLAT_DIR, OBJCT_DIR, OTHER_DIR
+from ..calc import ref, dateAndItem
+from ..fitsfile import compressFits
+from ..metrics import metrics
+from .. import journal
+from ..sqlitedb import archiveDB
+from ..const import BIAS_DIR, DARK_DIR, FLAT_DIR, OBJCT_DIR, OTHER_DIR, COMPRESSED_EXT
 
-# Directories
-ARCH_DIR  = args.archdir
-TMP_DIR   = f'{ARCH_DIR}/tmp'
+# Directories (and layout) are those of args in effect at the time of call,
+# archdir of command line or of Archive in use (see aukr.omal.archive).
+# Layout of observations moved into archdir: 'flat' (archdir/YYYY-MM-DD_REF)
+# or 'sharded' (archdir/YYYY/MM/YYYY-MM-DD_REF). Either is found whatever the
+# setting, both are derived from ref (see archObsvCandidates).
 
 # Create module's logger
 logger = getLogger(__name__)
 
+# Threads removing directories in background (see removeInBackground)
+remover = None
+
+
+def archDir():
+    ''':returns: archive directory (args.archdir)
+    '''
+    return args.archdir
+
+def tmpDir():
+    ''':returns: archive's temporary storage (archdir/tmp)
+    '''
+    return f'{args.archdir}/tmp'
+
+def treeSize(directory):
+    ''':param directory: path of directory
+    :returns: tuple (number of files, total bytes) within directory (recursive)
+    '''
+    files = 0
+    nbytes = 0
+    for (dirPath, dirNames, fileNames) in os.walk(directory):
+        files += len(fileNames)
+        nbytes += sum(os.path.getsize(os.path.join(dirPath, fileName)) for fileName in fileNames)
+    return (files, nbytes)
 
 def copyToTmp(dirList):
     ''':param dirList: list of paths of directories to be copied into temporary storage
@@ -19,14 +51,79 @@ def copyToTmp(dirList):
     try:
         tmpDirList = []
         for directory in dirList:
-            shutil.copytree(directory, f'{TMP_DIR}/{os.path.basename(directory)}')
-            tmpDirList.append(f'{TMP_DIR}/{os.path.basename(directory)}')
+            # Copy of an interrupted import is kept (see cleanTmp), resumed as is
+            tmpPath = f'{tmpDir()}/{os.path.basename(directory)}'
+            if os.path.isdir(tmpPath) and (journal.slotOf(os.path.abspath(tmpPath)) is not None):
+                logger.info(f'Interrupted import, reusing: {tmpPath}')
+                tmpDirList.append(tmpPath)
+                continue
+            (files, nbytes) = treeSize(directory)
+            with metrics.stage('copy', os.path.basename(directory), files, nbytes):
+                shutil.copytree(directory, f'{tmpDir()}/{os.path.basename(directory)}')
+            tmpDirList.append(f'{tmpDir()}/{os.path.basename(directory)}')
         return tmpDirList
     except OSError as exc: # python >2.5
         if exc.errno == errno.ENOTDIR:
-            shutil.copy(args.importdir, TMP_DIR)
+            shutil.copy(args.importdir, tmpDir())
         else: raise
     
+def shardOf(hash):
+    ''':param hash: hash of an observation
+    :returns: 'YYYY/MM', its directory in sharded layout (relative to archdir)
+    '''
+    (date, item) = dateAndItem(hash)
+    return '/'.join(date.split('-')[:2])
+
+def archObsvPath(hash, layout=None):
+    '''Where an observation goes in archive; ref alone decides, date of
+    observation is that of its ref.
+    :param hash: hash of observation
+    :param layout: 'flat' or 'sharded', default args.layout
+    :returns: path of observation directory in archdir
+    '''
+    name = f'{dateAndItem(hash)[0]}_{ref(hash)}'
+    if (layout or args.layout) == 'sharded':
+        return f'{archDir()}/{shardOf(hash)}/{name}'
+    return f'{archDir()}/{name}'
+
+def archObsvCandidates(hash):
+    ''':param hash: hash of archived observation
+    :returns: paths it might be archived at (one per layout, args.layout first)
+    '''
+    return [archObsvPath(hash, layout) for layout in
+        sorted(['flat', 'sharded'], key=lambda layout: layout != args.layout)]
+
+def listArchObsv():
+    ''':returns: sorted paths of all archived observation directories (both layouts)
+    '''
+    return sorted(glob.glob(f'{archDir()}/*-*-*_*') + glob.glob(f'{archDir()}/[0-9]*/[0-9]*/*-*-*_*'),
+        key=os.path.basename)
+
+def archObsvRoot(obsv):
+    '''Path of observation within archive (after moveToArchive)
+    :param obsv: Obsv object (new one must have its hash allocated)
+    :returns: path of observation directory in archdir (for archived ones,
+        wherever it is found, in either layout)
+    '''
+    if not obsv.isNew:
+        for path in archObsvCandidates(obsv.hash):
+            if os.path.isdir(path):
+                return path
+    return archObsvPath(obsv.hash)
+
+def archFitsPath(obsv, branchIndex, fitsFile):
+    '''Path of a file within archive (after moveToArchive)
+    :param obsv: Obsv object (new one must have its hash allocated)
+    :param branchIndex: index of file's branch in obsv.fitsTree
+    :param fitsFile: FitsFile object in that branch
+    :returns: path of file in archdir
+    '''
+    branch = [BIAS_DIR, DARK_DIR, FLAT_DIR, OBJCT_DIR][branchIndex]
+    name = fitsFile.name
+    if (args.compress != 'none') and name.endswith('.fit'):
+        name += COMPRESSED_EXT
+    return f'{archObsvRoot(obsv)}/{branch}/{name}'
+
 def moveToArchive(obsv):
     '''Moves observation folders in archive's temporary storage into archive itself.
     References are concatenated with an underscore inbetween.
@@ -34,38 +131,68 @@ def moveToArchive(obsv):
     :returns: True if successful
     '''
     try:
-        if obsv.isNew:
-            obsvName = obsv.name + '_' + ref(obsv.hash)
-        else:
-            obsvName = obsv.name
-            
-        archObsvRoot = f'{ARCH_DIR}/{obsvName}'
+        archRoot = archObsvRoot(obsv)
+        # Partial copy left by an interrupted move is redone
+        if (obsv.resumeHash is not None) and os.path.exists(archRoot):
+            logger.info(f'Removing partial move: {archRoot}')
+            shutil.rmtree(archRoot)
         # self.branchList = [BIAS_DIR, DARK_DIR, FLAT_DIR, objctBranch, OTHER_DIR]
-        # copy first three
-        for branch in [BIAS_DIR, DARK_DIR, FLAT_DIR]:
-            shutil.copytree(f'{obsv.path}/{branch}', f'{archObsvRoot}/{branch}')
-        # copy objctBranch
-        shutil.copytree(f'{obsv.path}/{obsv.branchList[3]}', f'{archObsvRoot}/{OBJCT_DIR}')
+        # first three, then objctBranch
+        branchPairs = [(f'{obsv.path}/{branch}', f'{archRoot}/{branch}')
+            for branch in [BIAS_DIR, DARK_DIR, FLAT_DIR]]
+        branchPairs.append((f'{obsv.path}/{obsv.branchList[3]}', f'{archRoot}/{OBJCT_DIR}'))
         # copy/create OTHER_DIR
         if os.path.exists(f'{obsv.path}/{OTHER_DIR}'):
-            shutil.copytree(f'{obsv.path}/{OTHER_DIR}', f'{archObsvRoot}/{OTHER_DIR}')
+            branchPairs.append((f'{obsv.path}/{OTHER_DIR}', f'{archRoot}/{OTHER_DIR}'))
         else:
-            os.makedirs(f'{archObsvRoot}/{OTHER_DIR}')
+            os.makedirs(f'{archRoot}/{OTHER_DIR}')
+        fitsList = obsv.getFitsList()
+        with metrics.stage('move', obsv.name, files=len(fitsList),
+            nbytes=sum(os.path.getsize(fitsFile.path) for fitsFile in fitsList)):
+            copyBranches(branchPairs, args.compress)
         # remove folder in archdir/tmp (provided --no-copy argument is not provided)
         if not args.nocopy:
             shutil.rmtree(obsv.path)
         return True
     except OSError as exc: # python >2.5
         if exc.errno == errno.ENOTDIR:
-            shutil.copy(obsv.path, ARCH_DIR)
+            shutil.copy(obsv.path, archDir())
         else: raise
 
+def copyBranches(branchPairs, compress='none'):
+    '''Copies branch folders into archive. Unless compress is 'none', '.fit'
+    files are tile-compressed on a process pool (named '*.fit.fz') while rest
+    of the branch is copied as is.
+    :param branchPairs: list of (source, destination) directory paths
+    :param compress: 'none' or key of aukr.omal.const.COMPRESS_TYPES
+    '''
+    srcList = []
+    dstList = []
+    for (srcDir, dstDir) in branchPairs:
+        if compress == 'none':
+            shutil.copytree(srcDir, dstDir)
+        else:
+            shutil.copytree(srcDir, dstDir, ignore=shutil.ignore_patterns('*.fit'))
+            for srcPath in sorted(glob.glob(f'{srcDir}/*.fit')):
+                srcList.append(srcPath)
+                dstList.append(f'{dstDir}/{os.path.basename(srcPath)}{COMPRESSED_EXT}')
+
+    if srcList:
+        logger.debug(f'Compressing ({compress}) {len(srcList)} files')
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=configureWorker,
+            initargs=(args.current(),)) as pool:
+            # list() so exceptions raised in workers are re-raised here
+            list(pool.map(compressFits, srcList, dstList, repeat(compress), chunksize=16))
+
 def cleanTmp():
-    '''Deletes all files/directories in archive's temporary storage
+    '''Deletes all files/directories in archive's temporary storage, except
+    those of interrupted imports (see aukr.omal.journal)
     :returns: True if successful
     '''
     try:
-        [shutil.rmtree(tmpObsv) for tmpObsv in sorted(glob.glob(f'{TMP_DIR}/*/'))]
+        keep = journal.pending()
+        [shutil.rmtree(tmpObsv) for tmpObsv in sorted(glob.glob(f'{tmpDir()}/*/'))
+            if os.path.abspath(os.path.dirname(tmpObsv)) not in keep]
         return True
     except OSError as exc: # python >2.5
         logger.warning(exc)
@@ -75,17 +202,77 @@ def removeFromArchFolder(obsv):
     :returns: True if successful
     '''
     try:
-        shutil.rmtree(f'{ARCH_DIR}/{obsv.name}')
+        shutil.rmtree(archObsvRoot(obsv))
+        return True
+    except OSError as exc:
+        logger.warning(exc)
+
+def getArchPathsByHashes(hashList):
+    '''Paths are looked up in catalog (obsv PATH, by primary key) instead of
+    globbing archdir; for those not found there (e.g. rows inserted but not
+    moved yet, or directories left without rows) paths derived from ref are
+    tried, in both layouts.
+    :param hashList: hashes of archived observations
+    :returns: dict of hash -> list of paths of archived observation directories
+    '''
+    pathsByHash = {hash: [] for hash in hashList}
+    for (hash, path) in archiveDB.queryObsvPaths(list(pathsByHash)):
+        # Catalog path must be an archived directory, not e.g. the original
+        # observation (--no-copy) of an interrupted import
+        if (path in map(os.path.abspath, archObsvCandidates(hash))) and os.path.isdir(path):
+            pathsByHash[hash] = [path]
+    for hash in [hash for (hash, paths) in pathsByHash.items() if not paths]:
+        pathsByHash[hash] = [path for path in archObsvCandidates(hash) if os.path.isdir(path)]
+    return pathsByHash
+
+def getArchPathsByRef(ref):
+    ''':param ref: Reference of archived observation
+    :returns: list of paths of archived observation directories with given ref
+    '''
+    obsvHash = int(ref, 16)
+    return getArchPathsByHashes([obsvHash])[obsvHash]
+
+def removeTree(path):
+    ''':param path: directory to be removed
+    :returns: True if successful
+    '''
+    try:
+        shutil.rmtree(path)
         return True
     except OSError as exc:
         logger.warning(exc)
+        return False
+
+def removeInBackground(pathList):
+    '''Directories are first renamed into archive's temporary storage (instant,
+    they leave archdir right away), then removed on a thread pool. Any left
+    there (e.g. interrupted) are removed by cleanTmp().
+    :param pathList: paths of directories to be removed
+    :returns: list of futures (result() True if removed)
+    '''
+    global remover
+    if remover is None:
+        remover = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='remover')
+    os.makedirs(tmpDir(), exist_ok=True)
+    futures = []
+    for path in pathList:
+        trashPath = f'{tmpDir()}/removed_{os.path.basename(os.path.normpath(path))}'
+        try:
+            os.rename(path, trashPath)
+        except OSError as exc:
+            # e.g. on another filesystem, removed in place
+            logger.debug(f'Cannot rename ({exc}), removing in place: {path}')
+            trashPath = path
+        # shared by archives, each removal runs in context of its caller
+        futures.append(remover.submit(contextvars.copy_context().run, removeTree, trashPath))
+    return futures
 
 def removeFromArchByRef(ref):
     ''':param ref: Reference of archived observation to be removed.
     :returns: True if successful
     '''
     try:
-        [shutil.rmtree(archObsv) for archObsv in sorted(glob.glob(f'{ARCH_DIR}/*_{ref}'))]
+        [shutil.rmtree(archObsv) for archObsv in getArchPathsByRef(ref)]
         return True
     except OSError as exc:
         logger.warning(exc)  
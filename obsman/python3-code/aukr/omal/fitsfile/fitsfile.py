@@ -1,39 +1,362 @@
 # Uses upgrade-script from 2019-Summer-Interns: Mirzhalilov and Khuzhakulov
-#  ( see: Fits.updateScript() )
-
-# For FitsFile.upgradeScript() method
-from astropy import time, coordinates as coord
+#  ( see: Fits.updateScript(), computed by aukr.omal.profile now )
 import astropy.io.fits as fits
-import os
-import datetime
+import os, json, shutil, threading
+import numpy as np
+from collections import OrderedDict
 # For rest
 from ..log import getLogger
+from ..metrics import metrics
 from .. import calc
-from ..const import OBS_ALT, MAX_DAYS_APART_LIMIT
+from ..profile import normalizerFor
+from ..const import MAX_DAYS_APART_LIMIT, COMPRESS_TYPES, HDR_KEYS, MAX_OPEN_FILES,\
+    COMPRESSED_EXT, STACK_BYTES
 
 # Create module's logger
 logger  = getLogger(__name__)
 
 
+def imageHDU(hdul):
+    '''Picks the HDU holding the image (and the header cards used by catalog).
+    Tile-compressed files (.fit.fz) keep it in the first extension, as
+    astropy.io.fits.CompImageHDU; plain files in the primary HDU.
+    :param hdul: astropy.io.fits.HDUList
+    :returns: HDU whose header/data represent the observation file
+    '''
+    if (len(hdul) > 1) and isinstance(hdul[1], fits.CompImageHDU):
+        return hdul[1]
+    return hdul[0]
+
+
+def readHeader(path):
+    ''':param path: path of .fit file (or tile-compressed '.fit.fz')
+    :returns: image header (astropy.io.fits.Header), file is closed
+    '''
+    with fits.open(path, mode='readonly') as hdul:
+        return imageHDU(hdul).header
+
+
+def compressFits(srcPath, dstPath, compress):
+    '''Writes a tile-compressed (fpack-compatible) copy of a .fit file, header
+    cards are preserved as is. Module-level so it can run on a process pool.
+    :param srcPath: path of uncompressed .fit file
+    :param dstPath: path of compressed file to be created (e.g. '*.fit.fz')
+    :param compress: key of aukr.omal.const.COMPRESS_TYPES ('rice', 'hcompress')
+    :returns: dstPath
+    '''
+    with fits.open(srcPath, mode='readonly') as hdul:
+        hdu = imageHDU(hdul)
+        # Quantization of floating point images is lossy, keep them intact
+        if hdu.data is not None and hdu.data.dtype.kind == 'f':
+            compressionType = 'GZIP_2'
+        else:
+            compressionType = COMPRESS_TYPES[compress]
+        compHDU = fits.CompImageHDU(data=hdu.data, header=hdu.header, compression_type=compressionType)
+        fits.HDUList([fits.PrimaryHDU(), compHDU]).writeto(dstPath)
+    return dstPath
+
+
+def writeFits(srcPath, dstPath, hdr, compress='none'):
+    '''Writes a copy of a .fit file with another header (e.g. upgraded one).
+    Uncompressed copies take data bytes as is, right after the new header.
+    :param srcPath: path of original file
+    :param dstPath: path of file to be created
+    :param hdr: astropy.io.fits.Header to be written (structure cards as in original)
+    :param compress: 'none' or key of aukr.omal.const.COMPRESS_TYPES
+    :returns: dstPath
+    '''
+    with fits.open(srcPath, mode='readonly') as hdul:
+        hdu = imageHDU(hdul)
+        if compress != 'none':
+            # Quantization of floating point images is lossy, keep them intact
+            if hdu.data is not None and hdu.data.dtype.kind == 'f':
+                compressionType = 'GZIP_2'
+            else:
+                compressionType = COMPRESS_TYPES[compress]
+            compHDU = fits.CompImageHDU(data=hdu.data, header=hdr, compression_type=compressionType)
+            fits.HDUList([fits.PrimaryHDU(), compHDU]).writeto(dstPath)
+            return dstPath
+        if hdu is not hdul[0]:
+            # Tile-compressed original, written uncompressed
+            fits.PrimaryHDU(data=hdu.data, header=hdr).writeto(dstPath)
+            return dstPath
+        dataLoc = hdul.fileinfo(0)['datLoc']
+
+    with open(srcPath, 'rb') as srcFile, open(dstPath, 'wb') as dstFile:
+        dstFile.write(hdr.tostring().encode('ascii'))
+        srcFile.seek(dataLoc)
+        shutil.copyfileobj(srcFile, dstFile)
+    return dstPath
+
+
+class HandleCache:
+    '''Bounded LRU of open files (astropy.io.fits.HDUList), so that at most
+    size file descriptors are held, however many FitsFile objects exist.
+    Least recently used one is closed when another file is opened.
+    '''
+
+    def __init__(self, size):
+        self.size    = size
+        self.lock    = threading.Lock()
+        self.handles = OrderedDict()  # (path, mode) -> HDUList
+
+    def open(self, path, mode='readonly'):
+        ''':returns: astropy.io.fits.HDUList of path, opened with mode
+        '''
+        with self.lock:
+            key = (path, mode)
+            if key in self.handles:
+                self.handles.move_to_end(key)
+                return self.handles[key]
+            # Same file opened with other mode is closed first
+            for otherKey in [otherKey for otherKey in self.handles if otherKey[0] == path]:
+                self.handles.pop(otherKey).close()
+            while len(self.handles) >= self.size:
+                self.handles.popitem(last=False)[1].close()
+            hdul = fits.open(path, mode=mode)
+            self.handles[key] = hdul
+            return hdul
+
+    def close(self, path):
+        '''Closes file (changes are flushed in 'update' mode), if open
+        '''
+        with self.lock:
+            for key in [key for key in self.handles if key[0] == path]:
+                self.handles.pop(key).close()
+
+    def closeAll(self):
+        with self.lock:
+            while self.handles:
+                self.handles.popitem()[1].close()
+
+# Files opened through FitsFile.open()
+handles = HandleCache(MAX_OPEN_FILES)
+
+
+# BITPIX -> dtype of pixels as stored (FITS is big-endian)
+BITPIX_DTYPES = {8: '>u1', 16: '>i2', 32: '>i4', 64: '>i8', -32: '>f4', -64: '>f8'}
+
+class Pixels:
+    '''Lazy view of an image. Pixels stay on disk, memory-mapped (tile-compressed
+    files are read tile by tile through astropy's section); indexing reads only
+    pages covering the region, and applies BSCALE/BZERO to it alone:
+        pixels[100:200, :]   # numpy array of 100 rows, physical values
+        pixels.raw           # unscaled pixels (np.memmap, or section)
+    Integer images with BZERO 2**(bits-1) (e.g. unsigned 16 bit) stay integer,
+    others become float32 (float64 for BITPIX 32, 64), BLANK pixels NaN.
+    '''
+    __slots__ = ('path', 'raw', 'shape', 'dtype', 'bscale', 'bzero', 'blank', 'hdul')
+
+    def __init__(self, path, scaled=True):
+        ''':param path: path of .fit file (or tile-compressed '.fit.fz')
+        :param scaled: False to leave values as stored (BSCALE/BZERO ignored)
+        '''
+        self.path = path
+        self.hdul = None
+        with fits.open(path, mode='readonly', memmap=False, lazy_load_hdus=True) as hdul:
+            hdu = imageHDU(hdul)
+            hdr = hdu.header
+            compressed = hdu is not hdul[0]
+            dataLoc = None if compressed else hdul.fileinfo(0)['datLoc']
+        if not hdr.get('NAXIS', 0):
+            logger.debug('No image in file: %s', path)
+            raise ValueError('FITS file has no image')
+        self.shape  = tuple(hdr[f'NAXIS{i}'] for i in range(hdr['NAXIS'], 0, -1))
+        self.bscale = hdr.get('BSCALE', 1) if scaled else 1
+        self.bzero  = hdr.get('BZERO', 0) if scaled else 0
+        self.blank  = hdr.get('BLANK') if scaled else None
+        stored = np.dtype(BITPIX_DTYPES[hdr['BITPIX']])
+        if self.isUnsigned(stored):
+            self.dtype = np.dtype(stored.str.replace('i', 'u')).newbyteorder('=')
+        elif (self.bscale == 1) and (self.bzero == 0) and ((self.blank is None) or stored.kind == 'f'):
+            self.dtype = stored.newbyteorder('=')
+        else:
+            self.dtype = np.dtype('float32' if stored.itemsize <= 2 else 'float64')
+
+        if compressed:
+            # Section decompresses only tiles overlapping what is indexed, and
+            # scales by itself; file is kept open as long as this object
+            self.hdul = fits.open(path, mode='readonly', do_not_scale_image_data=not scaled)
+            self.raw = imageHDU(self.hdul).section
+        else:
+            self.raw = np.memmap(path, dtype=stored, mode='r', offset=dataLoc, shape=self.shape)
+
+    def isUnsigned(self, stored):
+        ''':returns: True if stored signed integers are unsigned ones, offset by BZERO
+        '''
+        return ((stored.kind == 'i') and (self.bscale == 1) and (self.blank is None)
+            and (self.bzero == 2**(8*stored.itemsize - 1)))
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def nbytes(self):
+        ''':returns: bytes of whole image once read (physical values)
+        '''
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        ''':param key: numpy index (slices read only rows/pages needed)
+        :returns: numpy array of physical values (a copy, in native byte order)
+        '''
+        raw = self.raw[key]
+        if self.hdul is not None:
+            return np.asarray(raw).astype(self.dtype, copy=False)
+        stored = raw.dtype
+        if self.isUnsigned(stored):
+            # Same as adding BZERO (flips sign bit), exact and without floats
+            unsigned = stored.str.replace('i', 'u')
+            return (raw.view(unsigned) ^ np.array(self.bzero, dtype=unsigned)).astype(self.dtype)
+        values = np.array(raw, dtype=self.dtype)
+        if (self.dtype.kind == 'f') and (stored.kind != 'f'):
+            values *= self.bscale
+            values += self.bzero
+            if self.blank is not None:
+                values[raw == self.blank] = np.nan
+        return values
+
+    def __array__(self, dtype=None, copy=None):
+        values = self[...]
+        return values if dtype is None else values.astype(dtype)
+
+    def close(self):
+        '''Releases file (memory map, or handle of compressed file)
+        '''
+        if self.hdul is not None:
+            self.hdul.close()
+            self.hdul = None
+        self.raw = None
+
+
+class PixelStack:
+    '''Lazy 3-D view (frame, row, column) of same-shaped images, e.g. all
+    Dark frames of an observation (see Obsv.stack()). Nothing is read until
+    indexed; iterBands() walks it band of rows by band of rows, so memory held
+    is bounded however many frames there are.
+    '''
+
+    def __init__(self, pixelsList):
+        ''':param pixelsList: list of Pixels objects, all with same shape
+        '''
+        shapes = {pixels.shape for pixels in pixelsList}
+        if len(shapes) > 1:
+            logger.debug('Images differ in shape %s: %s', shapes, [pixels.path for pixels in pixelsList])
+            raise ValueError('Images of a stack must have same shape')
+        self.pixelsList = pixelsList
+        self.frameShape = shapes.pop() if shapes else ()
+        self.dtype = np.result_type(*[pixels.dtype for pixels in pixelsList]) if pixelsList else np.dtype('float64')
+
+    @property
+    def shape(self):
+        return (len(self.pixelsList), *self.frameShape)
+
+    def __len__(self):
+        return len(self.pixelsList)
+
+    def __getitem__(self, key):
+        ''':param key: numpy index, first axis selects frames
+        :returns: numpy array, frames of selection stacked along first axis
+        '''
+        if not isinstance(key, tuple):
+            key = (key,)
+        (frameKey, pixelKey) = (key[0], key[1:] or (Ellipsis,))
+        if isinstance(frameKey, (int, np.integer)):
+            return self.pixelsList[frameKey][pixelKey]
+        frames = np.arange(len(self.pixelsList))[frameKey]
+        return np.stack([self.pixelsList[i][pixelKey].astype(self.dtype, copy=False) for i in frames])
+
+    def iterBands(self, maxBytes=STACK_BYTES):
+        '''Yields stack band by band of rows, at most maxBytes each (at least a row)
+        :param maxBytes: bytes of a band, all frames included
+        :yields: (slice of rows, numpy array (frame, row, ...) of those rows)
+        '''
+        if not self.pixelsList:
+            return
+        rowBytes = len(self.pixelsList) * int(np.prod(self.frameShape[1:])) * self.dtype.itemsize
+        rows = max(1, maxBytes // max(rowBytes, 1))
+        for start in range(0, self.frameShape[0], rows):
+            band = slice(start, min(start + rows, self.frameShape[0]))
+            yield (band, self[:, band])
+
+    def close(self):
+        for pixels in self.pixelsList:
+            pixels.close()
+
+
+
+def catalogCards(hdr):
+    ''':param hdr: astropy.io.fits.Header
+    :returns: dict of cards kept by catalog (aukr.omal.const.HDR_KEYS) found in hdr
+    '''
+    return {key: hdr[key] for key in HDR_KEYS if key in hdr}
+
+
+# Cards not kept in EXTRA either: commentary, and those describing file structure
+EXTRA_SKIPPED = {'', 'COMMENT', 'HISTORY', 'EXTEND', 'PCOUNT', 'GCOUNT', 'CHECKSUM', 'DATASUM'}
+
+def extraCards(hdr):
+    ''':param hdr: astropy.io.fits.Header
+    :returns: dict of other cards (not in aukr.omal.const.HDR_KEYS, nor
+        EXTRA_SKIPPED), JSON-ready; first one kept if a keyword repeats,
+        undefined values are None
+    '''
+    extra = {}
+    for card in hdr.cards:
+        key = card.keyword
+        if (key in EXTRA_SKIPPED) or (key in HDR_KEYS) or (key in extra):
+            continue
+        value = card.value
+        if isinstance(value, fits.card.Undefined):
+            value = None
+        elif not isinstance(value, (bool, int, float, str)):
+            value = str(value)
+        extra[key] = value
+    return extra
+
+
+def readExtra(path):
+    '''Module-level, so it can run on a process pool (see
+    aukr.omal.functions.backfillExtra())
+    :param path: path of .fit file (or tile-compressed '.fit.fz')
+    :returns: tuple (path, dict of extraCards(), None if unreadable)
+    '''
+    try:
+        return (path, extraCards(readHeader(path)))
+    except Exception:
+        logger.debug('Could not read header: %s', path, exc_info=True)
+        return (path, None)
+
+
 ### Class for FITS files within observations
 # Created and accessed by Obsv objects only
 # raises SomeError unless constructed. This was chosen over 'return None', because
 # this seems more efficient than checking (almost always) previously checked
 # user input.
 class FitsFile:
-    '''Class representing FITS files (.fit). Please modify upgradeScript()
-    method as required for handling new observation headers
+    '''Class representing FITS files (.fit). Headers of other observatories
+    and instruments are handled by profiles (aukr.omal.const.PROFILES), rather
+    than by modifying upgradeScript(). Objects are
+    compact records: only cards kept by catalog are held, file is opened on
+    demand (see open()) and not kept open.
     '''
+    __slots__ = ('mode', 'path', 'name', 'hdr', 'extra', 'date', 'hash', 'obsvHash', 'isNew')
     
-    def __init__(self, path, mode='readonly'):
+    def __init__(self, path, mode='readonly', hdr=None):
         ''':param path: path to fits file to be parsed (can be relative)
         :param mode: indicates if file will be modified (choose 'readonly', 'update')
+        :param hdr: (optional) astropy.io.fits.Header already read from path,
+            file is not read again
         '''
         self.mode = None  # from constructor
         self.path = None  # from constructor, made absolute
         self.name = None  # from self.path, full name of file (.fit included)
-        self.hdul = None  # from astropy.io.fits.open(path, mode), HDUList, to flush() changes made
-        self.hdr  = None  # from self.hdul[0].header, Primary HDU's header, parse below params
+        self.hdr  = None  # dict of cards in aukr.omal.const.HDR_KEYS, from image header (primary unless compressed)
+        self.extra = None # dict of other cards (see extraCards()), catalog keeps them as JSON
         self.date = None  # from self.header, inserted at observation (parsed as "YYYY-MM-DD")
         self.hash = None  # from AUKR-REF in self.header, OR given by Obsv.update() at creation
         self.obsvHash = None # calculated from self.hash
@@ -48,30 +371,31 @@ class FitsFile:
         if (mode == 'update') or (mode == 'readonly'):
             self.mode = mode
         else:
-            logger.debug(f"Use 'update' or 'readonly', mode: {mode}")
+            logger.debug("Use 'update' or 'readonly', mode: %s", mode)
             raise ValueError("Use 'update' or 'readonly'")
 
-        # Import header and HDUList from file
-        self.hdul = fits.open(self.path, mode=self.mode)
-        self.hdr  = self.hdul[0].header
+        # Import header from file (compressed files are read transparently),
+        # file is closed right away
+        if hdr is None:
+            hdr = readHeader(self.path)
+        # Cards normalized by profile of file (header is left as is, see upgradeHeader())
+        normalizer = normalizerFor(hdr)
+        self.hdr = catalogCards(hdr)
+        self.extra = extraCards(hdr)
+        self.hdr.update((key, value) for (key, value) in normalizer.changes(hdr).items() if key in HDR_KEYS)
         
-        # Make sure must haves (OBJECT, TELESCOP, DATE-OBS) cards  exist 
-        if ('OBJECT' not in self.hdr):
-            logger.debug(f'Who deleted OBJECT from header?: {self.name}')
-            raise ValueError('FITS file must have \'OBJECT\' field')
-        if ('TELESCOP' not in self.hdr):
-            logger.debug(f'Who deleted TELESCOP from header?: {self.name}')
-            raise ValueError('FITS file must have \'TELESCOP\' field')
-        if ('DATE-OBS' not in self.hdr):
-            logger.debug(f'Who deleted DATE-OBS from header?: {self.name}')
-            raise ValueError('FITS file must have \'DATE-OBS\' field')
+        # Make sure must haves (OBJECT, TELESCOP, DATE-OBS for AUKR) cards exist
+        for key in normalizer.required:
+            if key not in self.hdr:
+                logger.debug('Who deleted %s from header?: %s', key, self.name)
+                raise ValueError(f'FITS file must have \'{key}\' field')
 
         # Sets self.date, as 'YYYY-MM-DD' from 'DATE-OBS' in fits header.
         # 'DATE-OBS' must be in form '2000-01-01T23:59:59
         if calc.isDate(self.hdr['DATE-OBS'], format='%Y-%m-%dT%H:%M:%S'):
             self.date = self.hdr['DATE-OBS'].split('T')[0]
         else:
-            logger.debug(f'DATE-OBS is misformatted: {self.name}')
+            logger.debug('DATE-OBS is misformatted: %s', self.name)
             raise ValueError('DATE-OBS is misformatted')
        
         # Set self.ref, as AUKR-REF in fits header, set self.isNew accordingly.
@@ -87,28 +411,91 @@ class FitsFile:
                 self.obsvHash = (self.hash - item)
                 self.isNew = False
             else:
-                logger.debug(f'{date} {ref} contradicts {self.date} {self.name}')
+                logger.debug('%s %s contradicts %s %s', date, ref, self.date, self.name)
                 raise ValueError('Date and Ref mismatch')
             
         # Provided everything went well
-        logger.info(f'Created FitsFile: {self.date} | {self.name}')
+        logger.info('Created FitsFile: %s | %s', self.date, self.name)
+
+
+    @classmethod
+    def fromRow(cls, row, columns):
+        '''Readonly FitsFile from a row of catalog (fits table), file is not
+        read; see card(), header() and open() for what is not in catalog.
+        :param row: row of fits table (e.g. from ObservatoryDB.iterFitsByObsv())
+        :param columns: column names of row, in order
+        :returns: FitsFile object
+        '''
+        values = dict(zip(columns, row))
+        fitsFile = cls.__new__(cls)
+        fitsFile.mode     = 'readonly'
+        fitsFile.path     = values['PATH']
+        fitsFile.name     = os.path.basename(fitsFile.path)
+        fitsFile.hash     = values['HASH']
+        fitsFile.obsvHash = values['OBSV-HASH']
+        fitsFile.isNew    = False
+        # Missing cards were inserted as "NULL"
+        fitsFile.hdr = {key: values[key] for key in HDR_KEYS
+            if (key in values) and (values[key] is not None) and (values[key] != 'NULL')}
+        if 'SIMPLE' in fitsFile.hdr:
+            fitsFile.hdr['SIMPLE'] = bool(fitsFile.hdr['SIMPLE'])
+        # None for rows inserted before EXTRA existed (see ObservatoryDB.backfillExtra())
+        fitsFile.extra = json.loads(values['EXTRA']) if values.get('EXTRA') else None
+        fitsFile.date = str(fitsFile.hdr['DATE-OBS']).split('T')[0]
+        return fitsFile
 
+    def card(self, key, default=None):
+        '''Value of a header card; catalog cards (aukr.omal.const.HDR_KEYS, and
+        others kept in EXTRA) are at hand, the rest is read from file.
+        :param key: header keyword
+        :param default: returned if card does not exist
+        '''
+        if key in self.hdr:
+            return self.hdr[key]
+        if key in HDR_KEYS:
+            return default
+        if (self.extra is not None) and (key not in EXTRA_SKIPPED):
+            return self.extra.get(key, default)
+        return self.header().get(key, default)
 
-    def update(self, newHash):
+    def update(self, newHash, cards=None):
         '''Requires self.mode='update'. Fits header is rendered archive-ready;
         unless was archived ("AUKR-REF" in header). New fits headers upgraded in
-        the process
+        the process. File is closed afterwards.
+        :param cards: upgrade cards computed beforehand (see upgradeScript())
         :returns: True if succeeds
         '''
         if self.mode != 'update':
-            logger.debug(f'Couldn\'t update header (readonly): {self.path}')
+            logger.debug('Couldn\'t update header (readonly): %s', self.path)
             return False
 
         if not self.isNew:
-            logger.debug(f'Couldn\'t update header (AUKR-REF field exists): {self.path}')
+            logger.debug('Couldn\'t update header (AUKR-REF field exists): %s', self.path)
             return True
         # Right now: self.ref=None and self.isNew=True, see parseRef if in doubt
+        try:
+            if not self.upgradeHeader(newHash, self.header(), cards):
+                return False
+
+            # Save changes to file (closing flushes them)
+            with metrics.stage('flush', self.obsvName(), nbytes=os.path.getsize(self.path)):
+                self.close()
+        finally:
+            # not kept open in any case
+            self.close()
 
+        logger.info('Updated FitsFile: %s %s', self.date, self.name)
+        return True
+
+    def upgradeHeader(self, newHash, hdr, cards=None):
+        '''Renders a header archive-ready (normalized, upgraded, AUKR-REF added)
+        without writing into file; see update(), or aukr.omal.pipeline where
+        files are written elsewhere. self.hdr is refreshed from it.
+        :param newHash: hash given by Obsv
+        :param hdr: astropy.io.fits.Header (full header) of this file
+        :param cards: upgrade cards computed beforehand (see upgradeScript())
+        :returns: True if succeeds
+        '''
         # Proper way of importing with validation is bellow:
         #(newDate, newItem) = calc.validDateAndItem(calc.ref(newHash))
         # However only Obsv objects interract with FitsFile
@@ -119,92 +506,86 @@ class FitsFile:
             self.hash     = newHash
             self.obsvHash = (self.hash - newItem)
         else:
-            logger.debug(f'hdr not updated({calc.dateAndItem(newHash)[0]}|{newHash} contradicts {self.date}|{self.name})')
+            logger.debug('hdr not updated(%s|%s contradicts %s|%s)', calc.dateAndItem(newHash)[0], newHash, self.date, self.name)
             return False
-        
-        isUpgraded = ''
-        if self.upgradeScript():
-            isUpgraded = 'Upgraded'
+
+        with metrics.stage('upgrade', self.obsvName()):
+            for (key, value) in normalizerFor(hdr).changes(hdr).items():
+                hdr[key] = value
+            if self.upgradeScript(hdr, cards):
+                logger.debug('Upgraded header: %s %s', self.date, self.name)
         
         # Add card for ref, and set
-        self.hdr.append('AUKR-REF')
-        self.hdr.set('AUKR-REF', value=calc.ref(self.hash), comment='file reference in Ankara University')
+        hdr.append('AUKR-REF')
+        hdr.set('AUKR-REF', value=calc.ref(self.hash), comment='file reference in Ankara University')
+        self.hdr = catalogCards(hdr)
+        self.extra = extraCards(hdr)
+        return True
+
+    def obsvName(self):
+        '''Observation's folder name, for metrics (file is in obsvDir/branch/)
+        '''
+        return os.path.basename(os.path.dirname(os.path.dirname(self.path)))
 
-        # Save changes to file (hdul closed after getting out of scope,
-        # for explicitly closing: fits.HDUList.close(self.hdul) )
-        fits.HDUList.flush(self.hdul)
+    def open(self):
+        '''Opens file with self.mode, through bounded cache of handles (see
+        HandleCache); do not close returned HDUList, use close()
+        :returns: astropy.io.fits.HDUList
+        '''
+        # Catalog rows written before relocation may lack compressed name
+        if (not os.path.exists(self.path)) and os.path.exists(self.path + COMPRESSED_EXT):
+            self.path = self.path + COMPRESSED_EXT
+            self.name = os.path.basename(self.path)
+        return handles.open(self.path, self.mode)
 
-        logger.info(f'Updated ({isUpgraded})  FitsFile: {self.date} {self.name}')
-        return True
+    def header(self):
+        ''':returns: full header of image (astropy.io.fits.Header of open file)
+        '''
+        return imageHDU(self.open()).header
+
+    def close(self):
+        '''Closes file if open (changes are flushed in 'update' mode)
+        '''
+        handles.close(self.path)
+
+    def pixels(self, scaled=True):
+        '''Image of file, memory-mapped and read lazily (see Pixels); unlike
+        open(), not through cache of handles, nothing is loaded into memory.
+        :param scaled: False to leave values as stored (BSCALE/BZERO ignored)
+        :returns: Pixels object
+        '''
+        # Catalog rows written before relocation may lack compressed name
+        if (not os.path.exists(self.path)) and os.path.exists(self.path + COMPRESSED_EXT):
+            self.path = self.path + COMPRESSED_EXT
+            self.name = os.path.basename(self.path)
+        # Changes in 'update' mode (still in open file) would not be seen
+        if self.mode == 'update':
+            self.close()
+        return Pixels(self.path, scaled)
 
     # Built on script originally written by Mirzhalilov and Khuzhakulov (2019 Summer)
     # Keep this method at the end of class for convienience/seperation
-    def upgradeScript(self):
+    def upgradeScript(self, hdr, cards=None):
         '''Script by Mirzhalilov and Khuzhakulov, upgrades observations to
         standard they proposed (2019 Summer Internship). Not applied, if
-        "BJD-TDB or "MIDTIME" keywords present in fits header.
+        "BJD-TDB or "MIDTIME" keywords present in fits header. Cards (BJD-TDB,
+        MIDTIME, LST, and constants of site) are computed by profile of file,
+        see aukr.omal.profile.Normalizer.upgradeCards().
+        :param hdr: astropy.io.fits.Header (full header) to be upgraded in place
+        :param cards: list of (keyword, value, comment) computed beforehand for
+            this file (e.g. in batch, see Obsv.update()), None to compute here
         '''
-        if ('BJD-TDB' in self.hdr) or ('MIDTIME' in self.hdr):
-            logger.debug(f'Already  upgraded: {self.date} {self.name}')
+        if ('BJD-TDB' in hdr) or ('MIDTIME' in hdr):
+            logger.debug('Already  upgraded: %s %s', self.date, self.name)
             return False
 
-        #---Script--Start
-        # Gets the value with the corresponding key
-        JD_UTC   = self.hdr['JD']
-        RA       = self.hdr['OBJCTRA'].split()
-        DEC      = self.hdr['OBJCTDEC'].split()
-        obs_long = self.hdr['SITELONG'].split()
-        obs_lat  = self.hdr['SITELAT'].split()
-
-        # Formatting RA in (h)our, (m)inute, (s)econd format
-        RA = f'{RA[0]}h{RA[1]}m{RA[2]}s'
-        # Formatting DEC in (d)egree, arc(m)inute and arc(s)econd
-        DEC = f'{DEC[0]}d{DEC[1]}m{DEC[2]}s'
-        # Converts obs_long and obs_lat into float
-        obs_long = (((float(obs_long[2]) / 60) + float(obs_long[1])) / 60) + float(obs_long[0])
-        obs_lat = (((float(obs_lat[2]) / 60) + float(obs_lat[1])) / 60) + float(obs_lat[0])
-        # Setting Coordinate of observing object in the sky
-        target = coord.SkyCoord(RA, DEC, frame='icrs')
-        # Setting coordinate of observatory
-        observatory = coord.EarthLocation(obs_long, obs_lat, OBS_ALT)
-        # Creating time object by using JD taken from header which is beginning of observation
-        JD_UTC = time.Time(JD_UTC, format='jd', scale='utc', location=observatory)
-        # Adding half of exposure time to JD in order to calculate time of middle of the observation
-        New_JD = JD_UTC + datetime.timedelta(seconds=float(self.hdr['EXPTIME'])/2)
-        # Converting JD to UTC
-        t_jd = time.Time(New_JD, format='jd', scale='utc')
-        MIDTIME = t_jd.iso
-        # Creating new time by using MIDTIME and Location of the observatory to calculate LST
-        t1 = time.Time(MIDTIME,scale='utc',location=observatory)
-        LST = t1.sidereal_time('mean')
-        # target time difference in the time variable New_JD  between traveling to the centre of solar sytstem and traveling to the earth
-        ltt_bary = New_JD.light_travel_time(target)
-        # Firstly, changing New_JD from UTC unit to TDB and then adding to the time difference that was calculated above
-        time_barycentre = New_JD.tdb + ltt_bary
-        real_bjd = time_barycentre.value
-
-        # Create cards for keywords
-        self.hdr.append('BJD-TDB')
-        self.hdr.append('MIDTIME')
-        self.hdr.append('LST')
-        self.hdr.append('PI')
-        self.hdr.append('PRJTNUM')
-        self.hdr.append('GAIN')
-        self.hdr.append('PSCALE')
-        self.hdr.append('EPOCH')
-        self.hdr.append('RDNOISE')
-
-        # Set new cards created
-        self.hdr.set('BJD-TDB',  value=real_bjd, comment='Dynamic Barycentric Julian Day')
-        self.hdr.set('MIDTIME',  value=MIDTIME , comment='DATE-OBS of Mid Exposure Time in UT')
-        self.hdr.set('LST'    ,  value=str(LST), comment='Local Sidereal Time' )
-        self.hdr.set('PI'     ,                  comment='Principle Investigator')
-        self.hdr.set('PRJTNUM',                  comment='Project Number')
-        self.hdr.set('GAIN'   ,  value=1.5     , comment='e-/count')
-        self.hdr.set('PSCALE' ,  value=0.754   , comment='\'\'/pixel')
-        self.hdr.set('EPOCH'  ,  value=2000.0    )
-        self.hdr.set('RDNOISE',  value=11.5    , comment='e-')
-        #---Script--End
+        if cards is None:
+            cards = normalizerFor(hdr).upgradeCards([hdr])[0]
+        # Create cards for keywords, then set them (value left undefined if None)
+        for (key, value, comment) in cards:
+            hdr.append(key)
+            hdr.set(key, **({} if value is None else {'value': value}),
+                **({} if comment is None else {'comment': comment}))
 
         return True
 #End of FitsFile class
@@ -0,0 +1 @@
+from .fsck import *
@@ -0,0 +1,264 @@
+# Integrity check of archive (fsck): catalog rows, archived directories and
+# AUKR-REF cards of archived files must agree. Checks are incremental, size
+# and mtime of each file verified are kept in database (table TABLE_FSCK), and
+# files unchanged since are not read again (unless full). Headers (checksums
+# too, if asked for) are read on a process pool; the rest is catalog lookups
+# and directory listings.
+import os, glob, time, hashlib
+from concurrent.futures import ProcessPoolExecutor
+from .. import calc, filesys, journal
+from ..log import getLogger, configureWorker
+from ..args import args
+from ..fitsfile import readHeader
+from ..sqlitedb import archiveDB, addSchema
+from ..const import TABLE_FSCK, TABLE_OBSV, TABLE_FITS, BIAS_DIR, DARK_DIR, FLAT_DIR,\
+    OBJCT_DIR, MAX_CONTROL_ITEM, COMPRESSED_EXT
+
+# Create module's logger
+logger = getLogger(__name__)
+
+CHUNK_SIZE = 1024*1024 # bytes read at once for checksums
+
+# Kinds of issues reported, and what repair does about them
+ISSUES = {
+    'missing-directory': 'obsv row without archived directory (repair: rows deleted)',
+    'stale-path':        'PATH of row is not where it is archived (repair: PATH updated)',
+    'orphan-row':        'fits row without obsv row (repair: row deleted)',
+    'missing-file':      'fits row without archived file (repair: row deleted)',
+    'ref-mismatch':      'AUKR-REF card of file differs from ref of its row',
+    'unreadable':        'file cannot be read as FITS',
+    'modified':          'content differs from checksum recorded (repair: checksum recorded)',
+    'orphan-directory':  'archived directory without obsv row',
+    'orphan-file':       'file in archived directory without fits row',
+    'interrupted':       'import interrupted midway, see recover.py'
+}
+
+
+def createTable():
+    '''Creates table of verified files (named TABLE_FSCK) unless exists
+    :returns: True if successful
+    '''
+    try:
+        archiveDB.conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {TABLE_FSCK} (\n'
+            f'"PATH" TEXT PRIMARY KEY\n'    # archived file
+            f',"HASH" INTEGER NOT NULL\n'   # FitsFile hash it was verified for
+            f',"SIZE" INTEGER NOT NULL\n'
+            f',"MTIME" REAL NOT NULL\n'
+            f',"CHECKSUM" TEXT\n'           # SHA-256, NULL unless --checksum
+            f',"VERIFIED" REAL NOT NULL\n'  # time of verification (epoch)
+            f');'
+        )
+        archiveDB.conn.commit()
+        return True
+    except Exception as e:
+        logger.warning(f'{e}')
+        return False
+
+
+def relocate(oldRoot, newRoot):
+    '''Keeps files of a moved observation directory verified (see
+    aukr.omal.functions.migrateLayout)
+    :param oldRoot: absolute path of observation directory before
+    :param newRoot: absolute path of observation directory after
+    '''
+    archiveDB.conn.execute(
+        f'UPDATE {TABLE_FSCK} SET "PATH" = ? || substr("PATH", ?) WHERE substr("PATH", 1, ?) = ?;',
+        (newRoot, len(oldRoot) + 1, len(oldRoot) + 1, oldRoot + '/')
+    )
+    archiveDB.conn.commit()
+
+
+def checkFile(path, checksum=False):
+    '''Reads AUKR-REF card (and checksum) of an archived file. Module-level, so
+    it can run on a process pool.
+    :param path: path of archived file (.fit or .fit.fz)
+    :param checksum: True to compute SHA-256 of file content
+    :returns: dict (path, ref, checksum, error)
+    '''
+    result = {'path': path, 'ref': None, 'checksum': None, 'error': None}
+    try:
+        result['ref'] = readHeader(path).get('AUKR-REF')
+        if checksum:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as fitsFile:
+                for chunk in iter(lambda: fitsFile.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            result['checksum'] = digest.hexdigest()
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+    return result
+
+
+def archivedPath(path):
+    ''':param path: path of an archived file, as in catalog
+    :returns: path of file on disk (catalog might omit COMPRESSED_EXT), None if missing
+    '''
+    for candidate in [path, path + COMPRESSED_EXT]:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def checkArchive(workers=None, checksum=False, full=False, repair=False):
+    '''Checks archive (args.archdir) against catalog, see ISSUES.
+    :param workers: size of process pool reading files (None for cpu count)
+    :param checksum: True to compare content checksums as well
+    :param full: True to verify all files, not only those changed since last check
+    :param repair: True to fix what can be fixed in catalog (see ISSUES);
+        archived files are never modified or removed
+    :returns: dict report {'archdir', 'files', 'verified', 'issues', 'ok'}
+    '''
+    archDir = os.path.abspath(filesys.archDir())
+    issues = []
+    def report(kind, ref, path, detail=''):
+        issue = {'kind': kind, 'ref': ref, 'path': path, 'detail': detail, 'repaired': False}
+        issues.append(issue)
+        logger.info(f'{kind}: {ref} {path} {detail}')
+        return issue
+
+    # Observations being imported are left alone
+    pendingHashes = {journal.slotOf(path) for path in journal.pending()} - {None}
+    obsvRows = {hash: (date, path) for (hash, date, path) in
+        archiveDB.conn.execute(f'SELECT "HASH", "DATE", "PATH" FROM {TABLE_OBSV};')}
+    obsvDirs = {}
+    for dirPath in filesys.listArchObsv():
+        dirPath = os.path.abspath(dirPath)
+        dirRef = dirPath.rsplit('_', 1)[-1]
+        try:
+            calc.validDateAndItem(dirRef)
+        except ValueError:
+            report('orphan-directory', None, dirPath, 'name does not end with a ref')
+            continue
+        if dirPath not in map(os.path.abspath, filesys.archObsvCandidates(calc.hash(dirRef))):
+            report('orphan-directory', dirRef, dirPath, 'not where its ref places it')
+            continue
+        obsvDirs.setdefault(calc.hash(dirRef), []).append(dirPath)
+
+    for (obsvHash, dirPaths) in obsvDirs.items():
+        if (obsvHash not in obsvRows) and (obsvHash not in pendingHashes):
+            for dirPath in dirPaths:
+                report('orphan-directory', calc.ref(obsvHash), dirPath)
+
+    # Where files of each observation are (catalog rows) vs. where they should be
+    staleObsv  = {}   # obsv hash -> (directory, [(fits hash, path)])
+    dropHashes = []   # obsv hashes whose rows go (no directory)
+    dropFits   = []   # fits hashes whose rows go
+    expected   = {}   # path on disk -> fits hash
+    for (obsvHash, (date, rowPath)) in sorted(obsvRows.items()):
+        obsvRef = calc.ref(obsvHash)
+        if obsvHash in pendingHashes:
+            report('interrupted', obsvRef, rowPath)
+            continue
+        dirPaths = obsvDirs.get(obsvHash, [])
+        if not dirPaths:
+            report('missing-directory', obsvRef, rowPath)
+            dropHashes.append(obsvHash)
+            continue
+        obsvDir = dirPaths[0]
+        filePaths = []
+        for (fitsHash, path) in archiveDB.iterFitsByObsv(obsvHash, '"HASH", "PATH"'):
+            # Reserved item numbers per branch (see aukr.omal.const)
+            j = min((fitsHash - obsvHash - 1) // MAX_CONTROL_ITEM, 3)
+            branch = [BIAS_DIR, DARK_DIR, FLAT_DIR, OBJCT_DIR][j]
+            diskPath = archivedPath(f'{obsvDir}/{branch}/{os.path.basename(path)}')
+            if diskPath is None:
+                report('missing-file', calc.ref(fitsHash), path)
+                dropFits.append(fitsHash)
+                continue
+            expected[diskPath] = fitsHash
+            if diskPath != path:
+                filePaths.append((fitsHash, diskPath))
+        if (rowPath != obsvDir) or filePaths:
+            report('stale-path', obsvRef, rowPath, f'archived in {obsvDir} ({len(filePaths)} file rows stale)')
+            staleObsv[obsvHash] = (obsvDir, filePaths)
+
+        # Files nobody refers to
+        for branch in [BIAS_DIR, DARK_DIR, FLAT_DIR, OBJCT_DIR]:
+            for path in sorted(glob.glob(f'{obsvDir}/{branch}/*.fit') + glob.glob(f'{obsvDir}/{branch}/*.fit{COMPRESSED_EXT}')):
+                if path not in expected:
+                    report('orphan-file', obsvRef, path)
+
+    for (fitsHash, path) in archiveDB.conn.execute(
+        f'SELECT "HASH", "PATH" FROM {TABLE_FITS} WHERE "OBSV-HASH" NOT IN (SELECT "HASH" FROM {TABLE_OBSV});'
+    ).fetchall():
+        report('orphan-row', calc.ref(fitsHash), path)
+        dropFits.append(fitsHash)
+
+    # Files changed since last verified (by size, mtime) are read again
+    state = {path: (hash, size, mtime, digest) for (path, hash, size, mtime, digest) in
+        archiveDB.conn.execute(f'SELECT "PATH", "HASH", "SIZE", "MTIME", "CHECKSUM" FROM {TABLE_FSCK};')}
+    stats = {}
+    toVerify = []
+    for (path, fitsHash) in expected.items():
+        stat = os.stat(path)
+        stats[path] = (stat.st_size, stat.st_mtime)
+        recorded = state.get(path)
+        if (full or (recorded is None) or (recorded[0] != fitsHash)
+            or ((recorded[1], recorded[2]) != stats[path]) or (checksum and recorded[3] is None)):
+            toVerify.append(path)
+    logger.info(f'Verifying {len(toVerify)} of {len(expected)} files')
+
+    verified = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=configureWorker,
+        initargs=(args.current(),)) as pool:
+        results = pool.map(checkFile, toVerify, [checksum]*len(toVerify), chunksize=32)
+        for result in results:
+            path = result['path']
+            fitsHash = expected[path]
+            recorded = state.get(path)
+            digest = result['checksum'] if checksum else (recorded[3] if recorded else None)
+            if result['error']:
+                report('unreadable', calc.ref(fitsHash), path, result['error'])
+                continue
+            if result['ref'] != calc.ref(fitsHash):
+                report('ref-mismatch', calc.ref(fitsHash), path, f'AUKR-REF={result["ref"]}')
+                continue
+            if checksum and recorded and recorded[3] and (recorded[3] != digest):
+                issue = report('modified', calc.ref(fitsHash), path, f'checksum {recorded[3]} -> {digest}')
+                if not repair:
+                    # keeps being reported until repaired (accepted)
+                    continue
+                issue['repaired'] = True
+            verified.append((path, fitsHash, *stats[path], digest, time.time()))
+
+    # Verified files recorded, those gone from archive forgotten
+    archiveDB.conn.executemany(
+        f'INSERT OR REPLACE INTO {TABLE_FSCK} VALUES (?, ?, ?, ?, ?, ?);', verified
+    )
+    archiveDB.conn.executemany(
+        f'DELETE FROM {TABLE_FSCK} WHERE "PATH" = ?;', [(path,) for path in state if path not in expected]
+    )
+    archiveDB.conn.commit()
+
+    if repair:
+        repaired = set()
+        if dropHashes and archiveDB.deleteObsvByHashes(dropHashes):
+            repaired |= {calc.ref(hash) for hash in dropHashes}
+        for (obsvHash, (obsvDir, filePaths)) in staleObsv.items():
+            if archiveDB.relocateObsv(obsvHash, obsvDir, filePaths):
+                repaired.add(calc.ref(obsvHash))
+        if dropFits:
+            archiveDB.conn.executemany(
+                f'DELETE FROM {TABLE_FITS} WHERE "HASH" = ?;', [(hash,) for hash in dropFits]
+            )
+            archiveDB.conn.commit()
+            repaired |= {calc.ref(hash) for hash in dropFits}
+        for issue in issues:
+            if (issue['kind'] in ['missing-directory', 'stale-path', 'orphan-row', 'missing-file']
+                and issue['ref'] in repaired):
+                issue['repaired'] = True
+
+    unrepaired = [issue for issue in issues if not issue['repaired']]
+    if unrepaired:
+        logger.warning(f'{len(unrepaired)} issue(s) in archive: {archDir}')
+    return {
+        'archdir':  archDir,
+        'files':    len(expected),
+        'verified': len(toVerify),
+        'issues':   issues,
+        'ok':       not unrepaired
+    }
+
+
+addSchema(createTable, f'Table "{TABLE_FSCK}" could not be created')
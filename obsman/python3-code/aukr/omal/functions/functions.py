@@ -1,33 +1,45 @@
-import os, glob
+import os, glob, json, shutil, concurrent.futures
 from ..args import args
 from ..obsv import Obsv
-from ..const import MAX_ITEM_PER_DAY
-from .. import filesys, calc, sqlitedb, log
+from ..const import MAX_ITEM_PER_DAY, REF_LENGTH
+from .. import filesys, calc, sqlitedb, log, journal, scheduler, pipeline, fsck, summary
+from ..fitsfile import readExtra
+from ..metrics import metrics
 
 # Create module's logger
 logger = log.getLogger(__name__)
 
+# Summaries are kept by triggers along with rows written through functions
+summary.register()
+
 def cleanup():
-    '''Removes all files/folders in archdir/tmp
+    '''Removes all files/folders in archdir/tmp (but those of interrupted imports)
     '''
     log.heading1('cleanup', logger)
-    filesys.cleanTmp()
-    logger.info(f'Cleaned: {os.path.abspath(filesys.TMP_DIR)}')
+    with metrics.stage('cleanup', files=0):
+        filesys.cleanTmp()
+    logger.info(f'Cleaned: {os.path.abspath(filesys.tmpDir())}')
 
-def getTmpObsvList(mode='readonly'):
-    '''Clone new observation folders into aukr.omt.filesys.TMP_DIR
+def getTmpObsvList(mode='readonly', importDir=''):
+    '''Clone new observation folders into aukr.omt.filesys.tmpDir(). Interrupted
+    imports (see aukr.omal.journal) are included, to be resumed.
     :param mode: Sets Obsv objects' mode members, choose 'readonly' or 'update'.
+    :param importDir: (optional) directory of new observations, default args.importdir
     :returns: list of (temporary) Obsv objects from archdir/tmp folder
     '''
     log.heading1('getTempObsvList', logger)
     # list of new-observation paths from temporary directory
-    importPathList = sorted(glob.glob(f'{args.importdir}/*-*-*'))
+    importPathList = sorted(glob.glob(f'{importDir if importDir else args.importdir}/*-*-*'))
     #log paths catched up
     logger.debug(f'To be imported: {[os.path.basename(path) for path in importPathList]}')
     #copy subfolders to archive/tmp then return Obsv object list out of them
     #return [Obsv(path, mode=mode) for path in filesys.copyToTmp(importPathList)]
     try:
-        return [Obsv(path, mode='update') for path in (importPathList if args.nocopy else filesys.copyToTmp(importPathList))]
+        pathList = importPathList if args.nocopy else filesys.copyToTmp(importPathList)
+        # Interrupted ones whose originals are not in import directory anymore
+        pathList += [path for path in journal.pending()
+            if os.path.isdir(path) and path not in [os.path.abspath(p) for p in pathList]]
+        return [Obsv(path, mode='update') for path in pathList]
     except ValueError:
         return None
 
@@ -36,9 +48,11 @@ def tmpToArch(tmpObsvList):
     '''Inserts Obsv object (returned by getTmpObsvList) from archdir/tmp into database,
     then moves folders in archdir/tmp into archdir (appends ref e.g. '_ABC123')
     :param tmpObsvList: list of (temporary) Obsv objects from archdir/tmp folder
+    :returns: list of Obsv objects moved into archdir
     '''
     log.heading1('tmpToArch', logger)
     logger.debug(f'To be imported: {[tmpObsv.name for tmpObsv in tmpObsvList]}')
+    imported = []
     for tmpObsv in tmpObsvList:
         log.heading2('tmpToArch', logger)
         logger.debug(f'Try insert: {tmpObsv.path}')
@@ -46,26 +60,203 @@ def tmpToArch(tmpObsvList):
             try:
                 logger.debug(f'Try move: {tmpObsv.path}')
                 filesys.moveToArchive(tmpObsv)
+                tmpObsv.relocate()
+                journal.record(tmpObsv.path, 'move', tmpObsv.hash)
+                journal.finish(tmpObsv.path)
+                imported.append(tmpObsv)
                 logger.warning(f'Moved into {args.archdir}: {tmpObsv.name}')
             except FileExistsError:
                 logger.warning(f'Probable database reconstruction from original observation (ignore otherwise): {tmpObsv.name}')
                 logger.warning(f'Observation already in archdir, remove before updating: {tmpObsv.name}_{calc.ref(tmpObsv.hash)}')
+                # Not a partial move: rows undone and journal closed, so that
+                # no later import resumes it (removing the existing directory)
+                sqlitedb.archiveDB.deleteObsvByHashes([tmpObsv.hash])
+                journal.finish(tmpObsv.path)
         else:
             logger.debug(f'Could not insert: {tmpObsv.name}')
+    return imported
+
+
+def importConcurrently(importDir='', jobs=None, maxPending=None):
+    '''Alternative to getTmpObsvList() followed by tmpToArch(): several
+    observations are copied, parsed, updated and moved at once on worker
+    processes, while database is written by this process only (see
+    aukr.omal.scheduler). Interrupted imports are included, to be resumed.
+    :param importDir: (optional) directory of new observations, default args.importdir
+    :param jobs: number of worker processes, default args.jobs (0 for number of cpus)
+    :param maxPending: most observations in progress at once, default
+        args.maxpending (0 for 2*jobs)
+    :returns: list of Obsv objects moved into archdir
+    '''
+    log.heading1('importConcurrently', logger)
+    jobs = args.jobs if jobs is None else jobs
+    maxPending = args.maxpending if maxPending is None else maxPending
+    importPathList = sorted(glob.glob(f'{importDir if importDir else args.importdir}/*-*-*'))
+    logger.debug(f'To be imported: {[os.path.basename(path) for path in importPathList]}')
+    # Where they are imported from (copies in archdir/tmp, unless --no-copy)
+    placedPathList = [os.path.abspath(path if args.nocopy else f'{filesys.tmpDir()}/{os.path.basename(path)}')
+        for path in importPathList]
+    pendingPathList = [path for path in journal.pending()
+        if os.path.isdir(path) and path not in placedPathList]
+    return scheduler.ingest(importPathList, pendingPathList, jobs, maxPending, copy=not args.nocopy)
+
+
+def importPipelined(importDir='', depth=None, compress=None):
+    '''Alternative to getTmpObsvList() followed by tmpToArch(): files of each
+    observation are streamed through pipeline stages, straight from import
+    directory into archdir (see aukr.omal.pipeline). Interrupted imports are
+    resumed first, as tmpToArch() does.
+    :param importDir: (optional) directory of new observations, default args.importdir
+    :param depth: size of queues between stages, default args.queuedepth
+    :param compress: 'none' or key of aukr.omal.const.COMPRESS_TYPES, default args.compress
+    :returns: list of names of observations moved into archdir
+    '''
+    log.heading1('importPipelined', logger)
+    depth = args.queuedepth if depth is None else depth
+    compress = args.compress if compress is None else compress
+    tmpToArch([Obsv(path, mode='update') for path in journal.pending() if os.path.isdir(path)])
+    importPathList = sorted(glob.glob(f'{importDir if importDir else args.importdir}/*-*-*'))
+    logger.debug(f'To be imported: {[os.path.basename(path) for path in importPathList]}')
+    return [os.path.basename(path) for path in importPathList
+        if pipeline.ObsvPipeline(path, depth, compress).run()]
+
+
+def importObsv(path):
+    '''Imports a single new observation directory, as import.py does for all
+    (e.g. as soon as it lands, see aukr.omal.watch); with --pipeline, through
+    aukr.omal.pipeline. Duplicates of archived observations are told from
+    headers of the original, before anything is copied.
+    :param path: path of new observation directory (YYYY-MM-DD)
+    :returns: True if moved into archdir
+    '''
+    log.heading1('importObsv', logger)
+    try:
+        tmpPath = path if args.nocopy else f'{filesys.tmpDir()}/{os.path.basename(path)}'
+        # Interrupted import may have rows already, it is resumed instead
+        if journal.slotOf(os.path.abspath(tmpPath)) is None:
+            obsv = Obsv(path)
+            if obsv.fitsTree and (obsv.duplicateOf() is not None):
+                return False
+        if args.pipeline:
+            return pipeline.ObsvPipeline(path, args.queuedepth, args.compress).run()
+        if not args.nocopy:
+            tmpPath = filesys.copyToTmp([path])[0]
+        return bool(tmpToArch([Obsv(tmpPath, mode='update')]))
+    except ValueError:
+        logger.warning(f'Not an observation directory: {path}')
+        return False
 
 
-def getArchObsvList(mode='readonly'):
-    '''Re-parses archived observations in archdir.
+def recoverImports(discard=False):
+    '''Finishes (resumes) or undoes imports interrupted midway, as recorded in
+    aukr.omal.journal.
+    :param discard: if True, undoes instead: rows deleted, archived (partial)
+        directory and temporary copy removed. Headers updated in place
+        (--no-copy) keep their AUKR-REF, which is reported.
+    :returns: list of dicts (path, ref, steps, action) one per interrupted import
+    '''
+    log.heading1('recoverImports', logger)
+    reports = []
+    for path in journal.pending():
+        recorded = journal.steps(path)
+        hash = recorded.get('slot')
+        report = {
+            'path':    path,
+            'ref':     calc.ref(hash) if hash is not None else None,
+            'steps':   [step for step in journal.STEPS if step in recorded],
+            'headers': len(recorded.get('header', {})),
+            'action':  None
+        }
+        archPaths = filesys.getArchPathsByRef(report['ref']) if hash is not None else []
+
+        if discard:
+            if hash is not None:
+                sqlitedb.archiveDB.deleteObsvByRef(report['ref'])
+            for archPath in archPaths:
+                shutil.rmtree(archPath)
+            # Temporary copy can go, originals in import directory cannot
+            if os.path.abspath(os.path.dirname(path)) == os.path.abspath(filesys.tmpDir()):
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                report['action'] = 'discarded'
+            else:
+                report['action'] = f'discarded ({report["headers"]} files keep AUKR-REF, replace them with originals)'
+            journal.finish(path)
+        elif os.path.isdir(path):
+            tmpToArch([Obsv(path, mode='update')])
+            report['action'] = 'failed' if journal.steps(path) else 'resumed'
+        elif ('rows' in recorded) and archPaths:
+            # Interrupted right after moving, nothing left to do
+            journal.finish(path)
+            report['action'] = 'completed'
+        else:
+            report['action'] = 'source missing (use discard)'
+
+        logger.warning(f'Interrupted import {report["action"]}: {path}')
+        reports.append(report)
+    return reports
+
+
+def getArchObsvList(mode='readonly', fromCatalog=True):
+    '''Archived observations, from catalog (readonly, no file read) or by
+    re-parsing observations in archdir.
     :param mode: Sets Obsv objects' mode members, choose 'readonly' or 'update'.
+        'update' always re-parses.
+    :param fromCatalog: False to re-parse archdir even for readonly
     :returns: list of Obsv objects from archdir folder
     '''
     log.heading2('getArchObsvList', logger)
+    if fromCatalog and (mode == 'readonly'):
+        hashList = [row[0] for row in sqlitedb.archiveDB.queryHashRange('HASH', 0, 16**REF_LENGTH)]
+        logger.debug(f'ArchObsv (catalog): {[calc.ref(hash) for hash in hashList]}')
+        return [Obsv.fromCatalog(hash) for hash in hashList]
     # list of archived-observation paths from archdir
-    archPathList = sorted(glob.glob(f'{args.archdir}/*-*-*_*'))
+    archPathList = filesys.listArchObsv()
     # log paths catched up
     logger.debug(f'ArchObsv: {[os.path.basename(path) for path in archPathList]}')
     return [Obsv(path, mode=mode) for path in archPathList]
 
+def migrateLayout(layout=None):
+    '''Moves archived observations into given layout (see
+    aukr.omal.filesys.archObsvPath()) while archive stays in use: one at a time, each
+    directory is renamed (atomic) and its catalog rows updated right after.
+    Observations are found in either layout meanwhile; if interrupted, run
+    again.
+    :param layout: 'flat' or 'sharded', default args.layout
+    :returns: list of paths of observation directories moved (new paths)
+    '''
+    log.heading1('migrateLayout', logger)
+    layout = args.layout if layout is None else layout
+    archDir = os.path.abspath(args.archdir)
+    pendingHashes = {journal.slotOf(path) for path in journal.pending()} - {None}
+    moved = []
+    for srcPath in filesys.listArchObsv():
+        srcPath = os.path.abspath(srcPath)
+        obsvRef = srcPath.rsplit('_', 1)[-1]
+        try:
+            calc.validDateAndItem(obsvRef)
+        except ValueError:
+            logger.warning(f'Not an archived observation, left as is: {srcPath}')
+            continue
+        obsvHash = calc.hash(obsvRef)
+        dstPath = os.path.abspath(filesys.archObsvPath(obsvHash, layout))
+        if (srcPath == dstPath) or (obsvHash in pendingHashes):
+            continue
+        if os.path.exists(dstPath):
+            logger.warning(f'Already in {layout} layout as well, left as is: {srcPath}')
+            continue
+        os.makedirs(os.path.dirname(dstPath), exist_ok=True)
+        os.rename(srcPath, dstPath)
+        sqlitedb.archiveDB.moveObsvPaths(obsvHash, srcPath, dstPath)
+        fsck.relocate(srcPath, dstPath)
+        # Shards (YYYY/MM) emptied by moving out
+        for shardDir in [os.path.dirname(srcPath), os.path.dirname(os.path.dirname(srcPath))]:
+            if (shardDir != archDir) and shardDir.startswith(archDir + '/') and not os.listdir(shardDir):
+                os.rmdir(shardDir)
+        moved.append(dstPath)
+        logger.info(f'Moved: {srcPath} -> {dstPath}')
+    return moved
+
 # Remove Obsv objects from both database and filesystem
 def removeFromArch(obsvList):
     '''Removes Obsv objects provided, from both database and filesystem
@@ -93,10 +284,12 @@ def getHashListByDate(startDate, endDate=''):
                 upperHash = calc.itemZeroHash(endDate) + MAX_ITEM_PER_DAY
             else:
                 logger.warning(f'End date is not valid: {endDate}')
+                return []
         else:
             upperHash = lowerHash + MAX_ITEM_PER_DAY
     else:
         logger.warning(f'Start date is not valid: {startDate}')
+        return []
 
     # return HASHes which fall in the time period
     return [rowResult[0] for rowResult in sqlitedb.archiveDB.queryHashRange('HASH', lowerHash, upperHash)]
@@ -106,6 +299,58 @@ def removeObsvByRef(ref):
     '''Removes observation from both filesystem and database
     :returns: True if succesful
     '''
-    if (filesys.removeFromArchByRef(ref) and sqlitedb.archiveDB.deleteObsvByRef(ref)):
+    if removeObsvByHashes([calc.hash(ref)]):
         return True
-    
+
+def removeObsvByHashes(hashList, wait=True):
+    '''Removes observations from both database and filesystem, many at once
+    (e.g. hashes from getHashListByDate()): rows are deleted in one
+    transaction, directories (looked up in catalog) on background threads.
+    :param hashList: hashes of archived observations to be removed
+    :param wait: False to return before directories are removed
+    :returns: list of refs removed, those which had rows or directories (empty
+        if database could not be updated); directories are counted as removed
+        once scheduled, unless wait
+    '''
+    log.heading1('removeObsvByHashes', logger)
+    pathsByHash = filesys.getArchPathsByHashes(hashList)
+    removed = sqlitedb.archiveDB.hashesInCatalog(hashList)
+    if not sqlitedb.archiveDB.deleteObsvByHashes(hashList):
+        return []
+    hashPaths = [(obsvHash, path) for (obsvHash, paths) in pathsByHash.items() for path in paths]
+    futures = filesys.removeInBackground([path for (obsvHash, path) in hashPaths])
+    for ((obsvHash, path), future) in zip(hashPaths, futures):
+        if (not wait) or future.result():
+            removed.add(obsvHash)
+            logger.debug(f'Removed: {calc.ref(obsvHash)} {os.path.basename(path)}')
+    missing = [calc.ref(obsvHash) for obsvHash in pathsByHash if obsvHash not in removed]
+    if missing:
+        logger.warning(f'Not in archive (no rows, nor directory): {missing}')
+    return [calc.ref(obsvHash) for obsvHash in pathsByHash if obsvHash in removed]
+
+def backfillExtra(workers=None):
+    '''Fills EXTRA column (other cards, as JSON) of rows inserted before it
+    existed; headers are read once, on a process pool
+    :param workers: size of process pool, default args.workers (cpu count if
+        that is None)
+    :returns: dict {'filled': count, 'missing': paths not read}
+    '''
+    log.heading1('backfillExtra', logger)
+    workers = args.workers if workers is None else workers
+    rows = sqlitedb.archiveDB.queryFitsWithoutExtra()
+    # Catalog might omit COMPRESSED_EXT of archived files
+    pathsByHash = {hash: fsck.archivedPath(path) or path for (hash, path) in rows}
+    hashByPath = {path: hash for (hash, path) in pathsByHash.items()}
+    filled = []
+    missing = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=log.configureWorker,
+        initargs=(args.current(),)) as pool:
+        for (path, extra) in pool.map(readExtra, list(hashByPath), chunksize=32):
+            if extra is None:
+                missing.append(path)
+                continue
+            filled.append((json.dumps(extra, separators=(',', ':')), hashByPath[path]))
+    if not sqlitedb.archiveDB.updateExtra(filled):
+        return {'filled': 0, 'missing': missing}
+    logger.info(f'EXTRA filled for {len(filled)} rows, {len(missing)} files not read')
+    return {'filled': len(filled), 'missing': missing}
@@ -0,0 +1 @@
+from .journal import *
\ No newline at end of file
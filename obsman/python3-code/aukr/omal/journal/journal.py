@@ -0,0 +1,95 @@
+# Write-ahead journal of import steps, kept in archive database (table
+# TABLE_JOURNAL). Each observation being imported is keyed by its path (in
+# archdir/tmp, or import directory with --no-copy). Steps in order:
+#   'slot'   -- Obsv hash allocated, recorded before any header is touched
+#   'header' -- a file's header updated (AUKR-REF written), one per file
+#   'rows'   -- obsv and fits rows inserted (committed)
+#   'move'   -- observation moved into archdir
+# Entries of an observation are removed once it is completely imported; any
+# left over belong to an interrupted import, which is resumed from there.
+from ..log import getLogger
+from ..const import TABLE_JOURNAL
+from ..sqlitedb import archiveDB, addSchema
+
+# Create module's logger
+logger = getLogger(__name__)
+
+STEPS = ['slot', 'header', 'rows', 'move']
+
+
+def createTable():
+    '''Creates journal table (named TABLE_JOURNAL) unless exists
+    :returns: True if successful
+    '''
+    try:
+        archiveDB.conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {TABLE_JOURNAL} (\n'
+            f'"OBSV" TEXT NOT NULL\n'       # path of observation being imported
+            f',"STEP" TEXT NOT NULL\n'      # one of STEPS
+            f',"ITEM" TEXT NOT NULL\n'      # file path for 'header', '' otherwise
+            f',"HASH" INTEGER NOT NULL\n'   # Obsv hash, or FitsFile hash for 'header'
+            f',PRIMARY KEY ("OBSV", "STEP", "ITEM")\n'
+            f');'
+        )
+        archiveDB.conn.commit()
+        return True
+    except Exception as e:
+        logger.warning(f'{e}')
+        return False
+
+
+def record(obsvPath, step, hash, item='', commit=True):
+    '''Records a completed step (committed immediately, unless commit=False)
+    :param obsvPath: absolute path of observation (Obsv.path)
+    :param step: one of STEPS
+    :param hash: Obsv hash (FitsFile hash for 'header')
+    :param item: file path for 'header'
+    :param commit: False to commit along with rows of caller's transaction
+    '''
+    archiveDB.conn.execute(
+        f'INSERT OR REPLACE INTO {TABLE_JOURNAL} VALUES (?, ?, ?, ?);',
+        (obsvPath, step, item, hash)
+    )
+    if commit:
+        archiveDB.conn.commit()
+
+
+def steps(obsvPath):
+    ''':param obsvPath: absolute path of observation (Obsv.path)
+    :returns: dict of recorded steps, step -> hash ('header' -> {file path: hash})
+    '''
+    recorded = {}
+    for (step, item, hash) in archiveDB.conn.execute(
+        f'SELECT STEP, ITEM, HASH FROM {TABLE_JOURNAL} WHERE OBSV = ?;', (obsvPath,)
+    ):
+        if step == 'header':
+            recorded.setdefault('header', {})[item] = hash
+        else:
+            recorded[step] = hash
+    return recorded
+
+
+def slotOf(obsvPath):
+    ''':param obsvPath: absolute path of observation (Obsv.path)
+    :returns: Obsv hash allocated by an interrupted import, None if not any
+    '''
+    return steps(obsvPath).get('slot')
+
+
+def finish(obsvPath):
+    '''Forgets an observation (import completed, or discarded)
+    :param obsvPath: absolute path of observation (Obsv.path)
+    '''
+    archiveDB.conn.execute(f'DELETE FROM {TABLE_JOURNAL} WHERE OBSV = ?;', (obsvPath,))
+    archiveDB.conn.commit()
+
+
+def pending():
+    ''':returns: paths of observations whose import was interrupted
+    '''
+    return [row[0] for row in archiveDB.conn.execute(
+        f'SELECT DISTINCT OBSV FROM {TABLE_JOURNAL} ORDER BY OBSV;'
+    )]
+
+
+addSchema(createTable, f'Table "{TABLE_JOURNAL}" could not be created')
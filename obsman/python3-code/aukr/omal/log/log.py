@@ -1,5 +1,5 @@
-import logging
-from ..args import args
+import logging, logging.handlers, queue, atexit, copy, json
+from ..args import args, active, configureWorker as configureArgs
 
 # in case no --logfile was specified
 try:
@@ -7,53 +7,193 @@ try:
 except:
     logfile = ''
 
-# Logs into console with given level
-# if provided, logs into file with logging.DEBUG level
-# use "logger.warning(), logger.info(), logger.debug()"
-def getLogger(name, consoleLevel=args.verboselevel, logfile=logfile):
-    '''returns logger with streams to console and a logfile(if provided)
-    loglevel for logfile is logging.DEBUG
-    :param consoleLevel: one of logging.[WARNING, INFO, DEBUG]
-    :param logfile: path for logfile
+# Handlers are created once per process (see configure()); loggers only get
+# a QueueHandler, actual writing (console, file) is done by a QueueListener on
+# a background thread, so the caller never waits for disk.
+queueHandler = None
+listener     = None
+# Loggers created by getLogger(), and level needed by logfiles of Archives
+# (see lowerLevel())
+loggers      = []
+neededLevel  = logging.CRITICAL
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    '''QueueHandler leaving formatting (timestamp, file:line, JSON) to handlers
+    on listener's thread. Only the message is merged with its arguments here,
+    as arguments might change after the call.
     '''
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        # written into logfile of Archive in use as well (see ArchiveHandler)
+        record.archive = active.get()
+        # tracebacks cannot wait, frames they refer to go away
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    '''Formats records as single-line JSON objects (structured logs)
+    '''
+    def format(self, record):
+        entry = {
+            'time':    self.formatTime(record),
+            'level':   record.levelname,
+            'logger':  record.name,
+            'file':    record.filename,
+            'line':    record.lineno,
+            'func':    record.funcName,
+            'message': record.getMessage()
+        }
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry)
+
+
+class ArchiveHandler(logging.Handler):
+    '''Hands records to handlers of Archive they were logged in (see
+    aukr.omal.archive), on listener's thread
+    '''
+    def emit(self, record):
+        archive = getattr(record, 'archive', None)
+        for handler in (archive.handlers if archive else []):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+def formatter(jsonFormat=False):
+    ''':returns: formatter of logfile (and of console in debug mode)
+    '''
+    if jsonFormat:
+        return JsonFormatter()
     # includes timestamp at beginning (for extensive debugging or timekeeping)
-    #debugForm = logging.Formatter("%(asctime)s [%(filename)14s:%(lineno)3s %(funcName)14s] %(levelname)-7s %(message)s")
-    debugForm = logging.Formatter("[%(filename)14s:%(lineno)3s %(funcName)14s] %(levelname)-7s %(message)s")
+    #return logging.Formatter("%(asctime)s [%(filename)14s:%(lineno)3s %(funcName)14s] %(levelname)-7s %(message)s")
+    return logging.Formatter("[%(filename)14s:%(lineno)3s %(funcName)14s] %(levelname)-7s %(message)s")
+
+
+def fileHandler(logfile, jsonFormat=False):
+    ''':returns: handler writing into logfile with logging.DEBUG level
+    '''
+    fileHand = logging.FileHandler(logfile)
+    fileHand.setLevel(logging.DEBUG)
+    fileHand.setFormatter(formatter(jsonFormat))
+    return fileHand
+
 
+def configure(consoleLevel=args.verboselevel, logfile=logfile, jsonFormat=args.logjson):
+    '''Creates handlers and starts the background listener, only on first call
+    (later calls return the same handler).
+    :param consoleLevel: one of logging.[WARNING, INFO, DEBUG]
+    :param logfile: path for logfile (logging.DEBUG level), '' for none
+    :param jsonFormat: True for JSON lines (both console and logfile)
+    :returns: QueueHandler to be attached to loggers
+    '''
+    global queueHandler, listener
+    if queueHandler:
+        return queueHandler
+
+    debugForm = formatter(jsonFormat)
+
+    handlers = [ArchiveHandler()]
     # For logfile
     if logfile:  # default args.logfile is ''; (False)
-        fileHand = logging.FileHandler(logfile)
-        fileHand.setLevel(logging.DEBUG)
-        fileHand.setFormatter(debugForm)
-        #fileHand.setLevel(logging.DEBUG)
-        logger.addHandler(fileHand)
+        handlers.append(fileHandler(logfile, jsonFormat))
 
     # For console output
     consoleHand = logging.StreamHandler()
-    if consoleLevel == logging.DEBUG:    
+    if (consoleLevel == logging.DEBUG) or jsonFormat:
         consoleHand.setFormatter(debugForm)
     else:
         consoleHand.setFormatter(logging.Formatter('%(message)s'))
-    #logger.setLevel(consoleLevel)
     consoleHand.setLevel(consoleLevel)
-    logger.addHandler(consoleHand)
-    
+    handlers.append(consoleHand)
+
+    queueHandler = LazyQueueHandler(queue.SimpleQueue())
+    listener = logging.handlers.QueueListener(queueHandler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    # write out whatever is queued before interpreter exits
+    atexit.register(listener.stop)
+    return queueHandler
+
+class DirectQueue:
+    '''Stands in for the queue in worker processes: records are handed to
+    listener's handlers right away, on caller's thread
+    '''
+    def put_nowait(self, record):
+        listener.handle(record)
+
+
+def configureWorker(config=None):
+    '''For worker processes (pool initializer, with initargs=(args.current(),)).
+    Listener thread of parent is not forked along, so records are written
+    synchronously instead of queued; logfile of config (of an Archive) is
+    written as well.
+    :param config: argparse.Namespace of parent, see aukr.omal.args.configureWorker()
+    '''
+    if config is not None:
+        configureArgs(config)
+    configure()
+    queueHandler.queue = DirectQueue()
+    if (config is not None) and config.logfile and (config.logfile != logfile):
+        listener.handlers += (fileHandler(config.logfile, config.logjson),)
+        lowerLevel(logging.DEBUG)
+
+# Logs into console with given level
+# if provided, logs into file with logging.DEBUG level
+# use "logger.warning(), logger.info(), logger.debug()"
+# prefer "logger.debug('%s', value)" over f-strings in loops, message is then
+# built only if some handler is going to write it
+def getLogger(name, consoleLevel=args.verboselevel, logfile=logfile):
+    '''returns logger with streams to console and a logfile(if provided)
+    loglevel for logfile is logging.DEBUG. Handlers are shared and set up by
+    the first call (see configure()).
+    :param consoleLevel: one of logging.[WARNING, INFO, DEBUG]
+    :param logfile: path for logfile
+    '''
+    logger = logging.getLogger(name)
+    handler = configure(consoleLevel, logfile)
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
+    # Lowest level any handler writes; records below are dropped at the call
+    logger.setLevel(min(logging.DEBUG if logfile else consoleLevel, neededLevel))
+    loggers.append(logger)
     return logger
 
+def lowerLevel(level):
+    '''Lets records of given level through loggers created so far, and those
+    created later (e.g. for logfile of an Archive)
+    :param level: one of logging.[WARNING, INFO, DEBUG]
+    '''
+    global neededLevel
+    neededLevel = min(neededLevel, level)
+    for logger in loggers:
+        logger.setLevel(min(logger.level, level))
+
+# Helpers below return before building strings, unless logger writes DEBUG
 def banner(title, logger):
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
     logger.debug('')
     logger.debug(f' //{"%" * 54}\\\\ ')
     logger.debug(f'||{title.center(56, "-")}||')
     logger.debug(f' \\\\{"%" * 54}// ')
 
 def heading1(title, logger):
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
     logger.debug('')
     logger.debug(f'##{title.center(56, "=")}##')
 
 def heading2(title, logger):
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
     logger.debug(f'@{title.center(52, "~")}@'.center(60, ' '))
 
 def heading3(title, logger):
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
     logger.debug(f'>{title.center(46, "-")}<'.center(60, ' '))
@@ -0,0 +1,285 @@
+# Stage timers and counters of import runs (files, bytes, failures and
+# latencies), broken down per observation and per run. Exported as JSON or
+# Prometheus text format, into a file or through an HTTP endpoint.
+# Latencies are kept in fixed histogram buckets, so memory does not grow with
+# the number of files; per-observation breakdown is kept for the most recent
+# observations only (MAX_OBSV), totals of run cover all.
+import json, time, threading
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from ..log import getLogger
+
+# Create module's logger
+logger = getLogger(__name__)
+
+# Stages of import, in order of occurence
+STAGES = ['copy', 'parse', 'upgrade', 'flush', 'insert', 'move', 'cleanup']
+QUANTILES = [0.5, 0.95]
+# Upper bounds (seconds) of latency buckets, 1 ms up to ~2.3 h (~19% apart)
+BUCKETS = [0.001 * 2**(j / 4) for j in range(4 * 24)]
+# Observations whose breakdown is kept (least recently recorded dropped first)
+MAX_OBSV = 1000
+
+
+class Histogram:
+    '''Latencies counted into BUCKETS (and one overflow bucket), sparse
+    '''
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = {}    # bucket index -> count, only those not empty
+        self.count  = 0
+        self.sum    = 0.0
+
+    def add(self, seconds):
+        j = bisect_left(BUCKETS, seconds)
+        self.counts[j] = self.counts.get(j, 0) + 1
+        self.count += 1
+        self.sum   += seconds
+
+    def merge(self, other):
+        for (j, n) in other.counts.items():
+            self.counts[j] = self.counts.get(j, 0) + n
+        self.count += other.count
+        self.sum   += other.sum
+
+    def quantile(self, q):
+        ''':param q: quantile, 0 to 1
+        :returns: estimate (linear within bucket), 0.0 if empty
+        '''
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for j in sorted(self.counts):
+            n = self.counts[j]
+            if seen + n >= rank:
+                if j == len(BUCKETS):
+                    return BUCKETS[-1]
+                lower = BUCKETS[j - 1] if j else 0.0
+                return lower + (BUCKETS[j] - lower) * max(rank - seen, 0) / n
+            seen += n
+        return BUCKETS[-1]
+
+
+class StageStats:
+    '''Counters of a stage (for an observation, or whole run). Latency of a
+    single file goes into fileLatency; of a unit of several files or none (an
+    observation, a directory tree) into unitLatency, so p50/p95 per file are
+    not skewed by them.
+    '''
+    __slots__ = ('seconds', 'files', 'bytes', 'failures', 'fileLatency', 'unitLatency')
+
+    def __init__(self):
+        self.seconds     = 0.0
+        self.files       = 0
+        self.bytes       = 0
+        self.failures    = 0
+        self.fileLatency = Histogram()
+        self.unitLatency = Histogram()
+
+    def add(self, seconds, files, nbytes, failed):
+        self.files += files
+        self.bytes += nbytes
+        if failed:
+            self.failures += 1
+        if seconds is not None:
+            self.seconds += seconds
+            (self.fileLatency if files == 1 else self.unitLatency).add(seconds)
+
+    def merge(self, other):
+        self.seconds  += other.seconds
+        self.files    += other.files
+        self.bytes    += other.bytes
+        self.failures += other.failures
+        self.fileLatency.merge(other.fileLatency)
+        self.unitLatency.merge(other.unitLatency)
+
+    def toDict(self):
+        return {
+            'seconds':  self.seconds,
+            'files':    self.files,
+            'bytes':    self.bytes,
+            'failures': self.failures,
+            'p50':      self.fileLatency.quantile(0.5),
+            'p95':      self.fileLatency.quantile(0.95),
+            'unitP50':  self.unitLatency.quantile(0.5),
+            'unitP95':  self.unitLatency.quantile(0.95)
+        }
+
+
+class Metrics:
+    '''Registry of stage statistics, thread-safe. Module-level instance
+    aukr.omal.metrics.metrics is the one used by the library.
+    '''
+
+    def __init__(self):
+        self.lock   = threading.Lock()
+        self.start  = time.time()
+        self.run    = {}    # stage -> StageStats
+        self.obsv   = OrderedDict() # obsvName -> {stage -> StageStats}, MAX_OBSV at most
+        self.server = None  # HTTP server, see serve()
+
+    def record(self, stage, seconds, obsv='', files=1, nbytes=0, failed=False):
+        '''Records a (timed) unit of work.
+        :param stage: one of STAGES
+        :param seconds: duration, None if not timed
+        :param obsv: name of observation (e.g. Obsv.name), '' if none
+        :param files: number of files processed within duration
+        :param nbytes: number of bytes processed within duration
+        :param failed: True if unit of work failed
+        '''
+        with self.lock:
+            self.run.setdefault(stage, StageStats()).add(seconds, files, nbytes, failed)
+            if obsv:
+                self.stagesOf(obsv).setdefault(stage, StageStats()).add(seconds, files, nbytes, failed)
+
+    def stagesOf(self, obsv):
+        '''Not for stand-alone use (lock held by caller)
+        :param obsv: name of observation
+        :returns: dict of stage -> StageStats of obsv, marked most recent
+        '''
+        stages = self.obsv.setdefault(obsv, {})
+        self.obsv.move_to_end(obsv)
+        while len(self.obsv) > MAX_OBSV:
+            self.obsv.popitem(last=False)
+        return stages
+
+    @contextmanager
+    def stage(self, stage, obsv='', files=1, nbytes=0):
+        '''Times the block within, as a unit of work for stage. Block raising an
+        exception is recorded as failed (exception is not suppressed).
+        e.g.  with metrics.stage('move', obsv.name, files=n): ...
+        '''
+        failed = True
+        start = time.perf_counter()
+        try:
+            yield
+            failed = False
+        finally:
+            self.record(stage, time.perf_counter() - start, obsv, files, nbytes, failed)
+
+    def fail(self, stage, obsv=''):
+        '''Counts a failure which was not raised (e.g. a method returned False)
+        '''
+        self.record(stage, None, obsv, files=0, failed=True)
+
+    def drain(self):
+        '''Takes recorded statistics out of registry, e.g. to hand them from a
+        worker process over to main one (see merge())
+        :returns: tuple (run, obsv) as in members of the same name
+        '''
+        with self.lock:
+            drained = (self.run, self.obsv)
+            self.run  = {}
+            self.obsv = OrderedDict()
+        return drained
+
+    def merge(self, drained):
+        ''':param drained: tuple (run, obsv) returned by drain()
+        '''
+        (run, obsv) = drained
+        with self.lock:
+            for (stage, stats) in run.items():
+                self.run.setdefault(stage, StageStats()).merge(stats)
+            for (name, stages) in obsv.items():
+                for (stage, stats) in stages.items():
+                    self.stagesOf(name).setdefault(stage, StageStats()).merge(stats)
+
+    def toDict(self):
+        ''':returns: dict of run totals and per observation statistics
+        '''
+        with self.lock:
+            return {
+                'start':    self.start,
+                'duration': time.time() - self.start,
+                'run':      {stage: stats.toDict() for (stage, stats) in self.run.items()},
+                'obsv':     {name: {stage: stats.toDict() for (stage, stats) in stages.items()}
+                                for (name, stages) in self.obsv.items()}
+            }
+
+    def toJSON(self):
+        return json.dumps(self.toDict(), indent=2)
+
+    def toPrometheus(self):
+        ''':returns: str in Prometheus text exposition format
+        '''
+        lines = []
+        with self.lock:
+            series = [('', self.run)] + [(name, stages) for (name, stages) in self.obsv.items()]
+            for (metric, attr, kind, help) in [
+                ('obsman_stage_seconds_total',  'seconds',  'counter', 'Time spent in stage'),
+                ('obsman_stage_files_total',    'files',    'counter', 'Files processed in stage'),
+                ('obsman_stage_bytes_total',    'bytes',    'counter', 'Bytes processed in stage'),
+                ('obsman_stage_failures_total', 'failures', 'counter', 'Failures in stage')
+            ]:
+                lines.append(f'# HELP {metric} {help}')
+                lines.append(f'# TYPE {metric} {kind}')
+                for (name, stages) in series:
+                    for (stage, stats) in stages.items():
+                        lines.append(f'{metric}{{{labels(stage, name)}}} {getattr(stats, attr)}')
+            for (metric, attr, help) in [
+                ('obsman_stage_file_latency_seconds', 'fileLatency', 'Per-file latency of stage'),
+                ('obsman_stage_unit_latency_seconds', 'unitLatency', 'Latency of stage per observation or directory tree')
+            ]:
+                lines.append(f'# HELP {metric} {help}')
+                lines.append(f'# TYPE {metric} summary')
+                for (name, stages) in series:
+                    for (stage, stats) in stages.items():
+                        histogram = getattr(stats, attr)
+                        if not histogram.count:
+                            continue
+                        for q in QUANTILES:
+                            lines.append(f'{metric}{{{labels(stage, name)},quantile="{q}"}} {histogram.quantile(q)}')
+                        lines.append(f'{metric}_sum{{{labels(stage, name)}}} {histogram.sum}')
+                        lines.append(f'{metric}_count{{{labels(stage, name)}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def writeFile(self, path):
+        '''Writes metrics into path, as JSON if it ends with '.json';
+        Prometheus text format otherwise
+        '''
+        with open(path, 'w') as outFile:
+            outFile.write(self.toJSON() if path.endswith('.json') else self.toPrometheus())
+        logger.info(f'Metrics written: {path}')
+
+    def serve(self, port, host='127.0.0.1'):
+        '''Serves metrics over HTTP on a daemon thread; '/metrics' in Prometheus
+        text format, '/metrics.json' as JSON
+        :param port: TCP port to listen
+        :param host: address to bind (default localhost only)
+        :returns: http.server.ThreadingHTTPServer
+        '''
+        registry = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics.json':
+                    (body, contentType) = (registry.toJSON(), 'application/json')
+                elif self.path == '/metrics':
+                    (body, contentType) = (registry.toPrometheus(), 'text/plain; version=0.0.4')
+                else:
+                    self.send_error(404)
+                    return
+                body = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', contentType)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(f'Serving metrics: http://{host}:{port}/metrics')
+        return self.server
+
+
+def labels(stage, obsv):
+    return f'stage="{stage}"' + (f',obsv="{obsv}"' if obsv else '')
+
+
+# Registry used throughout the library
+metrics = Metrics()
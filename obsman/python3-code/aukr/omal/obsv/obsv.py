@@ -1,8 +1,11 @@
 import os, glob
 from ..const import BIAS_DIR, DARK_DIR, FLAT_DIR, OBJCT_DIR, OTHER_DIR,\
-    MAX_CONTROL_ITEM, MAX_OBSV_PER_DAY, MAX_ITEM_PER_DAY, MAX_ITEM_PER_OBSV
-from .. import calc, log
-from ..fitsfile import FitsFile
+    MAX_CONTROL_ITEM, MAX_OBSV_PER_DAY, MAX_ITEM_PER_DAY, MAX_ITEM_PER_OBSV,\
+    COMPRESSED_EXT
+from .. import calc, log, journal, filesys
+from ..profile import normalizerFor
+from ..fitsfile import FitsFile, PixelStack
+from ..metrics import metrics
 from ..sqlitedb import archiveDB
 
 # Create module's logger
@@ -12,9 +15,11 @@ class Obsv:
     '''Class for representing observations (each has its own directory)
     '''
 
-    def __init__(self, path, mode='readonly'):
+    def __init__(self, path, mode='readonly', parse=True):
         ''':param path: path to observation folder to be parsed (can be relative)
         :param mode: indicates if file will be modified (choose 'readonly', 'update')
+        :param parse: if False, fitsTree is left empty (files are streamed by
+            caller instead, see aukr.omal.pipeline)
         '''
 
         self.isNew       = None
@@ -28,13 +33,15 @@ class Obsv:
                             #("YYYY-MM-DD" or "YYYY-MM-DD_F00BA2")
         self.hash        = None   # from foldername inserted at observation archiving
                             #process, if any ("F00BA2")
+        self.resumeHash  = None   # from aukr.omal.journal, hash allocated by an
+                            #interrupted import of this (new) observation
 
         log.heading2('ObsvInit', logger) # for more readable logs
-        logger.debug(f'Constructing Obsv: {path}')
+        logger.debug('Constructing Obsv: %s', path)
         self.path = path # for readable logs incase not a dir
         # Check directory exists
         if not os.path.isdir(path):
-            logger.debug(f'Not a directory: {path}')
+            logger.debug('Not a directory: %s', path)
             return None
         self.path = os.path.abspath(path)
         self.name = os.path.basename(path)
@@ -44,9 +51,63 @@ class Obsv:
         # else get default-ref and set isNew=True
         self.parseDateRef()
 
+        # Interrupted import leaves some files updated, those are accepted
+        # as long as they belong to the slot allocated back then
+        if self.isNew:
+            self.resumeHash = journal.slotOf(self.path)
+            if self.resumeHash is not None:
+                logger.info(f'Resuming interrupted import: {self.name} (REF={calc.ref(self.resumeHash)})')
+
         # import fitsTree, tlscp, object if data the same in all headers
         # updates fits files of new observations, provided mode='update'
-        self.parseFitsTree()
+        if parse:
+            self.parseFitsTree()
+
+
+    @classmethod
+    def fromCatalog(cls, hash):
+        '''Readonly Obsv of an archived observation, from catalog rows only (no
+        file is read; FitsFile objects read their files only if asked for what
+        is not in catalog, see FitsFile.fromRow()).
+        :param hash: hash of archived Obsv
+        :returns: Obsv object, None if not in catalog
+        '''
+        rows = archiveDB.queryObsv(hash, '"DATE", "TELESCOP", "OBJECT"')
+        if not rows:
+            logger.debug('Obsv not in catalog: %s', calc.ref(hash))
+            return None
+        obsv = cls.__new__(cls)
+        (obsv.date, obsv.tlscp, obsv.objct) = rows[0]
+        obsv.isNew      = False
+        obsv.mode       = 'readonly'
+        obsv.hash       = hash
+        obsv.resumeHash = None
+        obsv.name       = f'{obsv.date}_{calc.ref(hash)}'
+        # Archive layout, rows inserted before relocation refer to archdir/tmp
+        obsv.path       = os.path.abspath(filesys.archObsvRoot(obsv))
+        obsv.branchList = [BIAS_DIR, DARK_DIR, FLAT_DIR, OBJCT_DIR, OTHER_DIR]
+        obsv.fitsTree   = [[], [], [], []]
+
+        cursor = archiveDB.iterFitsByObsv(hash)
+        columns = [description[0] for description in cursor.description]
+        for row in cursor:
+            fitsFile = FitsFile.fromRow(row, columns)
+            # Reserved item numbers per branch (see aukr.omal.const)
+            j = min((fitsFile.hash - hash - 1) // MAX_CONTROL_ITEM, 3)
+            if not fitsFile.path.startswith(obsv.path + '/'):
+                fitsFile.path = f'{obsv.path}/{obsv.branchList[j]}/{fitsFile.name}'
+            obsv.fitsTree[j].append(fitsFile)
+        return obsv
+
+
+    def relocate(self):
+        '''Makes catalog rows refer to archived files, after
+        aukr.omal.filesys.moveToArchive() (rows are inserted before the move)
+        :returns: True if successful
+        '''
+        filePaths = [(fitsFile.hash, os.path.abspath(filesys.archFitsPath(self, j, fitsFile)))
+            for j in range(0, 4) for fitsFile in self.fitsTree[j]]
+        return archiveDB.relocateObsv(self.hash, os.path.abspath(filesys.archObsvRoot(self)), filePaths)
 
 
     def parseDateRef(self):
@@ -62,14 +123,21 @@ class Obsv:
             if calc.isDate(date):
                 self.date = date
             else:
-                logger.debug(f'Foldername fault (DATE not real): {self.path}')
+                logger.debug('Foldername fault (DATE not real): %s', self.path)
                 raise ValueError
             # Check post-delimeter for ref
             (date, item) = calc.validDateAndItem(ref)
             if date == self.date and item == 0:
                 self.hash = calc.hash(ref)
             else:
-                logger.debug(f'Foldername fault (REF for wrong day or is a file): {self.path}')
+                logger.debug('Foldername fault (REF for wrong day or is a file): %s', self.path)
+                raise ValueError
+            # Sharded layout (archdir/YYYY/MM/), shard must agree with date
+            # (relative to archdir, which may itself end in digit folders)
+            shard = os.path.relpath(os.path.abspath(self.path), os.path.abspath(filesys.archDir())).split(os.sep)[:-1]
+            if ((len(shard) == 2) and shard[0].isdigit() and shard[1].isdigit()
+                and (f'{shard[0]}-{shard[1]}' != self.date[:7])):
+                logger.debug('Foldername fault (in shard of another month): %s', self.path)
                 raise ValueError
             # Explicitly set isNew False (rather than None)
             self.isNew = False
@@ -79,7 +147,7 @@ class Obsv:
             if calc.isDate(ref):
                 self.date = ref
             else:
-                logger.debug(f'Foldername fault (not a date): {self.path}')
+                logger.debug('Foldername fault (not a date): %s', self.path)
                 raise ValueError
             # Set as new observation
             self.isNew = True
@@ -107,14 +175,14 @@ class Obsv:
         # Must have subfolders (fitsBranches):
         # BIAS_DIR, DARK_DIR, FLAT_DIR, and (objctBranch, optionally OTHER_DIR)
         if (len(branchList) < 4) or (len(branchList) > 5):
-            logger.debug(f'Only [{BIAS_DIR}, {DARK_DIR}, {FLAT_DIR}, Object\'s Folder, {OTHER_DIR}(optional)] are allowed: {self.path}')
+            logger.debug('Only [%s, %s, %s, Object\'s Folder, %s(optional)] are allowed: %s', BIAS_DIR, DARK_DIR, FLAT_DIR, OTHER_DIR, self.path)
             return # terminate without changes
         if (   (BIAS_DIR not in branchList)
             or (DARK_DIR not in branchList)
             or (FLAT_DIR not in branchList)
             ):
-            logger.debug(f'Subfolder(s) missing [{BIAS_DIR}, {DARK_DIR}, '
-                f'{FLAT_DIR}]: {self.path}')
+            logger.debug('Subfolder(s) missing [%s, %s, %s]: %s',
+                BIAS_DIR, DARK_DIR, FLAT_DIR, self.path)
             return # terminate without changes
             
         # New Obsevation (objctBranch's name can be any non-reserved name)
@@ -127,7 +195,7 @@ class Obsv:
             if (len(objctBranch) == 2) and (OTHER_DIR in branchList): # (5 subfolders)
                 objctBranch.remove(OTHER_DIR)
             elif len(objctBranch) != 1: # 5 subfolders but no OTHER_DIR (illegal)
-                logger.debug(f'Illegal subfolders {objctBranch}: {self.path}')
+                logger.debug('Illegal subfolders %s: %s', objctBranch, self.path)
                 return # terminate without changes
             #Set it to remaining str element instead of a list of length 1
             objctBranch = objctBranch[0]          
@@ -138,7 +206,7 @@ class Obsv:
             objctBranch = OBJCT_DIR
         # Violates structrure
         else:
-            logger.debug(f'Improper archived subfolder structure: {self.path}')
+            logger.debug('Improper archived subfolder structure: %s', self.path)
             return # terminate without changes
 
         #objctBranch is known at this point, and no violations
@@ -185,33 +253,37 @@ class Obsv:
         :returns: list of FitsFile objects
         '''
         fitsList = []     # FitsFile objects
-        fitsPathList = sorted(glob.glob(f'{dirPath}/*.fit', recursive=False))
+        # tile-compressed files ('.fit.fz') are archived ones, read as is
+        fitsPathList = sorted(glob.glob(f'{dirPath}/*.fit', recursive=False)
+            + glob.glob(f'{dirPath}/*.fit{COMPRESSED_EXT}', recursive=False))
 
         # If no '.fit' files in folder
         if not fitsPathList:
-            logger.debug(f'Has no fits files: {dirPath}')
+            logger.debug('Has no fits files: %s', dirPath)
             return
         # If has fits file(s)
         else:
             # Create first FitsFile object, then append to fitsList
             try:
-                fitsList.append(FitsFile(fitsPathList[0], mode=self.mode))
+                with metrics.stage('parse', self.name, nbytes=os.path.getsize(fitsPathList[0])):
+                    fitsList.append(FitsFile(fitsPathList[0], mode=self.mode))
             except Exception:
                 logger.warning(f'Could not create FitsFile: {fitsPathList[0]}', exc_info=True)
 
             if self.isNew:
                 # Check whether file was archived, albeit this Obsv being new
-                if not fitsList[0].isNew:
-                    logger.debug(f'Archived FitsFile in fresh Obsv: {fitsList[0].path}')
+                # (unless updated by an interrupted import of this Obsv)
+                if not self.isResumable(fitsList[0]):
+                    logger.debug('Archived FitsFile in fresh Obsv: %s', fitsList[0].path)
                     return
             else:
                 #Check whether file is fresh, albeit this Obsv being archived
                 if self.isNew != fitsList[0].isNew:
-                    logger.debug(f'Fresh FitsFile in archived Obsv: {fitsList[0].path}')
+                    logger.debug('Fresh FitsFile in archived Obsv: %s', fitsList[0].path)
                     return
                 # Check whether file is foreign
                 if self.hash != fitsList[0].obsvHash:
-                    logger.debug(f'Foreign FitsFile (first): {fitsList[0].path}')
+                    logger.debug('Foreign FitsFile (first): %s', fitsList[0].path)
                     return
                 
 
@@ -220,23 +292,35 @@ class Obsv:
             for j in range(1, len(fitsPathList)):
                 # Create FitsFile objects one by one
                 try:
-                    fitsList.append(FitsFile(fitsPathList[j], self.mode))
+                    with metrics.stage('parse', self.name, nbytes=os.path.getsize(fitsPathList[j])):
+                        fitsList.append(FitsFile(fitsPathList[j], self.mode))
                 except Exception:
                     logger.warning(f'Could not create FitsFile: {fitsPathList[0]}', exc_info=True)
 
-                # Check if different (if new, obsvHash equal None in both)
-                if (   fitsList[0].obsvHash        != fitsList[j].obsvHash
-                    or fitsList[0].isNew           != fitsList[j].isNew
+                # Check if different (if new, obsvHash equal None in both;
+                # when resuming, files may be either fresh or of resumeHash)
+                if (   ((fitsList[0].obsvHash     != fitsList[j].obsvHash
+                        or fitsList[0].isNew      != fitsList[j].isNew)
+                        and not (self.isResumable(fitsList[0]) and self.isResumable(fitsList[j])))
                     or fitsList[0].hdr['TELESCOP'] != fitsList[j].hdr['TELESCOP']
                     or fitsList[0].hdr['OBJECT']   != fitsList[j].hdr['OBJECT']
                 ):
-                    logger.debug(f'Mixed FitsFile: {fitsList[j].path}')
+                    logger.debug('Mixed FitsFile: %s', fitsList[j].path)
                     return
 
         # Provided data were consistent]
         return fitsList
 
 
+    def isResumable(self, fitsFile):
+        '''For new Obsv, a FitsFile is acceptable if fresh or was updated by an
+        interrupted import of this Obsv (see aukr.omal.journal)
+        :param fitsFile: FitsFile object in this Obsv
+        :returns: True if acceptable
+        '''
+        return fitsFile.isNew or (self.resumeHash is not None and fitsFile.obsvHash == self.resumeHash)
+
+
     def getFitsList(self):
         '''Makes it easier to loop through all FitsFile objects in member fitsTree
         :returns: a list containing all FitsFile objects 
@@ -244,14 +328,59 @@ class Obsv:
         return [fitsFile for branch in self.fitsTree for fitsFile in branch]
 
 
-    def update(self):
+    def getFitsBranch(self, branch):
+        ''':param branch: BIAS_DIR, DARK_DIR, FLAT_DIR, OBJCT_DIR (any name of
+            object's folder for new Obsv), or index in fitsTree (0..3)
+        :returns: list of FitsFile objects of branch
+        '''
+        if branch in [BIAS_DIR, DARK_DIR, FLAT_DIR, OBJCT_DIR]:
+            branch = [BIAS_DIR, DARK_DIR, FLAT_DIR, OBJCT_DIR].index(branch)
+        elif isinstance(branch, str):
+            branch = 3
+        if len(self.fitsTree) != 4 or branch not in range(0, 4):
+            logger.debug('No such branch %s: %s', branch, self.path)
+            raise ValueError('No such branch')
+        return self.fitsTree[branch]
+
+
+    def iterPixels(self, branch=None, scaled=True):
+        '''Images of files one after another, memory-mapped (see
+        aukr.omal.fitsfile.Pixels); each is released once next is yielded
+        :param branch: see getFitsBranch(), None for all files
+        :param scaled: False to leave values as stored (BSCALE/BZERO ignored)
+        :yields: (FitsFile, Pixels)
+        '''
+        fitsList = self.getFitsList() if branch is None else self.getFitsBranch(branch)
+        for fitsFile in fitsList:
+            pixels = fitsFile.pixels(scaled)
+            try:
+                yield (fitsFile, pixels)
+            finally:
+                pixels.close()
+
+
+    def stack(self, branch, scaled=True):
+        '''Lazy 3-D view of images of a branch (e.g. all Dark frames), memory-
+        mapped; see aukr.omal.fitsfile.PixelStack, iterBands() for bounded memory
+        :param branch: see getFitsBranch()
+        :param scaled: False to leave values as stored (BSCALE/BZERO ignored)
+        :returns: PixelStack (frames in order of fitsTree), close() when done
+        '''
+        return PixelStack([fitsFile.pixels(scaled) for fitsFile in self.getFitsBranch(branch)])
+
+
+    def update(self, journaled=True):
         '''Not for stand-alone use, method for Obsv.insert(). Updates all
         FitsFile objects in member fitsTree, provides them with obsvHash info.
+        :param journaled: if False, updated headers are not recorded into
+            aukr.omal.journal (left to caller, e.g. a worker process does not
+            write into database)
         :returns: True if successful
         '''
         # Update all files in tree (see: reserved item numbers per subfolder in aukr.omal.const)
         if (self.mode == 'update'):
             if (self.fitsTree):
+                upgrades = self.upgradeCards()
                 # for all branches except OTHER_DIR
                 for j in range(0, 4): 
                     log.heading3(self.branchList[j], logger) # for more readable logs
@@ -259,35 +388,92 @@ class Obsv:
                     for k in range(0, len(self.fitsTree[j])):
                         # (Obsv.hash + shift by 1) + preceding reserved slots + k'th file in branch 
                         fileHash = ((self.hash + 1) + j*MAX_CONTROL_ITEM + k)
+                        fitsFile = self.fitsTree[j][k]
+                        # Updated by an interrupted import, must be in the same slot
+                        if (not fitsFile.isNew) and (fitsFile.hash != fileHash):
+                            logger.debug('Resumed FitsFile has another ref (%s): %s', calc.ref(fitsFile.hash), fitsFile.path)
+                            return False
                         # If cannot update all files, will return False (no damage yet)
-                        if not self.fitsTree[j][k].update(fileHash):
+                        isNew = fitsFile.isNew
+                        if not fitsFile.update(fileHash, upgrades.get(fitsFile.path)):
                             return False
+                        if isNew and journaled:
+                            journal.record(self.path, 'header', fileHash, fitsFile.path)
             else:
-                logger.debug(f'Couldn\'t update Obsv (fitsTree empty): {self.path}')
+                logger.debug('Couldn\'t update Obsv (fitsTree empty): %s', self.path)
                 return False
         else:
-            logger.debug(f'Couldn\'t update Obsv (mode={self.mode}): {self.path}')
+            logger.debug('Couldn\'t update Obsv (mode=%s): %s', self.mode, self.path)
             return False
 
-        logger.debug(f'Updated Obsv: {self.path}')
+        logger.debug('Updated Obsv: %s', self.path)
         return True
 
 
-    def insert(self):
-        '''Inserts non-duplicate Obsv into archiveDB, unless daily limit reached.
+    def upgradeCards(self):
+        '''Not for stand-alone use, method for Obsv.update(). Computes cards
+        upgrade adds to new files at once, per profile (see aukr.omal.profile),
+        from catalog cards; files are not read.
+        :returns: dict of FitsFile path -> list of cards; files left out (e.g.
+            lacking a card) are upgraded one by one, as usual
+        '''
+        groups = {}
+        for fitsFile in self.getFitsList():
+            if fitsFile.isNew and ('BJD-TDB' not in fitsFile.hdr) and ('MIDTIME' not in fitsFile.hdr):
+                groups.setdefault(normalizerFor(fitsFile.hdr), []).append(fitsFile)
+        upgrades = {}
+        for (normalizer, fitsList) in groups.items():
+            try:
+                cardsList = normalizer.upgradeCards([fitsFile.hdr for fitsFile in fitsList])
+            except Exception:
+                logger.debug('Upgrade cards not computed in batch (%s): %s', normalizer.name, self.path, exc_info=True)
+                continue
+            upgrades.update((fitsFile.path, cards) for (fitsFile, cards) in zip(fitsList, cardsList))
+        return upgrades
+
+
+    def duplicateOf(self):
+        '''Looks for an archived observation of the same day and telescope, e.g.
+        before a new observation is copied (allocate() checks again anyway)
+        :returns: hash of archived duplicate, None if not any
+        '''
+        hash = self.hash
+        for count in range(MAX_OBSV_PER_DAY):
+            row = archiveDB.queryObsv(hash, "TELESCOP")
+            if not row:
+                return None
+            if row[0][0] == self.tlscp:
+                logger.warning(f'Obsv ALREADY IN ARCHIVE: {self.name}, (REF={calc.ref(hash)})')
+                return hash
+            hash = hash + MAX_ITEM_PER_OBSV
+        return None
+
+
+    def allocate(self, reserved={}, journaled=True):
+        '''Not for stand-alone use, method for Obsv.insert(). Finds a slot
+        (self.hash) for non-duplicate Obsv, unless daily limit reached.
+        :param reserved: dict of hash -> TELESCOP, slots taken by observations
+            whose rows are not inserted yet (concurrent imports, see
+            aukr.omal.scheduler); None for TELESCOP if not known
+        :param journaled: if False, slot is not recorded into aukr.omal.journal
+            (left to caller)
         :returns: True if successful
         '''
         # Check if self.hash is occupied in database
         hash = self.hash # for iteration over observations in a day, if any
         count = MAX_OBSV_PER_DAY # if count zero max trial is reached
+        # Slot of an interrupted import is taken again (it may have rows already)
+        if self.resumeHash is not None:
+            hash = self.resumeHash
         # Either query returns '' (effectively False), or count becomes 0
         # If duplicate is found before those, fallback
-        while count and (archiveDB.queryObsv(hash, "*")):
+        while count and (self.resumeHash is None) and (archiveDB.queryObsv(hash, "*") or (hash in reserved)):
             # Assuming there shall be one observation per telescope per day.
             # if there exists an observation in database for the telescope,
             # label current observation as duplicate; else iterate for
             # number of observations allowed per day.                
-            if archiveDB.queryObsv(hash, "TELESCOP") and (archiveDB.queryObsv(hash, "TELESCOP")[0][0] == self.tlscp):
+            row = archiveDB.queryObsv(hash, "TELESCOP")
+            if (row[0][0] if row else reserved[hash]) == self.tlscp:
                 logger.warning(f'Obsv ALREADY IN ARCHIVE: {self.name}, (REF={calc.ref(hash)})')
                 return False
             else:
@@ -299,30 +485,67 @@ class Obsv:
         else:
             logger.info(f'Obsv not duplicate, inserting: {self.name}')
             self.hash = hash # empty slot found is taken
-        
-        # Update FitsFiles in tree, provided Obsv is not duplicate
-        if self.update():
-            # Insert into tables obsv and fits
-            if archiveDB.insertObsv(self):
-                logger.debug(f'Obsv into archiveDB: {self.path}')
-                for branch in self.fitsTree:
-                    #logger.debug(f'Branch: {os.path.dirname(branch[0].path)}')
-                    log.heading3(os.path.basename(os.path.dirname(branch[0].path)), logger) # for more readable logs
-                    for fitsFile in branch:
-                        logger.debug(f'FitsFile: {fitsFile.date} {fitsFile.name}')
-                        # Write updated files into database:
-                        # if somehow fitsFile not inserted delete all changes and return False
-                        if not archiveDB.insertFits(fitsFile):
-                            archiveDB.deleteObsv(self)
-                            logger.warning(f'FitsFile insertion failed (rolling back): {fitsFile.path}')
-                            return False
-            else:
-                logger.warning(f'Obsv insertion failed: {self.name}')
-                return False
+            # Before any header is touched (write-ahead)
+            if journaled:
+                journal.record(self.path, 'slot', self.hash)
+        return True
+
+
+    def insertRows(self):
+        '''Not for stand-alone use, method for Obsv.insert(). Inserts rows of
+        (updated) Obsv and its FitsFiles into archiveDB, rolls back on failure.
+        :returns: True if successful
+        '''
+        # Rows left by an interrupted import (if any) are inserted anew
+        if self.resumeHash is not None:
+            archiveDB.deleteObsv(self)
+        # Insert into tables obsv and fits, in one transaction (committed along
+        # with 'rows' step of journal)
+        with metrics.stage('insert', self.name, files=0):
+            isInserted = archiveDB.insertObsv(self, commit=False)
+        if isInserted:
+            logger.debug('Obsv into archiveDB: %s', self.path)
+            for branch in self.fitsTree:
+                #logger.debug(f'Branch: {os.path.dirname(branch[0].path)}')
+                log.heading3(os.path.basename(os.path.dirname(branch[0].path)), logger) # for more readable logs
+                for fitsFile in branch:
+                    logger.debug('FitsFile: %s %s', fitsFile.date, fitsFile.name)
+                    # Write updated files into database:
+                    # if somehow fitsFile not inserted roll all rows back and return False
+                    with metrics.stage('insert', self.name):
+                        isInserted = archiveDB.insertFits(fitsFile, commit=False)
+                    if not isInserted:
+                        metrics.fail('insert', self.name)
+                        archiveDB.rollback()
+                        logger.warning(f'FitsFile insertion failed (rolling back): {fitsFile.path}')
+                        return False
         else:
-            logger.warning(f'Could not update: {self.name}')
+            metrics.fail('insert', self.name)
+            archiveDB.rollback()
+            logger.warning(f'Obsv insertion failed: {self.name}')
             return False
 
+        journal.record(self.path, 'rows', self.hash, commit=False)
+        archiveDB.conn.commit()
         logger.info(f'Obsv insertion succeeded: {self.name}')
         return True
+
+
+    def insert(self):
+        '''Inserts non-duplicate Obsv into archiveDB, unless daily limit reached.
+        :returns: True if successful
+        '''
+        if not self.allocate():
+            return False
+
+        recorded = journal.steps(self.path)
+        if 'rows' in recorded:
+            logger.info(f'Rows were inserted before interruption: {self.name}')
+            return self.update()
+
+        # Update FitsFiles in tree, provided Obsv is not duplicate
+        if not self.update():
+            logger.warning(f'Could not update: {self.name}')
+            return False
+        return self.insertRows()
 # End of Obsv class
@@ -0,0 +1,240 @@
+# Pipelined (streaming) import of an observation. Files flow one by one
+# through stages connected by bounded queues, so that reading, header upgrades
+# and writing overlap instead of taking turns:
+#   read (header) -> upgrade -> write (into staging) -> catalog -> place
+# Originals are only read. Files are written (already upgraded) into a staging
+# directory in archive layout (archdir/tmp/YYYY-MM-DD); catalog rows go into a
+# single transaction. Once every file passed, rows are committed and staging
+# directory is renamed into archdir. On any failure rows are rolled back and
+# staging is removed: an observation is imported as a whole or not at all.
+# Memory in use is bound by queue depth, not by size of observation.
+import os, shutil, threading, queue, contextvars
+from .. import log, journal, filesys
+from ..args import args
+from ..obsv import Obsv
+from ..fitsfile import FitsFile, writeFits, readHeader
+from ..metrics import metrics
+from ..sqlitedb import archiveDB
+from ..validate import checkStructure
+from ..const import BIAS_DIR, DARK_DIR, FLAT_DIR, OBJCT_DIR, OTHER_DIR,\
+    MAX_CONTROL_ITEM, COMPRESSED_EXT
+
+# Create module's logger
+logger = log.getLogger(__name__)
+
+# End of stream, passed along by every stage
+STOP = None
+
+
+def runStage(name, function, inQueue, outQueue, abort):
+    '''Thread body of a stage: puts function(item) into outQueue for each item
+    from inQueue. Once aborted (by any stage) items are drained unprocessed.
+    :param name: name of stage, for logs
+    :param function: takes an item, returns item for next stage
+    :param inQueue: queue.Queue of items, ends with STOP
+    :param outQueue: queue.Queue (bounded) for next stage
+    :param abort: threading.Event, set on failure
+    '''
+    while True:
+        item = inQueue.get()
+        if item is STOP:
+            outQueue.put(STOP)
+            return
+        if abort.is_set():
+            continue
+        try:
+            outQueue.put(function(item))
+        except Exception:
+            logger.warning(f'Stage "{name}" failed: {item[0].path}', exc_info=True)
+            abort.set()
+
+
+class ObsvPipeline:
+    '''Imports a new observation (YYYY-MM-DD folder) through pipeline stages.
+    Items passed between stages are tuples (FitsFile, file hash, archive
+    branch, full header as astropy.io.fits.Header).
+    '''
+
+    def __init__(self, srcPath, depth=8, compress='none'):
+        ''':param srcPath: path of new observation directory (left untouched)
+        :param depth: size of each queue between stages
+        :param compress: 'none' or key of aukr.omal.const.COMPRESS_TYPES
+        '''
+        self.srcPath    = os.path.abspath(srcPath)
+        self.name       = os.path.basename(self.srcPath)
+        self.stagingDir = os.path.abspath(f'{filesys.tmpDir()}/{self.name}')
+        self.depth      = depth
+        self.compress   = compress
+        self.obsv       = None  # Obsv (not parsed) in staging, for slot and rows
+        self.branches   = []    # (source branch, archive branch, list of .fit paths)
+        self.abort      = threading.Event()
+
+    def prepare(self):
+        '''Checks structure, reads first object file (for TELESCOP, OBJECT),
+        allocates a slot and creates staging directory.
+        :returns: True if pipeline can be run
+        '''
+        (errors, branchFiles) = checkStructure(self.srcPath)
+        if errors:
+            logger.warning(f'Improper observation {errors}: {self.srcPath}')
+            return False
+        objctBranch = [branch for branch in branchFiles if branch not in [BIAS_DIR, DARK_DIR, FLAT_DIR]][0]
+        self.branches = [(branch, branch, branchFiles[branch]) for branch in [BIAS_DIR, DARK_DIR, FLAT_DIR]]
+        self.branches.append((objctBranch, OBJCT_DIR, branchFiles[objctBranch]))
+
+        first = FitsFile(branchFiles[objctBranch][0], mode='readonly')
+        os.makedirs(self.stagingDir)
+        self.obsv = Obsv(self.stagingDir, mode='update', parse=False)
+        self.obsv.tlscp = first.hdr['TELESCOP']
+        self.obsv.objct = first.hdr['OBJECT']
+        # Slot is journaled along with rows, nothing is durable until then
+        if not self.obsv.allocate(journaled=False):
+            return False
+        for archPath in filesys.archObsvCandidates(self.obsv.hash):
+            if os.path.exists(archPath):
+                logger.warning(f'Observation already in archdir, remove before updating: {archPath}')
+                return False
+        for (srcBranch, dstBranch, pathList) in self.branches:
+            os.makedirs(f'{self.stagingDir}/{dstBranch}')
+        if os.path.isdir(f'{self.srcPath}/{OTHER_DIR}'):
+            shutil.copytree(f'{self.srcPath}/{OTHER_DIR}', f'{self.stagingDir}/{OTHER_DIR}')
+        else:
+            os.makedirs(f'{self.stagingDir}/{OTHER_DIR}')
+        return True
+
+    def read(self, outQueue):
+        '''Stage (producer): parses headers, checks them as Obsv does
+        '''
+        try:
+            for (j, (srcBranch, dstBranch, pathList)) in enumerate(self.branches):
+                branchObjct = None
+                for (k, path) in enumerate(pathList):
+                    if self.abort.is_set():
+                        return
+                    with metrics.stage('parse', self.name, nbytes=os.path.getsize(path)):
+                        hdr = readHeader(path)
+                        fitsFile = FitsFile(path, mode='readonly', hdr=hdr)
+                    if not fitsFile.isNew:
+                        raise ValueError(f'Archived FitsFile in fresh Obsv: {path}')
+                    if fitsFile.hdr['TELESCOP'] != self.obsv.tlscp:
+                        raise ValueError(f'Mixed TELESCOP: {path}')
+                    branchObjct = branchObjct if branchObjct else fitsFile.hdr['OBJECT']
+                    if fitsFile.hdr['OBJECT'] != branchObjct:
+                        raise ValueError(f'Mixed OBJECT: {path}')
+                    # (Obsv.hash + shift by 1) + preceding reserved slots + k'th file in branch
+                    outQueue.put((fitsFile, (self.obsv.hash + 1) + j*MAX_CONTROL_ITEM + k, dstBranch, hdr))
+        except Exception:
+            logger.warning(f'Stage "read" failed: {self.srcPath}', exc_info=True)
+            self.abort.set()
+        finally:
+            outQueue.put(STOP)
+
+    def upgrade(self, item):
+        (fitsFile, fileHash, dstBranch, hdr) = item
+        if not fitsFile.upgradeHeader(fileHash, hdr):
+            raise ValueError('Header could not be upgraded')
+        return item
+
+    def write(self, item):
+        (fitsFile, fileHash, dstBranch, hdr) = item
+        dstName = fitsFile.name + (COMPRESSED_EXT if self.compress != 'none' else '')
+        with metrics.stage('flush', self.name, nbytes=os.path.getsize(fitsFile.path)):
+            writeFits(fitsFile.path, f'{self.stagingDir}/{dstBranch}/{dstName}', hdr, self.compress)
+        # Catalog refers to where file is placed at last
+        fitsFile.path = os.path.abspath(f'{filesys.archObsvRoot(self.obsv)}/{dstBranch}/{dstName}')
+        logger.info('Written FitsFile: %s %s', fitsFile.date, fitsFile.name)
+        return item
+
+    def catalog(self, item):
+        '''Stage on calling thread (the single database writer); rows stay in
+        an open transaction until place()
+        '''
+        (fitsFile, fileHash, dstBranch, hdr) = item
+        with metrics.stage('insert', self.name):
+            if not archiveDB.insertFits(fitsFile, commit=False):
+                raise ValueError('Row could not be inserted')
+
+    def commit(self):
+        '''Commits rows, slot is journaled along with them
+        '''
+        # Row of observation refers to archive as well
+        self.obsv.path = os.path.abspath(filesys.archObsvRoot(self.obsv))
+        if not archiveDB.insertObsv(self.obsv, commit=False):
+            raise ValueError('Row could not be inserted')
+        journal.record(self.stagingDir, 'slot', self.obsv.hash, commit=False)
+        journal.record(self.stagingDir, 'rows', self.obsv.hash, commit=False)
+        archiveDB.conn.commit()
+
+    def place(self):
+        '''Renames staging into archdir. Interrupted or failed, it is finished
+        as any interrupted import (see aukr.omal.journal), files are complete.
+        '''
+        # Staging is within archdir (same filesystem), rename is atomic
+        with metrics.stage('move', self.name, files=0):
+            os.makedirs(os.path.dirname(self.obsv.path), exist_ok=True)
+            os.rename(self.stagingDir, self.obsv.path)
+        journal.record(self.stagingDir, 'move', self.obsv.hash)
+        journal.finish(self.stagingDir)
+
+    def rollback(self):
+        archiveDB.rollback()
+        if os.path.isdir(self.stagingDir):
+            shutil.rmtree(self.stagingDir)
+
+    def run(self):
+        ''':returns: True if observation is imported
+        '''
+        log.heading2('ObsvPipeline', logger)
+        if os.path.exists(self.stagingDir):
+            logger.warning(f'Already in {filesys.tmpDir()} (interrupted import?): {self.name}')
+            return False
+        try:
+            if not self.prepare():
+                self.rollback()
+                return False
+        except Exception:
+            logger.warning(f'Could not prepare: {self.srcPath}', exc_info=True)
+            self.rollback()
+            return False
+
+        readQueue    = queue.Queue(self.depth)
+        upgradeQueue = queue.Queue(self.depth)
+        writeQueue   = queue.Queue(self.depth)
+        # Stages run in (copies of) context of caller, e.g. Archive in use
+        threads = [
+            threading.Thread(target=contextvars.copy_context().run, args=(self.read, readQueue)),
+            threading.Thread(target=contextvars.copy_context().run,
+                args=(runStage, 'upgrade', self.upgrade, readQueue, upgradeQueue, self.abort)),
+            threading.Thread(target=contextvars.copy_context().run,
+                args=(runStage, 'write', self.write, upgradeQueue, writeQueue, self.abort))
+        ]
+        for thread in threads:
+            thread.start()
+        # catalog stage, on this thread
+        while True:
+            item = writeQueue.get()
+            if item is STOP:
+                break
+            if self.abort.is_set():
+                continue
+            try:
+                self.catalog(item)
+            except Exception:
+                logger.warning(f'Stage "catalog" failed: {item[0].path}', exc_info=True)
+                self.abort.set()
+        for thread in threads:
+            thread.join()
+
+        try:
+            if not self.abort.is_set():
+                self.commit()
+        except Exception:
+            logger.warning(f'Rows could not be committed: {self.srcPath}', exc_info=True)
+            self.abort.set()
+        if self.abort.is_set():
+            logger.warning(f'Import failed, rolled back: {self.srcPath}')
+            self.rollback()
+            return False
+        self.place()
+        logger.warning(f'Moved into {args.archdir}: {self.name}')
+        return True
@@ -0,0 +1,191 @@
+# Header normalization per observatory/instrument. Profiles (see
+# aukr.omal.const.PROFILES) are compiled once, at import, into Normalizer
+# objects: aliases, converters and coordinate parsers resolved into flat
+# tuples of functions, so that a header costs a few dict lookups whatever
+# profile it has. Upgrade cards (BJD-TDB, MIDTIME, LST and constant cards of
+# profile) are computed in batch, one astropy computation per site and target
+# rather than one per file (see Obsv.update()).
+import numpy as np
+from astropy import time, coordinates as coord, units as u
+from ..args import args
+from ..log import getLogger
+from ..const import PROFILES, DEFAULT_PROFILE
+
+# Create module's logger
+logger = getLogger(__name__)
+
+
+def sexagesimal(value):
+    '''"+41 16 09", "41:16:09.5" or a number -> degrees (or hours), sign-aware
+    '''
+    if isinstance(value, (int, float)):
+        return float(value)
+    parts = str(value).replace(':', ' ').split()
+    sign = -1.0 if parts[0].startswith('-') else 1.0
+    (d, m, s) = ([abs(float(parts[0]))] + [float(part) for part in parts[1:3]] + [0.0, 0.0])[:3]
+    return sign * (d + m/60 + s/3600)
+
+def isot(value):
+    '''"2019-09-02 21:00:00.123" -> "2019-09-02T21:00:00"
+    '''
+    return str(value).strip().replace(' ', 'T', 1).split('.')[0]
+
+# Coordinate formats -> degrees
+PARSERS = {
+    'hms': lambda value: 15 * sexagesimal(value),
+    'dms': sexagesimal,
+    'deg': float
+}
+
+# Card converters, each rewrites a value into the form catalog expects
+CONVERTERS = {
+    'isot':    isot,
+    'ms-to-s': lambda value: float(value) / 1000,
+    'upper':   lambda value: str(value).strip().upper(),
+    'strip':   lambda value: str(value).strip()
+}
+
+# Cards computed by upgrade, (keyword, comment)
+UPGRADE_CARDS = [
+    ('BJD-TDB', 'Dynamic Barycentric Julian Day'),
+    ('MIDTIME', 'DATE-OBS of Mid Exposure Time in UT'),
+    ('LST',     'Local Sidereal Time')
+]
+
+
+class Normalizer:
+    '''Compiled profile (see aukr.omal.const.PROFILES)
+    '''
+    __slots__ = ('name', 'required', 'aliases', 'converters', 'coordinates', 'site',
+        'cards', 'locations', 'targets')
+
+    def __init__(self, name, profile):
+        ''':param name: name of profile
+        :param profile: dict, as in aukr.omal.const.PROFILES
+        :raises ValueError: if profile names an unknown converter or format
+        '''
+        self.name       = name
+        self.required   = tuple(profile.get('required', ()))
+        self.aliases    = tuple(profile.get('aliases', {}).items())
+        self.site       = dict(profile.get('site', {}))
+        self.cards      = tuple(profile.get('cards', ()))
+        self.locations  = {}   # (lat, long) cards -> astropy EarthLocation
+        self.targets    = {}   # (ra, dec) cards -> astropy SkyCoord
+        try:
+            self.converters  = tuple((key, CONVERTERS[converter])
+                for (key, converter) in profile.get('converters', {}).items())
+            self.coordinates = {role: (key, PARSERS[format])
+                for (role, (key, format)) in profile.get('coordinates', {}).items()}
+        except KeyError as e:
+            logger.debug(f'Unknown converter/format {e} in profile: {name}')
+            raise ValueError(f'Unknown converter/format {e} in profile: {name}')
+
+    def changes(self, hdr):
+        '''Cards normalized, header itself is left as is
+        :param hdr: astropy.io.fits.Header (or dict of cards) as recorded
+        :returns: dict of keyword -> value to be set
+        '''
+        values = {}
+        for (alias, key) in self.aliases:
+            if (alias in hdr) and (key not in hdr):
+                values[key] = hdr[alias]
+        for (key, convert) in self.converters:
+            if key in values:
+                values[key] = convert(values[key])
+            elif key in hdr:
+                values[key] = convert(hdr[key])
+        return values
+
+    def upgradeInputs(self):
+        ''':returns: cards upgradeCards() reads (site cards given as constants left out)
+        '''
+        return ['JD', 'EXPTIME'] + [key for (role, (key, parse)) in self.coordinates.items()
+            if not ((role in ['lat', 'long']) and (role in self.site))]
+
+    def degrees(self, hdr, role):
+        (key, parse) = self.coordinates[role]
+        if (key not in hdr) and (role in self.site):
+            return float(self.site[role])
+        return parse(hdr[key])
+
+    def location(self, hdr):
+        ''':returns: tuple (cards, astropy.coordinates.EarthLocation of site), cached by cards
+        '''
+        key = tuple(hdr.get(self.coordinates[role][0]) for role in ['lat', 'long'])
+        if key not in self.locations:
+            self.locations[key] = coord.EarthLocation(self.degrees(hdr, 'long'), self.degrees(hdr, 'lat'),
+                self.site.get('alt', 0))
+        return (key, self.locations[key])
+
+    def target(self, hdr):
+        ''':returns: tuple (cards, astropy.coordinates.SkyCoord of target), cached by cards
+        '''
+        key = tuple(hdr.get(self.coordinates[role][0]) for role in ['ra', 'dec'])
+        if key not in self.targets:
+            self.targets[key] = coord.SkyCoord(self.degrees(hdr, 'ra')*u.deg, self.degrees(hdr, 'dec')*u.deg,
+                frame='icrs')
+        return (key, self.targets[key])
+
+    def upgradeCards(self, hdrList):
+        '''Cards upgrade adds (see FitsFile.upgradeScript()), for many headers at
+        once: files sharing site and target are computed as one array.
+        :param hdrList: headers (or dicts of catalog cards), normalized
+        :returns: list parallel to hdrList, of lists of (keyword, value, comment)
+        :raises KeyError: if a header lacks an input card (see upgradeInputs())
+        '''
+        groups = {}
+        for (i, hdr) in enumerate(hdrList):
+            (siteKey, location) = self.location(hdr)
+            (targetKey, target) = self.target(hdr)
+            groups.setdefault((siteKey, targetKey), (location, target, []))[2].append(i)
+
+        results = [None] * len(hdrList)
+        for (location, target, indices) in groups.values():
+            jd = np.array([float(hdrList[i]['JD']) for i in indices])
+            exptime = np.array([float(hdrList[i]['EXPTIME']) for i in indices])
+            # Middle of exposure, JD is its beginning
+            midJD = time.Time(jd, format='jd', scale='utc', location=location) + time.TimeDelta(exptime/2, format='sec')
+            midTime = time.Time(midJD, format='jd', scale='utc').iso
+            lst = time.Time(midTime, scale='utc', location=location).sidereal_time('mean')
+            # Light travel time between barycentre of solar system and earth, towards target
+            bjd = (midJD.tdb + midJD.light_travel_time(target)).value
+            for (n, i) in enumerate(indices):
+                results[i] = [
+                    (UPGRADE_CARDS[0][0], float(bjd[n]),            UPGRADE_CARDS[0][1]),
+                    (UPGRADE_CARDS[1][0], str(midTime[n]),          UPGRADE_CARDS[1][1]),
+                    (UPGRADE_CARDS[2][0], str(lst[n].to_string()),  UPGRADE_CARDS[2][1])
+                ] + list(self.cards)
+        return results
+
+
+def compileProfiles(profiles):
+    ''':param profiles: dict of name -> profile (see aukr.omal.const.PROFILES)
+    :returns: tuple (dict of name -> Normalizer, list of (card values matched, Normalizer), match keys)
+    '''
+    normalizers = {name: Normalizer(name, profile) for (name, profile) in profiles.items()}
+    matchKeys = sorted({key for profile in profiles.values() for key in profile.get('match', {})})
+    matches = [(tuple(set(map(str, profile['match'].get(key, []))) or None for key in matchKeys), normalizers[name])
+        for (name, profile) in profiles.items() if profile.get('match')]
+    return (normalizers, matches, matchKeys)
+
+(normalizers, matches, matchKeys) = compileProfiles(PROFILES)
+selected = {} # values of matchKeys -> Normalizer, profiles already picked
+
+
+def normalizerFor(hdr):
+    '''Normalizer of profile a header matches ("--profile" if given), picked
+    once per distinct values of matched cards (e.g. TELESCOP, INSTRUME)
+    :param hdr: astropy.io.fits.Header, or dict of cards
+    :returns: Normalizer
+    '''
+    if args.profile:
+        return normalizers[args.profile]
+    key = tuple(str(hdr.get(matchKey)) for matchKey in matchKeys)
+    if key not in selected:
+        selected[key] = normalizers[DEFAULT_PROFILE]
+        for (values, normalizer) in matches:
+            if all((allowed is None) or (value in allowed) for (allowed, value) in zip(values, key)):
+                selected[key] = normalizer
+                break
+        logger.debug(f'Profile "{selected[key].name}" for {dict(zip(matchKeys, key))}')
+    return selected[key]
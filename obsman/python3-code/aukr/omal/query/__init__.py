@@ -0,0 +1 @@
+from .query import *
@@ -0,0 +1,198 @@
+# Catalog rows (obsv or fits table) written as NDJSON (one JSON object per
+# line) or CSV, row by row as they are read from a cursor; nothing is held in
+# memory, output starts with first row. Schema is stable: "REF" first, then
+# columns in table order (generated columns of promoted cards included),
+# typed as declared ("NULL" text of catalog becomes null). EXTRA is written
+# as an object in NDJSON, as JSON text in CSV.
+# serve() answers searches of Node-RED flows (obsv search, fits of an obsv)
+# from a long-lived process, through cached queries of ObservatoryDB: repeated
+# searches (paging, refreshing) are served from memory.
+import csv, json
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+from .. import calc
+from ..log import getLogger
+from ..sqlitedb import archiveDB
+from ..columnar import schemaOf, typed
+from ..const import TABLE_OBSV, TABLE_FITS, SQL_CHUNK
+
+# Create module's logger
+logger = getLogger(__name__)
+
+QUERY_TABLES  = [TABLE_OBSV, TABLE_FITS]
+QUERY_FORMATS = ['ndjson', 'csv']
+
+
+def parseWhere(items):
+    '''"KEY=VALUE" conditions; numbers are compared as numbers (cards of
+    numeric columns, and in EXTRA, are not text)
+    :param items: list of "KEY=VALUE" strings
+    :returns: list of (key, value)
+    :raises ValueError: if an item has no "="
+    '''
+    conditions = []
+    for item in items:
+        (key, sep, value) = item.partition('=')
+        if not sep or not key:
+            raise ValueError(f'Give conditions as KEY=VALUE: {item}')
+        for number in [int, float]:
+            try:
+                value = number(value)
+                break
+            except ValueError:
+                pass
+        conditions.append((key, value))
+    return conditions
+
+
+def iterRows(table, hashList=None, where=()):
+    '''Rows of table, ordered by hash, typed as declared
+    :param table: TABLE_OBSV or TABLE_FITS
+    :param hashList: hashes of Obsvs (None for all), rows of fits table are
+        those of files of these Obsvs
+    :param where: list of (key, value), cards (any of fits table, see
+        ObservatoryDB.cardExpr()) or columns (obsv table) equal to values
+    :returns: tuple (list of column names, generator of rows as lists)
+    :raises ValueError: if table is unknown, or a key is illegal
+    '''
+    if table not in QUERY_TABLES:
+        logger.debug(f'Use one of {QUERY_TABLES}, table: {table}')
+        raise ValueError(f'Use one of {QUERY_TABLES}')
+    schema = schemaOf(table)
+    names = [name for (name, declType, notNull) in schema]
+    if table == TABLE_FITS:
+        conditions = [archiveDB.cardExpr(key) for (key, value) in where]
+    else:
+        unknown = [key for (key, value) in where if key not in names]
+        if unknown:
+            raise ValueError(f'Not a column of {table}: {unknown}')
+        conditions = [f'"{key}"' for (key, value) in where]
+    conditions = [f'{expr} = ?' for expr in conditions]
+    params = [value for (key, value) in where]
+    keyColumn = 'HASH' if table == TABLE_OBSV else 'OBSV-HASH'
+    # one query for all rows, or one per SQL_CHUNK Obsvs (in order of hash)
+    chunks = [None] if hashList is None else \
+        [sorted(hashList)[i:i+SQL_CHUNK] for i in range(0, len(hashList), SQL_CHUNK)]
+
+    def rows():
+        for chunk in chunks:
+            clauses = conditions if chunk is None else \
+                conditions + [f'"{keyColumn}" IN ({",".join("?"*len(chunk))})']
+            cursor = archiveDB.conn.execute(
+                f'SELECT * FROM {table}{" WHERE " if clauses else ""}{" AND ".join(clauses)} ORDER BY "HASH";',
+                params + ([] if chunk is None else [int(hash) for hash in chunk])
+            )
+            for row in cursor:
+                yield [calc.ref(row[0])] + [typed(value, declType) for ((name, declType, notNull), value) in zip(schema, row)]
+
+    return (['REF'] + names, rows())
+
+
+def streamQuery(textFile, table, hashList=None, where=(), queryFormat='ndjson'):
+    '''Writes rows of iterRows() into textFile, one at a time
+    :param textFile: text mode file-like object (e.g. sys.stdout)
+    :param queryFormat: one of QUERY_FORMATS
+    :returns: number of rows written
+    '''
+    if queryFormat not in QUERY_FORMATS:
+        logger.debug(f'Use one of {QUERY_FORMATS}, queryFormat: {queryFormat}')
+        raise ValueError(f'Use one of {QUERY_FORMATS}')
+    (columns, rows) = iterRows(table, hashList, where)
+    extra = columns.index('EXTRA') if 'EXTRA' in columns else None
+    count = 0
+    if queryFormat == 'csv':
+        writer = csv.writer(textFile)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            if (extra is not None) and (row[extra] is not None):
+                row[extra] = json.loads(row[extra])
+            textFile.write(json.dumps(dict(zip(columns, row))) + '\n')
+            count += 1
+    logger.info(f'{count} rows of {table} written')
+    return count
+
+
+def rowObjects(table, rows):
+    ''':param table: TABLE_OBSV or TABLE_FITS
+    :param rows: rows of "SELECT *" of table
+    :returns: list of dicts, keys as in iterRows() (EXTRA as an object)
+    '''
+    schema = schemaOf(table)
+    columns = ['REF'] + [name for (name, declType, notNull) in schema]
+    objects = []
+    for row in rows:
+        values = [calc.ref(row[0])] + [typed(value, declType) for ((name, declType, notNull), value) in zip(schema, row)]
+        entry = dict(zip(columns, values))
+        if entry.get('EXTRA') is not None:
+            entry['EXTRA'] = json.loads(entry['EXTRA'])
+        objects.append(entry)
+    return objects
+
+
+def searchOfQuery(path, queryString):
+    '''Parses a search request of serve()
+    :param path: '/obsv' (params date-begin, date-end, object, telescope, ref)
+        or '/fits' (params obsv: ref of Obsv, or ref: ref of file)
+    :param queryString: query part of URL
+    :returns: list of row objects (see rowObjects())
+    :raises ValueError: if a ref is illegal
+    :raises KeyError: if path is unknown, or /fits is given neither param
+    '''
+    params = {key: values[-1] for (key, values) in parse_qs(queryString).items()}
+    def hashOf(name):
+        if not params.get(name):
+            return None
+        calc.validDateAndItem(params[name])
+        return calc.hash(params[name])
+    if path == '/obsv':
+        return rowObjects(TABLE_OBSV, archiveDB.searchObsv(params.get('date-begin', ''),
+            params.get('date-end', ''), params.get('object', ''), params.get('telescope', ''), hashOf('ref')))
+    if path == '/fits':
+        if params.get('obsv'):
+            return rowObjects(TABLE_FITS, archiveDB.queryFitsOfObsv(hashOf('obsv')))
+        if params.get('ref'):
+            return rowObjects(TABLE_FITS, archiveDB.queryFits(hashOf('ref'), '*'))
+        raise KeyError('Give "obsv" or "ref"')
+    raise KeyError(path)
+
+
+def serve(port, host='127.0.0.1'):
+    '''Serves searches over HTTP as JSON arrays of row objects, until
+    interrupted: GET /obsv?date-begin=...&date-end=...&object=...&telescope=...&ref=...
+    and GET /fits?obsv=REF (files of an observation) or /fits?ref=REF.
+    Requests are handled one at a time: catalog connection (and its cache)
+    belongs to this thread.
+    :param port: TCP port to listen
+    :param host: address to bind (default localhost only)
+    '''
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            try:
+                body = json.dumps(searchOfQuery(url.path, url.query)).encode('utf-8')
+            except ValueError as e:
+                self.send_error(400, explain=str(e))
+                return
+            except KeyError as e:
+                self.send_error(404, explain=str(e))
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = HTTPServer((host, port), Handler)
+    logger.info(f'Serving searches: http://{host}:{port}/obsv and /fits')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
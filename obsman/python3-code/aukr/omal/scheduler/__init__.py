@@ -0,0 +1 @@
+from .scheduler import *
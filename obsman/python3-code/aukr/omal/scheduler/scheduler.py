@@ -0,0 +1,188 @@
+# Concurrent import of several observations. Worker processes do the heavy
+# part (copy, parse, upgrade/flush headers, move into archdir); main process
+# is the single writer of archive database: it allocates slots, inserts rows
+# and keeps the journal (aukr.omal.journal), so no two writers race on slots.
+# Each observation goes through steps, one task on a worker at a time:
+#   prepare (worker) -> allocate (main) -> update (worker) -> insert (main) -> move (worker)
+# Back-pressure: at most maxPending observations are in progress at once,
+# the rest wait unparsed (memory is bound by maxPending, not upload size).
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from .. import log, filesys, journal, calc
+from ..args import args
+from ..obsv import Obsv
+from ..metrics import metrics
+from ..sqlitedb import archiveDB
+
+# Create module's logger
+logger = log.getLogger(__name__)
+
+
+def initWorker(config):
+    '''Pool initializer: worker gets configuration of parent, a logging path
+    and database connection (read only use) of its own; statistics inherited
+    from parent are dropped.
+    :param config: argparse.Namespace, args.current() of parent
+    '''
+    log.configureWorker(config)
+    archiveDB.reconnect()
+    metrics.drain()
+
+
+def prepareTask(path, copy):
+    '''Worker task: copies observation into archdir/tmp (if copy) and parses it
+    :param path: path of observation directory
+    :param copy: True to copy into archdir/tmp first
+    :returns: tuple (Obsv or None, True if parsed, drained metrics)
+    '''
+    if copy:
+        path = filesys.copyToTmp([path])[0]
+    obsv = Obsv(path, mode='update')
+    return (obsv, bool(obsv.fitsTree), metrics.drain())
+
+
+def updateTask(obsv):
+    '''Worker task: updates (upgrades and flushes) headers of an allocated Obsv.
+    Headers are journaled by main process afterwards.
+    :returns: tuple (Obsv, True if updated, drained metrics)
+    '''
+    isUpdated = obsv.update(journaled=False)
+    return (obsv, isUpdated, metrics.drain())
+
+
+def moveTask(obsv):
+    '''Worker task: moves an inserted Obsv into archdir
+    :returns: tuple (Obsv, True if moved, drained metrics)
+    '''
+    try:
+        isMoved = bool(filesys.moveToArchive(obsv))
+    except FileExistsError:
+        logger.warning(f'Probable database reconstruction from original observation (ignore otherwise): {obsv.name}')
+        logger.warning(f'Observation already in archdir, remove before updating: {obsv.name}_{calc.ref(obsv.hash)}')
+        isMoved = False
+    return (obsv, isMoved, metrics.drain())
+
+
+# Worker task of each step (but first)
+TASKS = {'update': updateTask, 'move': moveTask}
+
+
+def advance(step, obsv, isDone, reserved):
+    '''Main process part of steps, run as worker tasks complete.
+    :param step: worker task just completed ('prepare', 'update', 'move')
+    :param obsv: Obsv returned by task
+    :param isDone: True if task succeeded
+    :param reserved: dict of slots allocated so far (see Obsv.allocate())
+    :returns: next step ('update', 'move'), 'imported' once moved into
+        archdir, None if observation failed
+    '''
+    if step == 'prepare':
+        if not isDone:
+            logger.warning(f'Could not parse: {obsv.path}')
+        elif obsv.allocate(reserved):
+            reserved[obsv.hash] = obsv.tlscp
+            return 'update'
+    elif step == 'update':
+        # Recorded even if some failed, they are resumed from there
+        for fitsFile in obsv.getFitsList():
+            if fitsFile.isNew and (fitsFile.hash is not None):
+                journal.record(obsv.path, 'header', fitsFile.hash, fitsFile.path)
+        if not isDone:
+            logger.warning(f'Could not update: {obsv.name}')
+        elif 'rows' in journal.steps(obsv.path):
+            logger.info(f'Rows were inserted before interruption: {obsv.name}')
+            return 'move'
+        elif obsv.insertRows():
+            return 'move'
+    elif (step == 'move') and isDone:
+        obsv.relocate()
+        journal.record(obsv.path, 'move', obsv.hash)
+        journal.finish(obsv.path)
+        logger.warning(f'Moved into {args.archdir}: {obsv.name}')
+        return 'imported'
+    elif step == 'move':
+        # Observation already in archdir (see moveTask), not a partial move:
+        # rows undone and journal closed, so that no later import resumes it
+        archiveDB.deleteObsvByHashes([obsv.hash])
+        journal.finish(obsv.path)
+    return None
+
+
+def abandon(step, obsv, placedPath, reserved):
+    '''Undoes a failed import of a copy in archdir/tmp: rows (if inserted)
+    deleted, journal entries dropped, slot released and copy removed; the
+    original stays in import directory, to be imported again. Imports in
+    place (--no-copy, or interrupted ones) keep journal and slot, they are
+    left for recover.py.
+    :param step: step that failed
+    :param obsv: Obsv of failed import (None if not parsed)
+    :param placedPath: path observation is imported from (copy, or original)
+    :param reserved: dict of slots allocated so far (see Obsv.allocate())
+    '''
+    path = os.path.abspath(obsv.path if obsv is not None else placedPath)
+    if os.path.dirname(path) != os.path.abspath(filesys.tmpDir()):
+        if journal.steps(path):
+            logger.warning(f'Import failed ({step}), left for recover.py: {path}')
+        else:
+            logger.warning(f'Import failed ({step}): {path}')
+        return
+    recorded = journal.steps(path)
+    hash = recorded.get('slot', obsv.hash if obsv is not None else None)
+    if ('rows' in recorded) and (hash is not None):
+        archiveDB.deleteObsvByHashes([hash])
+    journal.finish(path)
+    if hash is not None:
+        reserved.pop(hash, None)
+    if os.path.isdir(path):
+        filesys.removeTree(path)
+    logger.warning(f'Import failed ({step}), copy removed: {path}')
+
+
+def ingest(importPathList, pendingPathList=[], jobs=None, maxPending=None, copy=True):
+    '''Imports observations concurrently, on a process pool.
+    :param importPathList: paths of new observation directories
+    :param pendingPathList: paths of interrupted imports (already in place,
+        not copied), see aukr.omal.journal.pending()
+    :param jobs: number of worker processes (default: number of cpus)
+    :param maxPending: most observations in progress at once (default 2*jobs)
+    :param copy: False to import in place (as with --no-copy)
+    :returns: list of Obsv objects moved into archdir
+    '''
+    log.heading1('ingest', logger)
+    jobs = jobs if jobs else os.cpu_count()
+    maxPending = maxPending if maxPending else 2*jobs
+    waiting = deque([(path, copy) for path in importPathList]
+        + [(path, False) for path in pendingPathList])
+    # Slots of interrupted imports are not to be taken by others
+    reserved = {journal.slotOf(path): None for path in pendingPathList}
+    running = {}    # future -> (step, path imported from, Obsv), one per observation in progress
+    imported = []
+
+    logger.info(f'Importing {len(waiting)} observations (jobs={jobs}, max pending={maxPending})')
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initWorker, initargs=(args.current(),)) as pool:
+        while waiting or running:
+            # Admit new observations while there is room
+            while waiting and (len(running) < maxPending):
+                (path, isCopied) = waiting.popleft()
+                placedPath = f'{filesys.tmpDir()}/{os.path.basename(path)}' if isCopied else path
+                running[pool.submit(prepareTask, path, isCopied)] = ('prepare', placedPath, None)
+
+            (done, notDone) = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                (step, path, obsv) = running.pop(future)
+                try:
+                    (obsv, isDone, drained) = future.result()
+                except Exception:
+                    logger.warning(f'Import failed ({step}): {path}', exc_info=True)
+                    abandon(step, obsv, path, reserved)
+                    continue
+                metrics.merge(drained)
+                nextStep = advance(step, obsv, isDone, reserved)
+                if nextStep in TASKS:
+                    running[pool.submit(TASKS[nextStep], obsv)] = (nextStep, obsv.path, obsv)
+                elif nextStep == 'imported':
+                    imported.append(obsv)
+                else:
+                    abandon(step, obsv, path, reserved)
+    return imported
@@ -1,7 +1,8 @@
-import sqlite3, os
-from ..args import args
+import sqlite3, os, re, sys, json, threading
+from collections import OrderedDict
+from ..args import args, active
 from ..log  import getLogger
-from ..const import TABLE_FITS, TABLE_OBSV, HDR_KEYS
+from ..const import TABLE_FITS, TABLE_OBSV, HDR_KEYS, SQL_CHUNK, QUERY_CACHE_BYTES
 from .. import calc
 
 # Create module's logger
@@ -15,24 +16,135 @@ logger = getLogger(__name__)
 # Inserts row to observation table
 # see obsCreateTable for datatypes
 
+#
+class QueryCache:
+    '''LRU of query results (lists of rows), bounded by their estimated size
+    in memory; least recently used ones are evicted as others are added.
+    '''
+
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.nbytes   = 0
+        self.lock     = threading.Lock()
+        self.items    = OrderedDict()  # key -> (rows, size)
+        self.hits     = 0
+        self.misses   = 0
+
+    @staticmethod
+    def sizeOf(rows):
+        return sys.getsizeof(rows) + sum(sys.getsizeof(row) + sum(map(sys.getsizeof, row)) for row in rows)
+
+    def get(self, key):
+        ''':returns: rows cached for key, None if not cached
+        '''
+        with self.lock:
+            if key not in self.items:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.items.move_to_end(key)
+            return self.items[key][0]
+
+    def put(self, key, rows):
+        '''Caches rows (not if larger than whole cache)
+        '''
+        size = self.sizeOf(rows)
+        with self.lock:
+            if size > self.maxBytes:
+                return
+            if key in self.items:
+                self.nbytes -= self.items.pop(key)[1]
+            self.items[key] = (rows, size)
+            self.nbytes += size
+            while self.nbytes > self.maxBytes:
+                self.nbytes -= self.items.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.nbytes = 0
+
+
 #
 class ObservatoryDB:
     '''class for handling sqlite3 database file
     '''
     conn        = None
     cursor      = None
+    dbfile      = None
     obsvTable   = None
     fitsTable   = None
 
-    def __init__(self, dbfile, obsvTable, fitsTable):
+    def __init__(self, dbfile, obsvTable, fitsTable, anyThread=False):
         ''':param dbfile: path for .db file
         :param obsvTable: tablename for Obsv objects
         :param fitsTable: tablename for FitsFile objects
+        :param anyThread: True to allow use from any thread (one at a time,
+            see aukr.omal.archive)
         '''
-        self.conn       = sqlite3.connect(dbfile)
+        self.conn       = sqlite3.connect(dbfile, check_same_thread=not anyThread)
         self.cursor     = self.conn.cursor()
         self.obsvTable  = obsvTable
         self.fitsTable  = fitsTable
+        self.dbfile     = dbfile
+        self.anyThread  = anyThread
+        self.generation = 0
+        self.cache      = QueryCache(QUERY_CACHE_BYTES)
+        self.version    = None # data_version last read (see cachedQuery())
+        self.schemas    = 0 # entries of schemas created (see ActiveDB)
+
+    def reconnect(self):
+        '''Opens a connection of its own; for forked (worker) processes, which
+        must not use the connection inherited from parent process.
+        '''
+        self.conn       = sqlite3.connect(self.dbfile, check_same_thread=not self.anyThread)
+        self.cursor     = self.conn.cursor()
+        self.version    = None
+        self.invalidate()
+
+    # Results of query*() methods are cached, keyed by normalized query and
+    # catalog generation. Methods writing obsv/fits tables bump generation at
+    # first statement of a transaction (not per row); while a transaction is
+    # open, queries bypass cache. total_changes of connection covers rows
+    # written through conn directly; commits of other processes are seen
+    # through data_version, read on every lookup (one pragma, no table read).
+    def invalidate(self):
+        '''Bumps generation, results cached before are not returned again
+        '''
+        self.generation += 1
+        self.cache.clear()
+
+    def writing(self):
+        '''Called by methods writing obsv/fits tables, before their statements;
+        invalidates once per transaction
+        '''
+        if not self.conn.in_transaction:
+            self.invalidate()
+
+    def rollback(self):
+        '''Rolls back open transaction, results read within it are discarded
+        '''
+        self.conn.rollback()
+        self.invalidate()
+
+    def cachedQuery(self, sql, params=()):
+        ''':param sql: SELECT statement (whitespace is normalized for key)
+        :param params: parameters bound
+        :returns: list of rows, from cache if catalog is unchanged since
+        '''
+        if self.conn.in_transaction:
+            # rows written but not committed yet are not cached
+            return self.conn.execute(sql, params).fetchall()
+        version = self.conn.execute('PRAGMA data_version;').fetchone()[0]
+        if version != self.version:
+            self.version = version
+            self.invalidate()
+        key = (self.generation, self.conn.total_changes, ' '.join(sql.split()), tuple(params))
+        rows = self.cache.get(key)
+        if rows is None:
+            rows = self.conn.execute(sql, params).fetchall()
+            self.cache.put(key, rows)
+        return list(rows)
 
 
 #    def __query(self, string):
@@ -51,10 +163,9 @@ class ObservatoryDB:
         :param upperHash: upper limit of hashes, is forbidden
         :returns: result of the query (list, print for details)
         '''
-        self.cursor.execute(
+        return self.cachedQuery(
             f'SELECT {column} FROM obsv WHERE ({lowerHash}<=HASH and HASH<{upperHash})'
         )
-        return self.cursor.fetchall()
 
     #
     def queryObsv(self, hash, column):
@@ -62,10 +173,24 @@ class ObservatoryDB:
         :param column: column(s) to be fetched
         :returns: True if successful
         '''
-        self.cursor.execute(
+        return self.cachedQuery(
             f'SELECT {column} FROM {self.obsvTable} WHERE HASH = {hash};'
         )
-        return self.cursor.fetchall()
+
+    #
+    def queryObsvPaths(self, hashList):
+        '''Looks PATHs up by primary key (no scan), SQL_CHUNK hashes per query
+        :param hashList: hashes of Obsvs to be queried
+        :returns: list of tuples (HASH, PATH), for those in table only
+        '''
+        rows = []
+        for i in range(0, len(hashList), SQL_CHUNK):
+            chunk = [int(hash) for hash in hashList[i:i+SQL_CHUNK]]
+            rows += self.cachedQuery(
+                f'SELECT "HASH", "PATH" FROM {self.obsvTable} WHERE "HASH" IN ({",".join("?"*len(chunk))});',
+                chunk
+            )
+        return rows
 
     #
     def queryFits(self, hash, column):
@@ -73,17 +198,72 @@ class ObservatoryDB:
         :param column: column(s) to be fetched
         :returns: True if successful
         '''
-        self.cursor.execute(
+        return self.cachedQuery(
             f'SELECT {column} FROM {self.fitsTable} WHERE HASH = {hash};'
         )
-        return self.cursor.fetchall()
 
     #
-    def insertObsv(self, obsv):
+    def searchObsv(self, dateBegin='', dateEnd='', objct='', tlscp='', hash=None):
+        '''Obsv rows matching all criteria given (cached, see cachedQuery())
+        :param dateBegin: DATE (YYYY-MM-DD), or first DATE if dateEnd given
+        :param dateEnd: last DATE of range
+        :param objct: text within OBJECT
+        :param tlscp: text within TELESCOP
+        :param hash: hash of Obsv
+        :returns: list of rows ("SELECT *"), ordered by HASH
+        '''
+        clauses = []
+        params = []
+        if dateBegin:
+            clauses.append('"DATE" BETWEEN ? AND ?' if dateEnd else '"DATE" = ?')
+            params += [dateBegin, dateEnd] if dateEnd else [dateBegin]
+        if objct:
+            clauses.append('"OBJECT" LIKE ?')
+            params.append(f'%{objct}%')
+        if tlscp:
+            clauses.append('"TELESCOP" LIKE ?')
+            params.append(f'%{tlscp}%')
+        if hash is not None:
+            clauses.append('"HASH" = ?')
+            params.append(int(hash))
+        return self.cachedQuery(
+            f'SELECT * FROM {self.obsvTable}{" WHERE " if clauses else ""}{" AND ".join(clauses)} ORDER BY "HASH";',
+            params
+        )
+
+    #
+    def queryFitsOfObsv(self, obsvHash, column='*'):
+        '''Cached counterpart of iterFitsByObsv(), for observations looked at
+        again and again (e.g. paging through search results)
+        :param obsvHash: hash of Obsv whose FitsFiles are queried
+        :param column: column(s) to be fetched
+        :returns: list of rows, ordered by HASH
+        '''
+        return self.cachedQuery(
+            f'SELECT {column} FROM {self.fitsTable} WHERE "OBSV-HASH" = ? ORDER BY HASH;', (int(obsvHash),)
+        )
+
+    #
+    def iterFitsByObsv(self, obsvHash, column='*'):
+        '''Rows are fetched one by one from a cursor of its own, so that large
+        observations are not held in memory (nor cached).
+        :param obsvHash: hash of Obsv whose FitsFiles are queried
+        :param column: column(s) to be fetched
+        :returns: sqlite3.Cursor (iterate for rows, see its description for column names)
+        '''
+        return self.conn.execute(
+            f'SELECT {column} FROM {self.fitsTable} WHERE "OBSV-HASH" = {obsvHash} ORDER BY HASH;'
+        )
+
+    #
+    def insertObsv(self, obsv, commit=True):
         ''':param obsv: Obsv object to be inserted into database
+        :param commit: False to leave transaction open (committed, or rolled
+            back, by caller along with other rows)
         :returns: True if successful
         '''
         try:
+            self.writing()
             self.cursor.execute(
                 f'INSERT INTO {self.obsvTable} VALUES ('
                 f'"{obsv.hash}",'
@@ -93,7 +273,8 @@ class ObservatoryDB:
                 f'"{obsv.path}"'
                 f');'
             )
-            self.conn.commit()
+            if commit:
+                self.conn.commit()
             return True
         except Exception as e:
             logger.warning(f'Could not insert: {e}')
@@ -102,14 +283,19 @@ class ObservatoryDB:
 
 
     # Not for stand-alone use, to  be used when an Obsv is being inserted
-    def insertFits(self, fitsFile):
+    def insertFits(self, fitsFile, commit=True):
         ''':param fitsFile: FitsFile object to be inserted into database
+        :param commit: False to leave transaction open (see insertObsv())
         :returns: True if successful
         '''
         try:
+            self.writing()
             hdrItems = ''
             for j in range(1, len(HDR_KEYS)): # 'SIMPLE' boundary cases
                 hdrItems += (f',"{fitsFile.hdr[HDR_KEYS[j]]}"' if HDR_KEYS[j] in fitsFile.hdr else f',"NULL"')
+            # Other cards as compact JSON (bound, may hold any character)
+            extra = getattr(fitsFile, 'extra', None)
+            extra = None if extra is None else json.dumps(extra, separators=(',', ':'))
 
             self.cursor.execute(
                 f'INSERT INTO {self.fitsTable} VALUES ('
@@ -121,21 +307,73 @@ class ObservatoryDB:
                 f',"{(1 if fitsFile.hdr["SIMPLE"] else 0)}"'
                 # Insert from second element of HDR_KEYS
                 f'{hdrItems}'
-                f');'
+                f',?' # EXTRA
+                f');', (extra,)
             )
-            self.conn.commit()
+            if commit:
+                self.conn.commit()
             return True
         except Exception as e:
             logger.warning(f'Could not insert: {fitsFile.path}')
             logger.warning(e)
             return False
 
+    def relocateObsv(self, obsvHash, obsvPath, filePaths):
+        '''Updates PATH columns of an Obsv and its FitsFiles (e.g. after moving
+        into archive), in one transaction
+        :param obsvHash: hash of Obsv
+        :param obsvPath: new path of observation directory
+        :param filePaths: list of tuples (FitsFile hash, new path)
+        :returns: True if successful
+        '''
+        try:
+            self.writing()
+            self.cursor.execute(
+                f'UPDATE {self.obsvTable} SET "PATH" = ? WHERE "HASH" = ?;', (obsvPath, obsvHash)
+            )
+            self.cursor.executemany(
+                f'UPDATE {self.fitsTable} SET "PATH" = ? WHERE "HASH" = ?;',
+                [(path, hash) for (hash, path) in filePaths]
+            )
+            self.conn.commit()
+            return True
+        except Exception as e:
+            self.rollback()
+            logger.warning(f'{e}')
+            return False
+
+    def moveObsvPaths(self, obsvHash, oldRoot, newRoot):
+        '''Updates PATH columns of an Obsv and its FitsFiles whose directory was
+        moved (e.g. into another layout), in one transaction
+        :param obsvHash: hash of Obsv
+        :param oldRoot: absolute path of observation directory before
+        :param newRoot: absolute path of observation directory after
+        :returns: True if successful
+        '''
+        try:
+            self.writing()
+            self.cursor.execute(
+                f'UPDATE {self.obsvTable} SET "PATH" = ? WHERE "HASH" = ?;', (newRoot, obsvHash)
+            )
+            self.cursor.execute(
+                f'UPDATE {self.fitsTable} SET "PATH" = ? || substr("PATH", ?) '
+                f'WHERE "OBSV-HASH" = ? AND substr("PATH", 1, ?) = ?;',
+                (newRoot, len(oldRoot) + 1, obsvHash, len(oldRoot) + 1, oldRoot + '/')
+            )
+            self.conn.commit()
+            return True
+        except Exception as e:
+            self.rollback()
+            logger.warning(f'{e}')
+            return False
+
     def deleteObsv(self, obsv):
         '''Deletes entries for Obsv and corresponding FitsFiles from their respective tables
         :param obsv: Obsv object to be deleted
         :returns: True if successful
         '''
         try:
+            self.writing()
             self.cursor.execute(
                 f'DELETE FROM {self.obsvTable} WHERE "HASH" = {obsv.hash}'
             )
@@ -153,19 +391,46 @@ class ObservatoryDB:
         :param ref: ref of Obsv to be deleted
         :returns: True if successful
         '''
+        return self.deleteObsvByHashes([calc.hash(ref)])
+
+    def hashesInCatalog(self, hashList):
+        '''Looks hashes up by primary key and index on "OBSV-HASH" (no scan),
+        SQL_CHUNK hashes per query
+        :param hashList: hashes of Obsvs
+        :returns: set of those having an obsv row or fits rows
+        '''
+        found = set()
+        for i in range(0, len(hashList), SQL_CHUNK):
+            chunk = [int(hash) for hash in hashList[i:i+SQL_CHUNK]]
+            marks = ",".join("?"*len(chunk))
+            found.update(row[0] for row in self.conn.execute(
+                f'SELECT "HASH" FROM {self.obsvTable} WHERE "HASH" IN ({marks}) UNION '
+                f'SELECT "OBSV-HASH" FROM {self.fitsTable} WHERE "OBSV-HASH" IN ({marks});',
+                chunk + chunk
+            ))
+        return found
+
+    #
+    def deleteObsvByHashes(self, hashList):
+        '''Deletes entries for Obsvs and corresponding FitsFiles, all in one
+        transaction (fits rows found through index on "OBSV-HASH")
+        :param hashList: hashes of Obsvs to be deleted
+        :returns: True if successful
+        '''
         try:
-            self.cursor.execute(
-                f'DELETE FROM {self.obsvTable} WHERE "HASH" = {calc.hash(ref)}'
+            self.writing()
+            params = [(int(hash),) for hash in hashList]
+            self.cursor.executemany(
+                f'DELETE FROM {self.obsvTable} WHERE "HASH" = ?;', params
             )
-            self.cursor.execute(
-                f'DELETE FROM {self.fitsTable} WHERE "OBSV-HASH" = {calc.hash(ref)}'
+            self.cursor.executemany(
+                f'DELETE FROM {self.fitsTable} WHERE "OBSV-HASH" = ?;', params
             )
             self.conn.commit()
             return True
-        except Exception as err:
-            #logger.warning(f'{e}')
-            exception_type = type(err).__name__
-            print(exception_type)
+        except Exception as e:
+            self.rollback()
+            logger.warning(f'{e}')
             return False
 
     # Creates single-table for observations, with four essential columns.
@@ -260,8 +525,9 @@ class ObservatoryDB:
                 f'"{HDR_KEYS[51]}" TEXT,\n'          #float
                 f'"{HDR_KEYS[52]}" TEXT,\n'          #float
                 f'"{HDR_KEYS[53]}" TEXT,\n'          #float
-                f'"{HDR_KEYS[54]}" TEXT NOT NULL\n'  #str   "AUKR-REF"
+                f'"{HDR_KEYS[54]}" TEXT NOT NULL,\n' #str   "AUKR-REF"
                 # END of HEADER KEYWORDS
+                f'"EXTRA" TEXT\n' # JSON of other cards (see fitsfile.extraCards)
                 f');'
             )
             self.conn.commit()
@@ -270,12 +536,207 @@ class ObservatoryDB:
             logger.warning(f'{e}')
             return False
 
-    
+    # Indexes on columns looked up other than by primary key
+    def createIndexes(self):
+        '''Creates index of fits table on "OBSV-HASH" (FitsFiles of an Obsv,
+        e.g. when deleting it) unless exists
+        :returns: True if successful
+        '''
+        try:
+            self.cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS "{self.fitsTable}_OBSV-HASH" '
+                f'ON {self.fitsTable} ("OBSV-HASH");'
+            )
+            self.conn.commit()
+            return True
+        except Exception as e:
+            logger.warning(f'{e}')
+            return False
+
+
+    # Cards kept in EXTRA column (JSON), promoted ones are looked up through
+    # an expression index, or a generated column of their own; either is
+    # added to table as is, no rebuild
+    def addExtraColumn(self):
+        '''Adds EXTRA column to fits tables created before it existed (rows
+        inserted since have it, see functions.backfillExtra() for the rest)
+        :returns: True if successful
+        '''
+        try:
+            self.writing()
+            if 'EXTRA' not in self.fitsColumns():
+                self.cursor.execute(f'ALTER TABLE {self.fitsTable} ADD COLUMN "EXTRA" TEXT;')
+                self.conn.commit()
+            return True
+        except Exception as e:
+            logger.warning(f'{e}')
+            return False
+
+    def queryFitsWithoutExtra(self):
+        ''':returns: list of (HASH, PATH) of fits rows whose EXTRA is not filled
+        '''
+        return self.conn.execute(
+            f'SELECT "HASH", "PATH" FROM {self.fitsTable} WHERE "EXTRA" IS NULL;'
+        ).fetchall()
+
+    def updateExtra(self, extraList):
+        '''Fills EXTRA of fits rows, in one transaction
+        :param extraList: list of (EXTRA as JSON text, FitsFile hash)
+        :returns: True if successful
+        '''
+        try:
+            self.writing()
+            self.cursor.executemany(
+                f'UPDATE {self.fitsTable} SET "EXTRA" = ? WHERE "HASH" = ?;', extraList
+            )
+            self.conn.commit()
+            return True
+        except Exception as e:
+            self.rollback()
+            logger.warning(f'{e}')
+            return False
+
+    def fitsColumns(self):
+        ''':returns: dict of column name -> hidden (0 for ordinary columns, 2 or 3 for generated ones)
+        '''
+        return {row[1]: row[6] for row in self.conn.execute(f'PRAGMA table_xinfo({self.fitsTable});')}
+
+    def extraExpr(self, key):
+        ''':param key: header keyword kept in EXTRA
+        :returns: SQL expression of its value (as indexed by promoteCard())
+        :raises ValueError: if key is not a plausible FITS keyword
+        '''
+        if not re.fullmatch(r'[A-Za-z0-9_\-\. ]{1,70}', key):
+            logger.debug(f'Illegal keyword: {key}')
+            raise ValueError(f'Illegal keyword: {key}')
+        return f'json_extract("EXTRA", \'$."{key}"\')'
+
+    def cardExpr(self, key):
+        ''':returns: SQL expression of a card, column of its own if it has one
+            (HDR_KEYS, or promoted as a column), value in EXTRA otherwise
+        '''
+        if key in self.fitsColumns():
+            return f'"{key}"'
+        return self.extraExpr(key)
+
+    def promoteCard(self, key, asColumn=False, declType=''):
+        '''Makes lookups by a card kept in EXTRA fast: an index on its value,
+        and optionally a (virtual) generated column named after it
+        :param key: header keyword (not in HDR_KEYS)
+        :param asColumn: True to add a generated column as well
+        :param declType: declared type of generated column ('' keeps JSON types)
+        :returns: True if successful
+        '''
+        try:
+            self.writing()
+            expr = self.extraExpr(key)
+            columns = self.fitsColumns()
+            if (key in columns) and not columns[key]:
+                raise ValueError(f'Card has a column already: {key}')
+            if asColumn and (key not in columns):
+                self.cursor.execute(
+                    f'ALTER TABLE {self.fitsTable} ADD COLUMN "{key}" {declType} '
+                    f'GENERATED ALWAYS AS ({expr}) VIRTUAL;'
+                )
+            indexed = f'"{key}"' if asColumn else expr
+            self.cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS "{self.fitsTable}_EXTRA_{key}" ON {self.fitsTable} ({indexed});'
+            )
+            self.conn.commit()
+            return True
+        except Exception as e:
+            self.rollback()
+            logger.warning(f'{e}')
+            return False
+
+    def demoteCard(self, key):
+        '''Drops index (and generated column) added by promoteCard(), card is
+        still kept in EXTRA
+        :returns: True if successful
+        '''
+        try:
+            self.writing()
+            self.extraExpr(key)
+            self.cursor.execute(f'DROP INDEX IF EXISTS "{self.fitsTable}_EXTRA_{key}";')
+            if self.fitsColumns().get(key):
+                self.cursor.execute(f'ALTER TABLE {self.fitsTable} DROP COLUMN "{key}";')
+            self.conn.commit()
+            return True
+        except Exception as e:
+            self.rollback()
+            logger.warning(f'{e}')
+            return False
+
+    def promotedCards(self):
+        ''':returns: dict of keyword -> 'column' or 'index', cards promoted
+        '''
+        prefix = f'{self.fitsTable}_EXTRA_'
+        columns = self.fitsColumns()
+        return {name[len(prefix):]: ('column' if columns.get(name[len(prefix):]) else 'index')
+            for (name,) in self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? ORDER BY name;",
+                (self.fitsTable,)) if name.startswith(prefix)}
+
+    def queryFitsByCard(self, key, value, column='"HASH"'):
+        ''':param key: header keyword (in HDR_KEYS, or kept in EXTRA)
+        :param value: value of card looked for
+        :param column: column(s) to be fetched
+        :returns: list of rows
+        '''
+        return self.cachedQuery(
+            f'SELECT {column} FROM {self.fitsTable} WHERE {self.cardExpr(key)} = ? ORDER BY "HASH";', (value,)
+        )
+
+
+# Functions creating tables of modules (if missing), each with message logged
+# if it fails; run on every database as it is first used (see ActiveDB)
+schemas = []
+
+def addSchema(create, failure):
+    ''':param create: function creating tables through archiveDB, returns True if successful
+        (registered once, later calls with the same function are ignored)
+    :param failure: message logged if it does not
+    '''
+    if create not in [registered for (registered, message) in schemas]:
+        schemas.append((create, failure))
+
+
+class ActiveDB:
+    '''Stands in for ObservatoryDB of Archive in use (see aukr.omal.archive),
+    or of command line ("-d"), opened on first use; attributes are those of
+    that database. Tables of schemas are created in each database once.
+    '''
+    def __init__(self):
+        object.__setattr__(self, 'default', None)
+
+    def current(self):
+        ''':returns: ObservatoryDB in effect
+        '''
+        archive = active.get()
+        if archive is not None:
+            db = archive.db
+        else:
+            # dbfile differs in worker processes of an Archive (see args.configureWorker())
+            if (self.default is None) or (self.default.dbfile != args.dbfile):
+                object.__setattr__(self, 'default', ObservatoryDB(args.dbfile, TABLE_OBSV, TABLE_FITS))
+            db = self.default
+        if db.schemas < len(schemas):
+            pending = schemas[db.schemas:]
+            db.schemas = len(schemas)
+            for (create, failure) in pending:
+                if not create():
+                    logger.info(failure)
+        return db
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.current(), name, value)
 
 
-# Create database object to connect provided sqlite3.db file
-archiveDB  = ObservatoryDB(args.dbfile, TABLE_OBSV, TABLE_FITS)
-if not archiveDB.createFitsTable():
-    logger.info(f'Table "{TABLE_FITS}" could not be created')
-if not archiveDB.createObsvTable():
-    logger.info(f'Table "{TABLE_OBSV}" could not be created')
+archiveDB = ActiveDB()
+addSchema(lambda: archiveDB.createFitsTable(), f'Table "{TABLE_FITS}" could not be created')
+addSchema(lambda: archiveDB.createObsvTable(), f'Table "{TABLE_OBSV}" could not be created')
+addSchema(lambda: archiveDB.createIndexes(), f'Indexes of "{TABLE_FITS}" could not be created')
+addSchema(lambda: archiveDB.addExtraColumn(), f'Column "EXTRA" of "{TABLE_FITS}" could not be added')
@@ -0,0 +1 @@
+from .summary import *
@@ -0,0 +1,189 @@
+# Summary tables (aggregates for dashboards), kept up to date by SQLite
+# triggers on obsv and fits tables; so within the very transaction rows are
+# inserted/deleted in (insertObsv, insertFits, deleteObsv...), and summaries
+# never disagree with the catalog. Queries below read summaries only, costing
+# as much as rows they return rather than a scan of fits table.
+#   TABLE_SUMMARY_NIGHT  -- frames, exposure per night (of observation) and TELESCOP
+#   TABLE_SUMMARY_TARGET -- frames, exposure per OBJECT and FILTER
+#   TABLE_SUMMARY_MONTH  -- observations per month ('YYYY-MM')
+from ..log import getLogger
+from ..sqlitedb import archiveDB, addSchema
+from ..const import TABLE_OBSV, TABLE_FITS, TABLE_SUMMARY_NIGHT, TABLE_SUMMARY_TARGET,\
+    TABLE_SUMMARY_MONTH, MAX_ITEM_PER_DAY, YEAR_2K
+
+# Create module's logger
+logger = getLogger(__name__)
+
+
+def nightOf(column):
+    '''SQL expression of observation date ('YYYY-MM-DD') from an Obsv hash, as
+    aukr.omal.calc.dateAndItem() does (night, rather than DATE-OBS of a frame)
+    :param column: column (or expression) holding Obsv hash
+    '''
+    days = f'({column} / {MAX_ITEM_PER_DAY})'
+    return (f"printf('%04d-%02d-%02d', {YEAR_2K} + {days} / 372, "
+            f"({days} % 372) / 31 + 1, ({days} % 372) % 31 + 1)")
+
+def exposureOf(column):
+    ''':returns: SQL expression of EXPTIME, 0 if missing ("NULL" text in catalog)
+    '''
+    return f"(CASE WHEN typeof({column}) IN ('integer', 'real') THEN {column} ELSE 0 END)"
+
+# summary -> (source table, source columns it depends on, key columns, key
+# expressions of a source row given its alias, value columns, value expressions)
+SUMMARIES = {
+    TABLE_SUMMARY_NIGHT: (TABLE_FITS, ['OBSV-HASH', 'TELESCOP', 'EXPTIME'], ['DATE', 'TELESCOP'],
+        lambda row: [nightOf(f'{row}."OBSV-HASH"'), f'{row}."TELESCOP"'],
+        ['FRAMES', 'EXPOSURE'], lambda row: ['1', exposureOf(f'{row}."EXPTIME"')]),
+    TABLE_SUMMARY_TARGET: (TABLE_FITS, ['OBJECT', 'FILTER', 'EXPTIME'], ['OBJECT', 'FILTER'],
+        lambda row: [f'{row}."OBJECT"', f'{row}."FILTER"'],
+        ['FRAMES', 'EXPOSURE'], lambda row: ['1', exposureOf(f'{row}."EXPTIME"')]),
+    TABLE_SUMMARY_MONTH: (TABLE_OBSV, ['DATE'], ['MONTH'],
+        lambda row: [f'substr({row}."DATE", 1, 7)'],
+        ['OBSERVATIONS'], lambda row: ['1'])
+}
+
+
+def quoted(columns):
+    return ', '.join(f'"{column}"' for column in columns)
+
+
+def addSql(summary, row, sign):
+    '''Statement adding (sign '+') or subtracting (sign '-') a row into its summary
+    '''
+    (source, columns, keys, keyExprs, values, valueExprs) = SUMMARIES[summary]
+    if sign == '+':
+        return (
+            f'INSERT INTO {summary} ({quoted(keys + values)}) '
+            f'VALUES ({", ".join(keyExprs(row) + valueExprs(row))}) '
+            f'ON CONFLICT ({quoted(keys)}) DO UPDATE SET '
+            + ', '.join(f'"{value}" = "{value}" + excluded."{value}"' for value in values) + ';'
+        )
+    condition = ' AND '.join(f'"{key}" IS {expr}' for (key, expr) in zip(keys, keyExprs(row)))
+    return (
+        f'UPDATE {summary} SET '
+        + ', '.join(f'"{value}" = "{value}" - {expr}' for (value, expr) in zip(values, valueExprs(row)))
+        + f' WHERE {condition};\n'
+        f'DELETE FROM {summary} WHERE {condition} AND "{values[0]}" <= 0;'
+    )
+
+
+def createTables():
+    '''Creates summary tables and their triggers unless exist. Summaries new to
+    a catalog with rows are rebuilt.
+    :returns: True if successful
+    '''
+    try:
+        existing = {row[0] for row in archiveDB.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table';")}
+        for (summary, (source, columns, keys, keyExprs, values, valueExprs)) in SUMMARIES.items():
+            archiveDB.conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {summary} (\n'
+                + ''.join(f'"{key}" TEXT,\n' for key in keys)
+                + ''.join(f'"{value}" {"REAL" if value == "EXPOSURE" else "INTEGER"} NOT NULL,\n' for value in values)
+                + f'PRIMARY KEY ({quoted(keys)})\n'
+                f');'
+            )
+            archiveDB.conn.executescript(
+                f'CREATE TRIGGER IF NOT EXISTS {summary}_insert AFTER INSERT ON {source} BEGIN\n'
+                f'{addSql(summary, "NEW", "+")}\nEND;\n'
+                f'CREATE TRIGGER IF NOT EXISTS {summary}_delete AFTER DELETE ON {source} BEGIN\n'
+                f'{addSql(summary, "OLD", "-")}\nEND;\n'
+                f'CREATE TRIGGER IF NOT EXISTS {summary}_update AFTER UPDATE OF {quoted(columns)} ON {source} BEGIN\n'
+                f'{addSql(summary, "OLD", "-")}\n{addSql(summary, "NEW", "+")}\nEND;\n'
+            )
+        archiveDB.conn.commit()
+        if not set(SUMMARIES) <= existing:
+            rebuild()
+        return True
+    except Exception as e:
+        logger.warning(f'{e}')
+        return False
+
+
+def rebuild():
+    '''Recomputes all summaries from catalog (one transaction), e.g. after
+    rows were changed with triggers dropped
+    :returns: True if successful
+    '''
+    try:
+        for (summary, (source, columns, keys, keyExprs, values, valueExprs)) in SUMMARIES.items():
+            archiveDB.conn.execute(f'DELETE FROM {summary};')
+            archiveDB.conn.execute(
+                f'INSERT INTO {summary} ({quoted(keys + values)}) '
+                f'SELECT {", ".join(keyExprs(source) + [f"sum({expr})" for expr in valueExprs(source)])} '
+                f'FROM {source} GROUP BY {", ".join(str(i+1) for i in range(len(keys)))};'
+            )
+        archiveDB.conn.commit()
+        return True
+    except Exception as e:
+        archiveDB.conn.rollback()
+        logger.warning(f'{e}')
+        return False
+
+
+def query(summary, where='', params=()):
+    ''':param summary: one of SUMMARIES
+    :param where: SQL condition on key columns ('' for all)
+    :param params: parameters bound to where
+    :returns: list of dicts, one per summary row (ordered by keys)
+    '''
+    (source, columns, keys, keyExprs, values, valueExprs) = SUMMARIES[summary]
+    cursor = archiveDB.conn.execute(
+        f'SELECT {quoted(keys + values)} FROM {summary}'
+        + (f' WHERE {where}' if where else '')
+        + f' ORDER BY {quoted(keys)};', params
+    )
+    return [dict(zip(keys + values, row)) for row in cursor]
+
+
+def framesPerNight(startDate='', endDate='', telescope=None):
+    '''Frames and total exposure (s) per night and TELESCOP
+    :param startDate: first night 'YYYY-MM-DD' ('' for no limit)
+    :param endDate: last night 'YYYY-MM-DD' ('' for startDate only, if given)
+    :param telescope: TELESCOP to be restricted to (None for all)
+    :returns: list of dicts (DATE, TELESCOP, FRAMES, EXPOSURE)
+    '''
+    conditions = []
+    params = []
+    if startDate:
+        conditions.append('"DATE" BETWEEN ? AND ?')
+        params += [startDate, endDate or startDate]
+    if telescope is not None:
+        conditions.append('"TELESCOP" = ?')
+        params.append(telescope)
+    return query(TABLE_SUMMARY_NIGHT, ' AND '.join(conditions), params)
+
+
+def exposurePerTarget(objct=None, filter=None):
+    '''Frames and total exposure (s) per OBJECT and FILTER
+    :param objct: OBJECT to be restricted to (None for all)
+    :param filter: FILTER to be restricted to (None for all)
+    :returns: list of dicts (OBJECT, FILTER, FRAMES, EXPOSURE)
+    '''
+    conditions = []
+    params = []
+    for (key, value) in [('OBJECT', objct), ('FILTER', filter)]:
+        if value is not None:
+            conditions.append(f'"{key}" = ?')
+            params.append(value)
+    return query(TABLE_SUMMARY_TARGET, ' AND '.join(conditions), params)
+
+
+def obsvPerMonth(startMonth='', endMonth=''):
+    '''Observations per month
+    :param startMonth: first month 'YYYY-MM' ('' for no limit)
+    :param endMonth: last month 'YYYY-MM' ('' for startMonth only, if given)
+    :returns: list of dicts (MONTH, OBSERVATIONS)
+    '''
+    if startMonth:
+        return query(TABLE_SUMMARY_MONTH, '"MONTH" BETWEEN ? AND ?', (startMonth, endMonth or startMonth))
+    return query(TABLE_SUMMARY_MONTH)
+
+
+def register():
+    '''Registers summary tables (and triggers) with catalog schema, created in
+    each database as it is first used (see aukr.omal.sqlitedb.addSchema());
+    called by programs writing catalog, once
+    '''
+    addSchema(createTables, 'Summary tables could not be created')
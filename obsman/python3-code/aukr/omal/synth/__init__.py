@@ -0,0 +1 @@
+from .synth import *
\ No newline at end of file
@@ -0,0 +1,150 @@
+# Synthetic observations for benchmarks and trials. Headers mimic files
+# recorded at AUKR: every keyword of aukr.omal.const.HDR_KEYS which exists
+# before archiving, and cards read by FitsFile.upgradeScript().
+import os, datetime
+import numpy as np
+import astropy.io.fits as fits
+from ..log import getLogger
+from ..const import BIAS_DIR, DARK_DIR, FLAT_DIR, OTHER_DIR,\
+    MAX_CONTROL_ITEM, MAX_OBJCT_ITEM, MAX_OTHER_ITEM, MAX_ITEM_PER_OBSV
+
+# Create module's logger
+logger = getLogger(__name__)
+
+JD_YEAR_2K = 2451544.5 # Julian Day of 2000-01-01T00:00:00
+
+# IMAGETYP, mean count and exposure time of frames per branch (objctBranch
+# is anything else)
+FRAME_TYPES = {
+    BIAS_DIR: ('Bias Frame', 1000,     0.0),
+    DARK_DIR: ('Dark Frame', 1100,   120.0),
+    FLAT_DIR: ('Flat Field', 20000,    3.0),
+    None:     ('Light Frame', 3000,  120.0)
+}
+
+
+def splitCounts(total):
+    '''Splits number of files in an observation into branches, an eighth for
+    each control branch (BIAS_DIR, DARK_DIR, FLAT_DIR), rest for objctBranch
+    :param total: number of .fit files (at most MAX_ITEM_PER_OBSV - 1 - MAX_OTHER_ITEM)
+    :returns: tuple (nBias, nDark, nFlat, nObjct)
+    '''
+    nControl = min(max(total // 8, 1), MAX_CONTROL_ITEM)
+    nObjct = max(min(total - 3*nControl, MAX_OBJCT_ITEM), 1)
+    return (nControl, nControl, nControl, nObjct)
+
+
+def makeHeader(dateObs, branch, objct, tlscp, shape):
+    '''Header of a freshly recorded (not archived) .fit file.
+    :param dateObs: datetime.datetime at start of exposure
+    :param branch: BIAS_DIR, DARK_DIR, FLAT_DIR, or None for objctBranch
+    :param objct: OBJECT of observation
+    :param tlscp: TELESCOP of observation
+    :param shape: (NAXIS2, NAXIS1) of image
+    :returns: astropy.io.fits.Header
+    '''
+    (imageType, level, exptime) = FRAME_TYPES[branch]
+    jd = JD_YEAR_2K + (dateObs - datetime.datetime(2000, 1, 1)).total_seconds() / 86400
+    hdr = fits.Header()
+    hdr['SIMPLE']   = True
+    hdr['BITPIX']   = 16
+    hdr['NAXIS']    = 2
+    hdr['NAXIS1']   = shape[1]
+    hdr['NAXIS2']   = shape[0]
+    hdr['BSCALE']   = 1.0
+    hdr['BZERO']    = 32768.0
+    hdr['DATE-OBS'] = dateObs.strftime('%Y-%m-%dT%H:%M:%S')
+    hdr['EXPTIME']  = exptime
+    hdr['EXPOSURE'] = exptime
+    hdr['SET-TEMP'] = -20.0
+    hdr['CCD-TEMP'] = -19.8
+    hdr['XPIXSZ']   = 9.0
+    hdr['YPIXSZ']   = 9.0
+    hdr['XBINNING'] = 1
+    hdr['YBINNING'] = 1
+    hdr['XORGSUBF'] = 0
+    hdr['YORGSUBF'] = 0
+    hdr['READOUTM'] = 'Monochrome'
+    hdr['FILTER']   = 'R'
+    hdr['IMAGETYP'] = imageType
+    hdr['FOCUSPOS'] = 1530
+    hdr['FOCUSSSZ'] = 1.0
+    hdr['OBJCTRA']  = '00 42 44.330'
+    hdr['OBJCTDEC'] = '+41 16 07.50'
+    hdr['OBJCTALT'] = '62.1043'
+    hdr['OBJCTAZ']  = '65.9236'
+    hdr['OBJCTHA']  = '-2.4140'
+    hdr['SITELAT']  = '39 50 36'
+    hdr['SITELONG'] = '32 46 48'
+    hdr['JD']       = jd
+    hdr['JD-HELIO'] = jd + 0.0031
+    hdr['AIR-MASS'] = 1.1345
+    hdr['FOCALLEN'] = 3200.0
+    hdr['APTDIA']   = 400.0
+    hdr['APTAREA']  = 125663.7
+    hdr['SWCREATE'] = 'MaxIm DL Version 6.13'
+    hdr['SBSTDVER'] = 'SBFITSEXT Version 1.0'
+    hdr['OBJECT']   = objct if branch is None else branch.lower()
+    hdr['TELESCOP'] = tlscp
+    hdr['INSTRUME'] = 'Apogee USB/Net'
+    hdr['OBSERVER'] = 'synth'
+    hdr['NOTES']    = 'synthetic observation'
+    hdr['FLIPSTAT'] = ''
+    hdr['SWOWNER']  = 'AUKR'
+    return hdr
+
+
+def makeObsv(rootDir, date, counts, shape=(1024, 1024), objct='M31', tlscp='T60', nOther=0):
+    '''Creates a new observation directory (rootDir/YYYY-MM-DD) ready to be imported.
+    :param rootDir: directory to create observation in (e.g. an import directory)
+    :param date: 'YYYY-MM-DD'
+    :param counts: tuple (nBias, nDark, nFlat, nObjct), see splitCounts()
+    :param shape: (NAXIS2, NAXIS1) of images
+    :param objct: OBJECT (also name of objctBranch)
+    :param tlscp: TELESCOP
+    :param nOther: number of (non-fits) files in OTHER_DIR
+    :returns: path of created observation directory
+    '''
+    if ((max(counts[:3]) > MAX_CONTROL_ITEM) or (counts[3] > MAX_OBJCT_ITEM)
+        or (nOther > MAX_OTHER_ITEM) or (sum(counts) + nOther >= MAX_ITEM_PER_OBSV)):
+        logger.debug(f'Item limits exceeded: {counts} {nOther}')
+        raise ValueError('Item limits exceeded')
+
+    obsvPath = f'{rootDir}/{date}'
+    rng = np.random.default_rng()
+    # Frames start at 18:00, stay within the day (DATE-OBS defines FitsFile.date)
+    start = datetime.datetime.strptime(date, '%Y-%m-%d') + datetime.timedelta(hours=18)
+    for (branch, count) in zip([BIAS_DIR, DARK_DIR, FLAT_DIR, None], counts):
+        branchPath = f'{obsvPath}/{branch if branch else objct}'
+        os.makedirs(branchPath)
+        # Noise is generated once per branch, writing dominates anyway
+        level = FRAME_TYPES[branch][1]
+        data = rng.normal(level, np.sqrt(level), shape).clip(0, 65535).astype(np.uint16)
+        for k in range(count):
+            dateObs = start + datetime.timedelta(seconds=(k * 5) % 21600)
+            hdr = makeHeader(dateObs, branch, objct, tlscp, shape)
+            fits.PrimaryHDU(data=data, header=hdr).writeto(f'{branchPath}/{dateObs.strftime("%H%M%S")}_{k:05}.fit')
+
+    if nOther:
+        os.makedirs(f'{obsvPath}/{OTHER_DIR}')
+        for k in range(nOther):
+            with open(f'{obsvPath}/{OTHER_DIR}/note_{k:04}.txt', 'w') as noteFile:
+                noteFile.write(f'synthetic note {k}\n')
+
+    logger.info(f'Created synthetic Obsv: {obsvPath} {counts}')
+    return obsvPath
+
+
+def makeUpload(rootDir, nights=1, total=16, shape=(1024, 1024), startDate='2019-09-01', tlscp='T60'):
+    '''Creates consecutive nights of synthetic observations (as uploaded).
+    :param rootDir: directory to create observations in
+    :param nights: number of observations (one per day)
+    :param total: number of .fit files per observation, see splitCounts()
+    :param shape: (NAXIS2, NAXIS1) of images
+    :param startDate: date of first observation ('YYYY-MM-DD')
+    :param tlscp: TELESCOP
+    :returns: list of paths of created observation directories
+    '''
+    firstDay = datetime.datetime.strptime(startDate, '%Y-%m-%d')
+    return [makeObsv(rootDir, (firstDay + datetime.timedelta(days=j)).strftime('%Y-%m-%d'),
+        splitCounts(total), shape=shape, tlscp=tlscp) for j in range(nights)]
@@ -0,0 +1 @@
+from .validate import *
\ No newline at end of file
@@ -0,0 +1,148 @@
+# Validate-only (dry-run) inspection of uploads: checks what Obsv/FitsFile
+# would check during import, straight from import directory. Headers are read
+# in parallel; nothing is copied, opened for update or written.
+import os, glob
+from concurrent.futures import ProcessPoolExecutor
+import astropy.io.fits as fits
+from .. import calc
+from ..log import getLogger, configureWorker
+from ..args import args
+from ..fitsfile import imageHDU
+from ..profile import normalizerFor
+from ..const import BIAS_DIR, DARK_DIR, FLAT_DIR, OTHER_DIR, MAX_DAYS_APART_LIMIT,\
+    MAX_CONTROL_ITEM, MAX_OBJCT_ITEM, COMPRESSED_EXT
+
+# Create module's logger
+logger = getLogger(__name__)
+
+
+def checkFits(path):
+    '''Reads header of a .fit file (readonly) and checks it on its own.
+    Module-level, so it can run on a process pool.
+    :param path: path of .fit file
+    :returns: dict (path, date, TELESCOP, OBJECT, errors)
+    '''
+    report = {'path': path, 'date': None, 'TELESCOP': None, 'OBJECT': None, 'errors': []}
+    errors = report['errors']
+    try:
+        with fits.open(path, mode='readonly', memmap=True, lazy_load_hdus=True) as hdul:
+            hdr = imageHDU(hdul).header
+    except Exception as e:
+        errors.append(f'Unreadable FITS: {e}')
+        return report
+
+    # Cards FitsFile requires, and cards FitsFile.upgradeScript() reads, are
+    # those of profile of file; checked as normalized
+    normalizer = normalizerFor(hdr)
+    hdr = hdr.copy()
+    for (key, value) in normalizer.changes(hdr).items():
+        hdr[key] = value
+    for key in normalizer.required:
+        if key not in hdr:
+            errors.append(f'Missing card: {key}')
+    report['TELESCOP'] = hdr.get('TELESCOP')
+    report['OBJECT'] = hdr.get('OBJECT')
+
+    if 'DATE-OBS' in hdr:
+        if calc.isDate(str(hdr['DATE-OBS']), format='%Y-%m-%dT%H:%M:%S'):
+            report['date'] = hdr['DATE-OBS'].split('T')[0]
+        else:
+            errors.append(f'DATE-OBS is misformatted: {hdr["DATE-OBS"]}')
+
+    if 'AUKR-REF' in hdr:
+        errors.append(f'Already archived (AUKR-REF={hdr["AUKR-REF"]})')
+    elif ('BJD-TDB' not in hdr) and ('MIDTIME' not in hdr):
+        # Not upgraded yet, upgradeScript() will need these
+        for key in normalizer.upgradeInputs():
+            if key not in hdr:
+                errors.append(f'Missing card for upgrade: {key}')
+    return report
+
+
+def checkStructure(obsvPath):
+    '''Checks observation folder name and subfolders, as Obsv does.
+    :param obsvPath: path of new observation directory
+    :returns: tuple (list of errors, dict of branch name -> list of .fit paths)
+    '''
+    errors = []
+    name = os.path.basename(obsvPath)
+    if not calc.isDate(name):
+        errors.append(f'Foldername fault (not a date): {name}')
+
+    branchList = sorted(os.path.basename(os.path.dirname(branch)) for branch in glob.glob(f'{obsvPath}/*/'))
+    objctBranches = [branch for branch in branchList if branch not in [BIAS_DIR, DARK_DIR, FLAT_DIR, OTHER_DIR]]
+    for branch in [BIAS_DIR, DARK_DIR, FLAT_DIR]:
+        if branch not in branchList:
+            errors.append(f'Subfolder missing: {branch}')
+    if len(objctBranches) != 1:
+        errors.append(f'Exactly one object subfolder is required, found: {objctBranches}')
+    if (len(branchList) < 4) or (len(branchList) > 5):
+        errors.append(f'Only [{BIAS_DIR}, {DARK_DIR}, {FLAT_DIR}, Object\'s Folder, {OTHER_DIR}(optional)] are allowed: {branchList}')
+
+    branchFiles = {}
+    for branch in branchList:
+        if branch == OTHER_DIR:
+            continue
+        pathList = sorted(glob.glob(f'{obsvPath}/{branch}/*.fit') + glob.glob(f'{obsvPath}/{branch}/*.fit{COMPRESSED_EXT}'))
+        if not pathList:
+            errors.append(f'Has no fits files: {branch}')
+        limit = MAX_OBJCT_ITEM if branch in objctBranches else MAX_CONTROL_ITEM
+        if len(pathList) > limit:
+            errors.append(f'Too many files in {branch}: {len(pathList)} > {limit}')
+        branchFiles[branch] = pathList
+    return (errors, branchFiles)
+
+
+def validateImportDir(importDir, workers=None):
+    '''Validates all new observations (YYYY-MM-DD folders) in importDir.
+    :param importDir: directory of uploaded observations
+    :param workers: size of process pool reading headers (None for cpu count)
+    :returns: dict report, {'valid': bool, 'obsv': [per observation reports]},
+        every observation report lists its files with their errors
+    '''
+    obsvPathList = sorted(path for path in glob.glob(f'{importDir}/*') if os.path.isdir(path))
+    structures = {obsvPath: checkStructure(obsvPath) for obsvPath in obsvPathList}
+
+    # All headers of all observations at once, so the pool stays busy
+    pathList = [path for (errors, branchFiles) in structures.values()
+        for pathList in branchFiles.values() for path in pathList]
+    with ProcessPoolExecutor(max_workers=workers, initializer=configureWorker,
+        initargs=(args.current(),)) as pool:
+        fitsReports = dict(zip(pathList, pool.map(checkFits, pathList, chunksize=32)))
+
+    report = {'importdir': os.path.abspath(importDir), 'valid': True, 'obsv': []}
+    for obsvPath in obsvPathList:
+        (errors, branchFiles) = structures[obsvPath]
+        obsvDate = os.path.basename(obsvPath)
+        telescopes = set()
+        files = []
+        for (branch, pathList) in branchFiles.items():
+            objects = set()
+            for path in pathList:
+                fitsReport = fitsReports[path]
+                telescopes.add(fitsReport['TELESCOP'])
+                objects.add(fitsReport['OBJECT'])
+                if (fitsReport['date'] and calc.isDate(obsvDate)
+                    and not calc.areWithinRange(fitsReport['date'], obsvDate, MAX_DAYS_APART_LIMIT)):
+                    fitsReport['errors'].append(f'DATE-OBS not within {MAX_DAYS_APART_LIMIT} days of {obsvDate}')
+                fitsReport['valid'] = not fitsReport['errors']
+                files.append(fitsReport)
+            if len(objects) > 1:
+                errors.append(f'Mixed OBJECT in {branch}: {sorted(map(str, objects))}')
+        if len(telescopes) > 1:
+            errors.append(f'Mixed TELESCOP: {sorted(map(str, telescopes))}')
+
+        isValid = (not errors) and all(fitsReport['valid'] for fitsReport in files)
+        report['valid'] = report['valid'] and isValid
+        report['obsv'].append({
+            'path':   obsvPath,
+            'valid':  isValid,
+            'errors': errors,
+            'files':  files
+        })
+        logger.info(f'{"Valid" if isValid else "Invalid"}: {obsvPath}')
+
+    if not obsvPathList:
+        report['valid'] = False
+        logger.warning(f'No observations found: {importDir}')
+    return report
@@ -0,0 +1,253 @@
+# Continuous import: import directory is watched, and each new observation
+# (YYYY-MM-DD folder) is imported as soon as it is complete, instead of all
+# at once by a later import.py run. Complete means either a marker file was
+# written into it (e.g. "READY", see --marker), or nothing changed within it
+# for a while (--quiet-seconds). Changes are noticed by inotify (Linux, via
+# ctypes), or by polling directory trees where inotify is not available.
+# Observations imported are remembered (MAX_DONE most recent) along with the
+# state of their trees, so that events not changing them (e.g. rescan after
+# an overflow) do not import them again; one landing again is imported anew,
+# and told duplicate from its headers, before it is copied.
+import os, glob, fnmatch, time, select, struct, ctypes, ctypes.util
+from collections import OrderedDict
+from .. import log, functions
+
+# Create module's logger
+logger = log.getLogger(__name__)
+
+# inotify event masks (see inotify(7))
+IN_MODIFY      = 0x00000002
+IN_ATTRIB      = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM  = 0x00000040
+IN_MOVED_TO    = 0x00000080
+IN_CREATE      = 0x00000100
+IN_DELETE      = 0x00000200
+IN_Q_OVERFLOW  = 0x00004000
+IN_IGNORED     = 0x00008000
+IN_ISDIR       = 0x40000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE)
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len (name follows)
+# Imported observations remembered (least recently imported forgotten first)
+MAX_DONE = 1000
+
+
+def obsvDirOf(importDir, path):
+    ''':returns: observation directory (first level under importDir) path is in,
+        None if path is not within an observation directory
+    '''
+    relPath = os.path.relpath(path, importDir)
+    if relPath.startswith('..') or relPath == '.':
+        return None
+    obsvDir = os.path.join(importDir, relPath.split(os.sep)[0])
+    return obsvDir if fnmatch.fnmatch(os.path.basename(obsvDir), '*-*-*') else None
+
+
+def treeState(obsvDir):
+    ''':returns: tuple (files, bytes, latest mtime) of observation directory
+    '''
+    (files, nbytes, latest) = (0, 0, os.path.getmtime(obsvDir))
+    for (dirPath, dirNames, fileNames) in os.walk(obsvDir):
+        latest = max(latest, os.path.getmtime(dirPath))
+        for fileName in fileNames:
+            try:
+                stat = os.stat(os.path.join(dirPath, fileName))
+            except FileNotFoundError:
+                continue
+            files += 1
+            nbytes += stat.st_size
+            latest = max(latest, stat.st_mtime)
+    return (files, nbytes, latest)
+
+
+class InotifyWatcher:
+    '''Watches a directory tree with inotify; subdirectories created later are
+    watched as well.
+    '''
+
+    def __init__(self, rootDir):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.addWatch = libc.inotify_add_watch
+        self.addWatch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.rootDir = rootDir
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.dirs = {}  # watch descriptor -> directory
+        self.watchTree(rootDir)
+
+    def watchTree(self, directory):
+        '''Watches directory and all directories within
+        :returns: list of watched directories
+        '''
+        watched = []
+        for (dirPath, dirNames, fileNames) in os.walk(directory):
+            wd = self.addWatch(self.fd, os.fsencode(dirPath), WATCH_MASK)
+            if wd < 0:
+                logger.warning(f'Cannot watch ({os.strerror(ctypes.get_errno())}): {dirPath}')
+                continue
+            self.dirs[wd] = dirPath
+            watched.append(dirPath)
+        return watched
+
+    def poll(self, timeout):
+        '''Waits for changes at most timeout seconds
+        :returns: list of changed paths; [rootDir] if events were lost
+        '''
+        (readable, writable, failed) = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            buffer = os.read(self.fd, 64*1024)
+        except BlockingIOError:
+            return []
+        changed = []
+        offset = 0
+        while offset < len(buffer):
+            (wd, mask, cookie, length) = EVENT_HEADER.unpack_from(buffer, offset)
+            name = buffer[offset + EVENT_HEADER.size : offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                logger.warning('inotify queue overflowed, rescanning')
+                changed += self.watchTree(self.rootDir)
+                continue
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            if wd not in self.dirs:
+                continue
+            path = os.path.join(self.dirs[wd], os.fsdecode(name))
+            # New (or moved in) directory, its contents may have landed already
+            if (mask & IN_ISDIR) and (mask & (IN_CREATE | IN_MOVED_TO)):
+                changed += self.watchTree(path)
+            changed.append(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    '''Fallback for InotifyWatcher: compares (files, bytes, latest mtime) of
+    each observation directory with previous scan, every interval seconds.
+    '''
+
+    def __init__(self, rootDir, interval=5.0):
+        self.rootDir  = rootDir
+        self.interval = interval
+        self.states   = {}  # observation directory -> (files, bytes, latest mtime)
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        changed = []
+        states = {}
+        for obsvDir in sorted(glob.glob(f'{self.rootDir}/*-*-*/')):
+            obsvDir = os.path.dirname(obsvDir)
+            states[obsvDir] = treeState(obsvDir)
+            if states[obsvDir] != self.states.get(obsvDir):
+                changed.append(obsvDir)
+        self.states = states
+        return changed
+
+    def close(self):
+        pass
+
+
+class ImportWatcher:
+    '''Imports observations landing in import directory, one by one as each
+    becomes complete (see top of module).
+    '''
+
+    def __init__(self, importDir, quietSeconds=60.0, marker='', polling=False, pollInterval=5.0):
+        ''':param importDir: directory of new observations
+        :param quietSeconds: observation is complete once unchanged this long
+        :param marker: name of file marking observation complete ('' for none,
+            then quietSeconds decides)
+        :param polling: True to poll even if inotify is available
+        :param pollInterval: seconds between scans when polling
+        '''
+        self.importDir    = os.path.abspath(importDir)
+        self.quietSeconds = quietSeconds
+        self.marker       = marker
+        self.activity     = {}     # observation directory -> time of last change
+        self.done         = OrderedDict() # observation directory imported -> state of tree then
+        self.watcher      = None
+        if not polling:
+            try:
+                self.watcher = InotifyWatcher(self.importDir)
+                logger.info(f'Watching (inotify): {self.importDir}')
+            except (OSError, AttributeError) as e:
+                logger.warning(f'inotify not available ({e}), polling instead')
+        if self.watcher is None:
+            self.watcher = PollingWatcher(self.importDir, pollInterval)
+            logger.info(f'Watching (polling every {pollInterval}s): {self.importDir}')
+        # Observations already there are waited for as well
+        for obsvDir in sorted(glob.glob(f'{self.importDir}/*-*-*/')):
+            self.activity[os.path.dirname(obsvDir)] = time.monotonic()
+
+    def isComplete(self, obsvDir, now):
+        if self.marker and os.path.exists(os.path.join(obsvDir, self.marker)):
+            return True
+        return (not self.marker) and (now - self.activity[obsvDir] >= self.quietSeconds)
+
+    def ingest(self, obsvDir):
+        '''Imports an observation (errors are logged, watching goes on)
+        '''
+        self.activity.pop(obsvDir, None)
+        try:
+            if functions.importObsv(obsvDir):
+                logger.warning(f'Imported as it landed: {os.path.basename(obsvDir)}')
+                if os.path.isdir(obsvDir):
+                    self.done[obsvDir] = treeState(obsvDir)
+                    while len(self.done) > MAX_DONE:
+                        self.done.popitem(last=False)
+            else:
+                logger.warning(f'Could not import: {obsvDir}')
+        except Exception:
+            logger.warning(f'Import failed: {obsvDir}', exc_info=True)
+        functions.cleanup()
+
+    def step(self, timeout):
+        '''Waits for changes (at most timeout seconds), then imports complete
+        observations
+        :returns: list of observation directories imported
+        '''
+        now = time.monotonic()
+        for path in self.watcher.poll(timeout):
+            obsvDir = obsvDirOf(self.importDir, path)
+            if obsvDir is None:
+                continue
+            if obsvDir in self.done:
+                if os.path.isdir(obsvDir) and (treeState(obsvDir) == self.done[obsvDir]):
+                    logger.debug(f'Unchanged since import, ignored: {path}')
+                    continue
+                del self.done[obsvDir]
+            if os.path.isdir(obsvDir):
+                self.activity[obsvDir] = time.monotonic()
+            else:
+                self.activity.pop(obsvDir, None)
+
+        now = time.monotonic()
+        complete = [obsvDir for obsvDir in sorted(self.activity) if self.isComplete(obsvDir, now)]
+        for obsvDir in complete:
+            self.ingest(obsvDir)
+        return complete
+
+    def run(self, duration=None):
+        '''Watches until interrupted (or for duration seconds)
+        '''
+        end = None if duration is None else time.monotonic() + duration
+        try:
+            while (end is None) or (time.monotonic() < end):
+                # wake up when next observation would become quiet
+                now = time.monotonic()
+                waits = [self.quietSeconds - (now - last) for last in self.activity.values()]
+                timeout = max(0.1, min(waits + [self.quietSeconds, 60.0]))
+                if end is not None:
+                    timeout = max(0.0, min(timeout, end - now))
+                self.step(timeout)
+        except KeyboardInterrupt:
+            logger.warning('Stopped watching')
+        finally:
+            self.watcher.close()
@@ -0,0 +1,54 @@
+import glob, json, os, platform, tempfile
+from aukr.omal import log
+from aukr.omal.args import args
+from aukr.omal.bench import bench
+
+## Runs benchmarks chosen with "--bench", results are written as JSON into
+## "--bench-output" file (or onto stdout) for comparing different runs.
+##   python3 benchmark.py --bench compress -i /path/to/observations
+##   python3 benchmark.py --bench ingest -a /tmp/arch -d /tmp/bench.db --synth-nights 2 --synth-files 64
+##   python3 benchmark.py --bench logging
+##   python3 benchmark.py --bench codec
+## Ingest benchmark archives observations, use a scratch archive/database.
+
+logger = log.getLogger(__name__)
+
+results = []
+for name in args.bench:
+    log.heading1(name, logger)
+    if name == 'compress':
+        # Any .fit file within import directory's observations
+        pathList = sorted(glob.glob(f'{args.importdir}/*-*-*/*/*.fit'))
+        if pathList:
+            results += bench.benchCompress(pathList)
+        else:
+            logger.warning(f'No .fit files to benchmark in: {args.importdir}')
+    elif name == 'ingest':
+        # Synthetic observations, unless "--synth-nights 0" (then import directory is used)
+        if args.synthnights:
+            from aukr.omal.synth import synth
+            with tempfile.TemporaryDirectory() as importDir:
+                synth.makeUpload(importDir, args.synthnights, args.synthfiles, (args.synthsize, args.synthsize))
+                results += bench.benchIngest(importDir)
+        else:
+            results += bench.benchIngest(args.importdir)
+    elif name == 'logging':
+        results += bench.benchLogging()
+    elif name == 'codec':
+        results += bench.benchCodec()
+    else:
+        logger.warning(f'Unknown benchmark: {name}')
+
+# Run parameters, so results from different runs/machines can be compared
+output = {
+    'python':  platform.python_version(),
+    'machine': platform.machine(),
+    'cpus':    os.cpu_count(),
+    'args':    {key: value for (key, value) in vars(args.current()).items() if key.startswith(('synth', 'compress', 'workers', 'nocopy'))},
+    'results': results
+}
+if args.benchoutput:
+    with open(args.benchoutput, 'w') as outFile:
+        json.dump(output, outFile, indent=2)
+else:
+    print(json.dumps(output, indent=2))
@@ -0,0 +1,27 @@
+import sys, json
+from aukr.omal.args import args
+from aukr.omal import functions as fcns
+from aukr.omal.sqlitedb import archiveDB
+
+## Header cards not in HDR_KEYS are kept in EXTRA column of fits table (JSON);
+## promoted ones are indexed, or get a generated column of their own, without
+## rebuilding the table. Prints promoted cards as JSON, e.g.
+##   python3 cards.py --backfill
+##   python3 cards.py --promote CCD-MODE ROTANG
+##   python3 cards.py --promote CCD-MODE --as-column
+##   python3 cards.py --demote ROTANG
+
+report = {}
+if args.backfill:
+    report['backfill'] = fcns.backfillExtra(args.workers)
+ok = all([archiveDB.promoteCard(key, args.ascolumn) for key in args.promote]
+    + [archiveDB.demoteCard(key) for key in args.demote])
+report['promoted'] = archiveDB.promotedCards()
+
+if args.output == '-':
+    print(json.dumps(report, indent=2))
+else:
+    with open(args.output, 'w') as outFile:
+        json.dump(report, outFile, indent=2)
+
+sys.exit(0 if ok else 1)
@@ -0,0 +1,18 @@
+import json
+from aukr.omal.args import args
+from aukr.omal.columnar import columnar
+from aukr.omal.log import getLogger
+
+## Exports obsv and fits catalogs into directory "--output" as typed columnar
+## files partitioned by night (OUTPUT/fits/date=YYYY-MM-DD/part.arrow); only
+## nights changed since last export are written unless "--full", e.g.
+##   python3 columnar.py -o /obsman/catalog
+##   python3 columnar.py -o /obsman/catalog --columnar-format parquet --full
+
+logger = getLogger(__name__)
+
+if args.output == '-':
+    logger.warning('Directory to export into is required, use "-o"')
+else:
+    report = columnar.exportColumnar(args.output, args.columnarformat, args.full)
+    print(json.dumps(report, indent=2))
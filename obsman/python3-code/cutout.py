@@ -0,0 +1,33 @@
+import sys
+from aukr.omal.args import args
+from aukr.omal.cutout import cutout
+from aukr.omal.log import getLogger
+
+## Writes a cutout of an archived file into "--output" (stdout by default), or
+## serves cutouts over HTTP on localhost with "--cutout-port", e.g.
+##   python3 cutout.py --cutout D27A0005 --center 512 512 --cutout-size 64 -o star.fit
+##   python3 cutout.py --cutout D27A0005 --sky-center 10.68 41.27 --cutout-format png > star.png
+##   python3 cutout.py --cutout-port 8081
+##     (GET http://127.0.0.1:8081/cutout?ref=D27A0005&x=512&y=512&size=64&format=png)
+
+logger = getLogger(__name__)
+
+if args.cutoutport:
+    cutout.serve(args.cutoutport)
+elif not args.cutoutRef or not (args.center or args.skycenter):
+    logger.warning('Use "--cutout REF" with "--center X Y" or "--sky-center RA DEC", or "--cutout-port"')
+    sys.exit(1)
+else:
+    (x, y) = args.center or (None, None)
+    (ra, dec) = args.skycenter or (None, None)
+    try:
+        result = cutout.makeCutout(args.cutoutRef, x, y, ra, dec, args.cutoutsize[0],
+            args.cutoutsize[-1], args.cutoutformat)
+    except ValueError as e:
+        logger.warning(f'{e}')
+        sys.exit(1)
+    if args.output == '-':
+        sys.stdout.buffer.write(result)
+    else:
+        with open(args.output, 'wb') as outFile:
+            outFile.write(result)
@@ -1,11 +1,27 @@
 import aukr.omal.functions as fcns
+from aukr.omal import calc
 from aukr.omal.args import args
 from aukr.omal.log import getLogger
 
+## Removes observations from archive (database rows in one transaction,
+## directories on background threads), by ref and/or within a date range, e.g.
+##   python3 delete.py --remove D27A0000 D27C0000
+##   python3 delete.py --remove-dates 2019-09-01 2019-11-30
+
 logger = getLogger(__name__)
 
-for ref in args.rmRefs:
-    if (fcns.removeObsvByRef(ref)):
-        logger.debug(f'Removed Obsv: {ref}')
-    else:
-        logger.debug(f'Could not remove: {ref}')
+hashList = []
+for ref in (args.rmRefs or []):
+    try:
+        calc.validDateAndItem(ref)
+        hashList.append(calc.hash(ref))
+    except ValueError as e:
+        logger.warning(f'Could not remove ({e}): {ref}')
+if args.rmDates:
+    hashList += fcns.getHashListByDate(*args.rmDates[:2])
+
+if not hashList:
+    logger.warning('Nothing to remove, use "--remove" or "--remove-dates"')
+else:
+    removed = fcns.removeObsvByHashes(sorted(set(hashList)))
+    logger.info(f'Removed {len(removed)} Obsv: {removed}')
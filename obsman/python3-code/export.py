@@ -0,0 +1,30 @@
+import sys
+from aukr.omal import calc, functions as fcns
+from aukr.omal.args import args
+from aukr.omal.export import export
+from aukr.omal.log import getLogger
+
+## Streams observations as a ZIP/TAR archive into "--output" (stdout by
+## default, logs go to stderr), e.g.
+##   python3 export.py --export D27A0000 --manifest csv > obsv.zip
+##   python3 export.py --export-dates 2019-09-01 2019-09-30 --export-format tar -o sept.tar
+
+logger = getLogger(__name__)
+
+hashList = []
+for ref in args.exportRefs:
+    try:
+        calc.validDateAndItem(ref)
+        hashList.append(calc.hash(ref))
+    except ValueError as e:
+        logger.warning(f'Could not export ({e}): {ref}')
+if args.exportDates:
+    hashList += fcns.getHashListByDate(*args.exportDates[:2])
+
+if not hashList:
+    logger.warning('Nothing to export, use "--export" or "--export-dates"')
+elif args.output == '-':
+    export.streamExport(hashList, sys.stdout.buffer, args.exportformat, args.manifest)
+else:
+    with open(args.output, 'wb') as outFile:
+        export.streamExport(hashList, outFile, args.exportformat, args.manifest)
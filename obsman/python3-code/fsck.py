@@ -0,0 +1,20 @@
+import sys, json
+from aukr.omal.args import args
+from aukr.omal.fsck import fsck
+
+## Checks that catalog, archived directories and AUKR-REF cards of archived
+## files agree; prints a JSON report and exits with 1 if any issue is left.
+## Only files changed since last run (size, mtime) are read, unless "--full";
+## "--checksum" compares content too, "--repair" fixes catalog where safe, e.g.
+##   python3 fsck.py -w 8 --checksum
+##   python3 fsck.py --full --checksum --repair -o fsck.json
+
+report = fsck.checkArchive(args.workers, args.checksum, args.full, args.repair)
+
+if args.output == '-':
+    print(json.dumps(report, indent=2))
+else:
+    with open(args.output, 'w') as outFile:
+        json.dump(report, outFile, indent=2)
+
+sys.exit(0 if report['ok'] else 1)
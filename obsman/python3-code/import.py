@@ -1,4 +1,6 @@
 from aukr.omal import log, functions as fcns
+from aukr.omal.args import args
+from aukr.omal.metrics import metrics
 
 ## Use of logfile is encouraged only when it is preiodically deleted.
 ## Otherwise prefer setting "verboselevel=logging.DEBUG", and "logfile=''"
@@ -14,16 +16,29 @@ logger  = log.getLogger(__name__)
 # For aesthetics/readibility
 log.banner('START', logger)
 
+# Stage timers/counters are collected throughout, serve them if asked for
+if args.metricsport:
+    metrics.serve(args.metricsport)
+
 # Removes files/directories from archive's temporary directory (almost always necessary)
 fcns.cleanup()
 
-# After copying provided observation directories into temporary directory,
-# returns a list of Obsv objects (FitsFile objects in Obsv.fitsTree object)
-tmpObsvList = fcns.getTmpObsvList('update')
-
-# Tries inserting Obsv objects in list above into archive database; if
-# successful, copies them into archive directory
-fcns.tmpToArch(tmpObsvList)
+if args.pipeline:
+    # Files streamed through read/upgrade/write/catalog stages ("--pipeline"),
+    # originals are only read
+    fcns.importPipelined()
+elif args.jobs > 1:
+    # Same as below, several observations at once on worker processes
+    # ("--jobs N"), database is written by this process only
+    fcns.importConcurrently()
+else:
+    # After copying provided observation directories into temporary directory,
+    # returns a list of Obsv objects (FitsFile objects in Obsv.fitsTree object)
+    tmpObsvList = fcns.getTmpObsvList('update')
+
+    # Tries inserting Obsv objects in list above into archive database; if
+    # successful, copies them into archive directory
+    fcns.tmpToArch(tmpObsvList)
 
 # Returns Obsv objects from observations in archive directory (all of them)
 #archObsvList = fcns.getArchObsvList()
@@ -32,5 +47,9 @@ fcns.tmpToArch(tmpObsvList)
 # (Suggested. Unlike top cleanse, not necessary)
 fcns.cleanup()
 
+# Per-stage metrics (files, bytes, failures, latencies) of this run
+if args.metricsfile:
+    metrics.writeFile(args.metricsfile)
+
 # For aesthetics/readibility
 log.heading1('FINISH', logger)
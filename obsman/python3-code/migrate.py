@@ -0,0 +1,14 @@
+from aukr.omal import functions as fcns
+from aukr.omal.args import args
+from aukr.omal.log import getLogger
+
+## Moves archived observations into layout given by "--layout" (flat:
+## archdir/YYYY-MM-DD_REF, sharded: archdir/YYYY/MM/YYYY-MM-DD_REF), updating
+## catalog paths as it goes. Archive can be used meanwhile, and both layouts
+## are read anyway; pass the same "--layout" to other scripts afterwards, e.g.
+##   python3 migrate.py --layout sharded
+
+logger = getLogger(__name__)
+
+moved = fcns.migrateLayout(args.layout)
+logger.warning(f'Moved into {args.layout} layout: {len(moved)} observations')
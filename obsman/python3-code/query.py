@@ -0,0 +1,50 @@
+import sys
+from aukr.omal import calc, functions as fcns
+from aukr.omal.args import args
+from aukr.omal.query import query
+from aukr.omal.log import getLogger
+
+## Streams catalog rows (obsv or fits table) into "--output" (stdout by
+## default, logs go to stderr) as NDJSON, one object per line, or CSV; rows
+## are written as they are read, e.g.
+##   python3 query.py --query obsv --query-dates 2019-09-01 2019-09-30
+##   python3 query.py --query fits --query-refs D27A0000 --query-format csv
+##   python3 query.py --query fits --where "IMAGETYP=Bias Frame" EXPTIME=0
+## or serves searches of Node-RED flows (cached, see aukr.omal.query.serve())
+## over HTTP on localhost with "--query-port", e.g.
+##   python3 query.py --query-port 8082
+##     (GET http://127.0.0.1:8082/obsv?date-begin=2019-09-01&date-end=2019-09-30&object=M31)
+##     (GET http://127.0.0.1:8082/fits?obsv=D27A0000)
+
+logger = getLogger(__name__)
+
+if args.queryport:
+    query.serve(args.queryport)
+    sys.exit(0)
+
+hashList = None
+if args.queryRefs or args.queryDates:
+    hashList = []
+    for ref in args.queryRefs:
+        try:
+            calc.validDateAndItem(ref)
+            hashList.append(calc.hash(ref))
+        except ValueError as e:
+            logger.warning(f'Could not query ({e}): {ref}')
+            sys.exit(1)
+    if args.queryDates:
+        hashList += fcns.getHashListByDate(*args.queryDates[:2])
+
+try:
+    where = query.parseWhere(args.where)
+    if args.output == '-':
+        query.streamQuery(sys.stdout, args.query, hashList, where, args.queryformat)
+    else:
+        with open(args.output, 'w', newline='') as outFile:
+            query.streamQuery(outFile, args.query, hashList, where, args.queryformat)
+except ValueError as e:
+    logger.warning(f'{e}')
+    sys.exit(1)
+except BrokenPipeError:
+    # consumer stopped reading (e.g. "| head")
+    sys.exit(0)
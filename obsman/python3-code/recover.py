@@ -0,0 +1,10 @@
+import json
+from aukr.omal import functions as fcns
+from aukr.omal.args import args
+
+## Resumes imports which were interrupted midway (e.g. import.py killed), or
+## undoes them with "--discard"; prints a JSON report of what was done.
+## (import.py resumes them on its own as well)
+##   python3 recover.py [--discard]
+
+print(json.dumps(fcns.recoverImports(args.discard), indent=2))
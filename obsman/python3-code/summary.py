@@ -0,0 +1,25 @@
+import json
+from aukr.omal.args import args
+from aukr.omal.summary import summary
+
+## Prints a summary of archive as JSON rows (read from summary tables, which
+## are kept up to date along with catalog); "--rebuild" recomputes them from
+## catalog first, e.g.
+##   python3 summary.py --summary night
+##   python3 summary.py --summary target --rebuild -o target.json
+
+summary.register()
+if args.rebuild:
+    summary.rebuild()
+
+rows = {
+    'night':  summary.framesPerNight,
+    'target': summary.exposurePerTarget,
+    'month':  summary.obsvPerMonth
+}[args.summary]()
+
+if args.output == '-':
+    print(json.dumps(rows, indent=2))
+else:
+    with open(args.output, 'w') as outFile:
+        json.dump(rows, outFile, indent=2)
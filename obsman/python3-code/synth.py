@@ -0,0 +1,8 @@
+from aukr.omal.args import args
+from aukr.omal.synth import synth
+
+## Creates synthetic observations (as uploaded, ready to be imported) in
+## import directory, e.g.
+##   python3 synth.py -i /tmp/upload --synth-nights 3 --synth-files 256 --synth-size 2048
+
+synth.makeUpload(args.importdir, args.synthnights, args.synthfiles, (args.synthsize, args.synthsize))
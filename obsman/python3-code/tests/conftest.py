@@ -0,0 +1,30 @@
+# Fixtures of aukr.omal tests, run from obsman/python3-code:
+#   python -m pytest -q tests
+# Each test gets a throwaway archive (tmp_path) of synthetic observations,
+# configured through aukr.omal.archive.Archive (no command line, no /obsman).
+import os, sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aukr.omal import synth
+from aukr.omal.archive import Archive
+
+# Nights imported into the archive of each test
+NIGHTS = ['2019-09-01', '2019-09-02']
+# .fit files per observation (see synth.splitCounts())
+FRAMES = 8
+
+
+@pytest.fixture
+def archive(tmp_path):
+    '''Archive (flat layout) with NIGHTS imported, one observation each
+    '''
+    importDir = f'{tmp_path}/import'
+    synth.makeUpload(importDir, nights=len(NIGHTS), total=FRAMES, shape=(16, 16), startDate=NIGHTS[0])
+    with Archive(archdir=f'{tmp_path}/arch', dbfile=f'{tmp_path}/arch.db',
+        importdir=importDir, layout='flat') as testArchive:
+        testArchive.cleanup()
+        imported = testArchive.tmpToArch(testArchive.getTmpObsvList('update'))
+        testArchive.cleanup()
+        assert len(imported) == len(NIGHTS)
+        yield testArchive
@@ -0,0 +1,57 @@
+# Catalog kept consistent with archdir: query cache, summaries, columnar
+# export and layout migration, on the throwaway archive of conftest.py
+import subprocess, sys
+from aukr.omal import summary, columnar, fsck
+from aukr.omal.const import TABLE_OBSV
+from conftest import NIGHTS, FRAMES
+
+
+def test_cache_sees_commit_of_another_process(archive):
+    assert len(archive.db.searchObsv()) == len(NIGHTS)
+    (hash, date) = archive.db.searchObsv(dateBegin=NIGHTS[0])[0][:2]
+    subprocess.run([sys.executable, '-c',
+        'import sqlite3, sys\n'
+        'conn = sqlite3.connect(sys.argv[1])\n'
+        f'conn.execute(\'DELETE FROM "{TABLE_OBSV}" WHERE "HASH" = ?\', (int(sys.argv[2]),))\n'
+        'conn.commit()\n',
+        archive.config.dbfile, str(hash)], check=True)
+    assert [row[1] for row in archive.db.searchObsv()] == NIGHTS[1:]
+
+
+def test_summaries_follow_delete(archive):
+    assert archive.call(summary.obsvPerMonth) == [{'MONTH': '2019-09', 'OBSERVATIONS': len(NIGHTS)}]
+    hashList = archive.getHashListByDate(NIGHTS[0])
+    assert len(hashList) == 1
+    assert len(archive.removeObsvByHashes(hashList)) == 1
+    assert archive.call(summary.obsvPerMonth) == [{'MONTH': '2019-09', 'OBSERVATIONS': len(NIGHTS) - 1}]
+    assert [(row['DATE'], row['FRAMES']) for row in archive.call(summary.framesPerNight)] \
+        == [(night, FRAMES) for night in NIGHTS[1:]]
+    # Triggers agree with a rebuild from scratch
+    before = archive.call(summary.framesPerNight)
+    assert archive.call(summary.rebuild)
+    assert archive.call(summary.framesPerNight) == before
+
+
+def test_migrate_layout_then_fsck(archive):
+    movedPaths = archive.migrateLayout('sharded')
+    assert len(movedPaths) == len(NIGHTS)
+    assert all('/2019/09/' in path for path in movedPaths)
+    assert sorted(row[4] for row in archive.db.searchObsv()) == sorted(movedPaths)
+    report = archive.call(fsck.checkArchive, workers=1)
+    assert report['ok'], report['issues']
+    # Nothing left to move
+    assert archive.migrateLayout('sharded') == []
+
+
+def test_columnar_reexported_after_relocation(archive, tmp_path):
+    outDir = f'{tmp_path}/columnar'
+    report = archive.call(columnar.exportColumnar, outDir, 'npy')
+    assert report['written'] == NIGHTS
+    assert archive.call(columnar.exportColumnar, outDir, 'npy')['unchanged'] == len(NIGHTS)
+    # Same rows, other PATH: nights are written again
+    movedPaths = archive.migrateLayout('sharded')
+    report = archive.call(columnar.exportColumnar, outDir, 'npy')
+    assert report['written'] == NIGHTS
+    for (night, path) in zip(NIGHTS, sorted(movedPaths)):
+        partition = columnar.readPartition(columnar.partitionPath(outDir, TABLE_OBSV, night, 'npy'))
+        assert list(partition['PATH']) == [path]
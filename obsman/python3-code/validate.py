@@ -0,0 +1,18 @@
+import sys, json
+from aukr.omal.args import args
+from aukr.omal.validate import validate
+
+## Validate-only (dry-run) check of import directory; prints a JSON report
+## (per observation and per file) and exits with 1 if anything is invalid.
+## Nothing is copied or modified, e.g.
+##   python3 validate.py -i /obsman/tmp-files/upload -w 8
+
+report = validate.validateImportDir(args.importdir, args.workers)
+
+if args.output == '-':
+    print(json.dumps(report, indent=2))
+else:
+    with open(args.output, 'w') as outFile:
+        json.dump(report, outFile, indent=2)
+
+sys.exit(0 if report['valid'] else 1)
@@ -0,0 +1,25 @@
+from aukr.omal import log, functions as fcns
+from aukr.omal.args import args
+from aukr.omal.metrics import metrics
+from aukr.omal.watch import watch
+
+## Watches import directory, importing each observation as soon as it is
+## complete (unchanged for "--quiet-seconds", or "--marker" file written into
+## it) rather than waiting for import.py; runs until interrupted (Ctrl+C), e.g.
+##   python3 watch.py -i /obsman/tmp-files/upload --quiet-seconds 120
+##   python3 watch.py -i /obsman/tmp-files/upload --marker READY
+## inotify is used where available, "--poll SECONDS" to poll instead.
+
+logger = log.getLogger(__name__)
+log.banner('WATCH', logger)
+
+if args.metricsport:
+    metrics.serve(args.metricsport)
+
+# Interrupted imports (if any) are resumed first
+fcns.recoverImports()
+fcns.cleanup()
+
+watcher = watch.ImportWatcher(args.importdir, args.quietseconds, args.marker,
+    polling=bool(args.pollinterval), pollInterval=args.pollinterval or 5.0)
+watcher.run()